@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Stand-ins shared by several test modules.
+"""
+
+import threading
+
+from varscan_tool.utils import CommandFailed
+
+
+class FakeVarscan:
+    def __init__(self, fail_somatic=(), fail_process=(), transient=None):
+        self.calls = []
+        self.lock = threading.Lock()
+        self.fail_somatic = fail_somatic
+        self.fail_process = fail_process
+        self.transient = dict(transient or {})
+
+    def _fail_once(self, path):
+        kind = self.transient.pop(path, None)
+        if kind:
+            raise CommandFailed("command failed ({})".format(kind), kind, 1)
+
+    def somatic_outputs(self, mpileup, workdir="."):
+        return "{}.snp.vcf".format(mpileup), "{}.indel.vcf".format(mpileup)
+
+    def run_somatic(self, mpileup, args, jvm=None, timeout=None):
+        with self.lock:
+            self.calls.append(("somatic", mpileup))
+            self._fail_once(mpileup)
+        if mpileup in self.fail_somatic:
+            raise ValueError("Varscan somatic command failed")
+        return self.somatic_outputs(mpileup)
+
+    def run_process(self, input_vcf, args, jvm=None, timeout=None):
+        with self.lock:
+            self.calls.append(("process", input_vcf))
+            self._fail_once(input_vcf)
+        if input_vcf in self.fail_process:
+            raise ValueError("varscan processSomatic command failed")
+
+
+# __END__
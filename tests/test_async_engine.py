@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+
+import asyncio
+import io
+import os
+import tempfile
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from tests.fakes import FakeVarscan
+from varscan_tool import async_engine as MOD
+from varscan_tool import scheduler, utils
+from varscan_tool.pipeline import ChunkGraph
+from varscan_tool.resources import MemoryBudget
+from varscan_tool.scheduler import StageTask, WorkItem
+from varscan_tool.utils import CommandFailed
+from varscan_tool.varscan_somatic_process import SomaticProcess
+
+
+class RecordingDI:
+    """asyncio injection point remembering the processes it starts"""
+
+    def __init__(self):
+        self.processes = []
+        self.asyncio = self
+
+    def __getattr__(self, name):
+        return getattr(asyncio, name)
+
+    async def create_subprocess_exec(self, *args, **kwargs):
+        proc = await asyncio.create_subprocess_exec(*args, **kwargs)
+        self.processes.append(proc)
+        return proc
+
+
+def alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+class ThisTestCase(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.args = SimpleNamespace(
+            java_opts="3G",
+            somatic_jvm_flags="-XX:+UseSerialGC",
+            process_heap_floor="256M",
+            process_heap_ceiling="3G",
+            process_jvm_flags="-XX:+UseSerialGC",
+            process_backend="jvm",
+            timeout=100,
+            workdir=".",
+        )
+        self.work = [
+            WorkItem(idx=1, mpileup="b", cost=2.0),
+            WorkItem(idx=0, mpileup="a", cost=1.0),
+        ]
+
+    def tearDown(self):
+        super().tearDown()
+        self.tmpdir.cleanup()
+
+    def run_graph(self, varscan, workers, fail_fast=False):
+        graph = ChunkGraph(
+            MOD.AsyncStagePool(workers),
+            self.args,
+            fail_fast=fail_fast,
+            _varscan=varscan,
+        )
+        for item in self.work:
+            graph.add(item)
+        return graph.run()
+
+
+class Test_run_command(ThisTestCase):
+    def test_output_log_and_usage(self):
+        log_path = os.path.join(self.tmpdir.name, "cmd.log")
+
+        async def run():
+            with utils.collect_usage() as collected:
+                found = await MOD.run_command(
+                    "sh -c 'echo out; echo err >&2; exit 3'", log_path=log_path
+                )
+            return found, collected
+
+        found, collected = asyncio.run(run())
+
+        self.assertEqual(
+            (found.retcode, found.stdout, found.stderr), (3, "out\n", "err\n")
+        )
+        self.assertEqual(collected, [found.usage])
+        with open(log_path) as fh:
+            header, *lines = fh
+        self.assertTrue(header.startswith("==> "))
+        self.assertEqual(sorted(lines), ["[stderr] err\n", "[stdout] out\n"])
+
+    def test_feeds_stdin(self):
+        data = b"".join(b"line %d\n" % i for i in range(50000))
+
+        found = asyncio.run(MOD.run_command("wc -c", stdin_source=io.BytesIO(data)))
+
+        self.assertEqual(found.stdout.strip(), str(len(data)))
+
+    def test_timeout_kills_command(self):
+        found = asyncio.run(MOD.run_command("sleep 30", timeout=0.1))
+
+        self.assertTrue(found.timed_out)
+        self.assertEqual(utils.classify_failure(found), utils.TIMEOUT)
+
+    def test_cancel_kills_command(self):
+        di = RecordingDI()
+
+        async def run():
+            task = asyncio.ensure_future(MOD.run_command("sleep 30", _di=di))
+            await asyncio.sleep(0.2)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        start = time.monotonic()
+        with self.assertLogs(MOD.logger, level="WARNING"):
+            asyncio.run(run())
+
+        self.assertLess(time.monotonic() - start, 10)
+        self.assertFalse(alive(di.processes[0].pid))
+
+
+class SleepingVarscan(FakeVarscan):
+    """Coroutine stages; somatic of `slow` runs a long command, others fail late"""
+
+    def __init__(self, slow, di, **kwargs):
+        super().__init__(**kwargs)
+        self.slow = slow
+        self.di = di
+
+    async def run_somatic(self, mpileup, args, jvm=None, timeout=None):
+        if mpileup == self.slow:
+            await MOD.run_command("sleep 30", _di=self.di)
+        elif mpileup in self.fail_somatic:
+            await asyncio.sleep(0.2)
+        return FakeVarscan.run_somatic(self, mpileup, args, jvm, timeout)
+
+    async def run_process(self, input_vcf, args, jvm=None, timeout=None):
+        FakeVarscan.run_process(self, input_vcf, args, jvm, timeout)
+
+
+class Test_AsyncStagePool(ThisTestCase):
+    def test_runs_stages_in_priority_order(self):
+        varscan = FakeVarscan()
+
+        found = self.run_graph(varscan, workers=1)
+
+        self.assertEqual(sorted(r.mpileup for r in found), ["a", "b"])
+        self.assertEqual(
+            varscan.calls,
+            [
+                ("somatic", "b"),
+                ("process", "b.snp.vcf"),
+                ("process", "b.indel.vcf"),
+                ("somatic", "a"),
+                ("process", "a.snp.vcf"),
+                ("process", "a.indel.vcf"),
+            ],
+        )
+
+    def test_fail_fast_kills_running_commands(self):
+        di = RecordingDI()
+        varscan = SleepingVarscan("b", di, fail_somatic=("a",))
+
+        start = time.monotonic()
+        with self.assertLogs(level="ERROR"):
+            found = self.run_graph(varscan, workers=2, fail_fast=True)
+
+        self.assertEqual(found, [])
+        self.assertLess(time.monotonic() - start, 10)
+        self.assertFalse(alive(di.processes[0].pid))
+
+    def test_best_effort_finishes_other_chunks(self):
+        varscan = SleepingVarscan(None, None, fail_somatic=("a",))
+
+        with self.assertLogs(level="ERROR"):
+            found = self.run_graph(varscan, workers=2)
+
+        self.assertEqual([r.mpileup for r in found], ["b"])
+
+    def test_deferred_task_not_starved_by_smaller_ones(self):
+        budget = MemoryBudget(10)
+        pool = MOD.AsyncStagePool(3, budget=budget)
+        finished = []
+
+        async def work(seconds):
+            await asyncio.sleep(seconds)
+
+        # Staggered small tasks never all release their memory at once.
+        tasks = [("small_0", 4, 0.01), ("big", 8, 0.01)]
+        tasks += [("small_{}".format(idx), 4, 0.03) for idx in range(1, 8)]
+        for name, memory, seconds in tasks:
+            pool.submit(
+                StageTask(0, name, work, (seconds,), memory),
+                lambda task, future: finished.append(task.stage),
+            )
+        with mock.patch.object(scheduler, "MAX_DEFERRALS", 1):
+            pool.run()
+
+        self.assertLess(finished.index("big"), 4)
+        self.assertEqual(len(finished), len(tasks))
+        self.assertEqual(budget.reserved, 0)
+
+
+class Test_AsyncVarscan(ThisTestCase):
+    def test_process_failure_raises(self):
+        self.args.varscan_jar = "varscan.jar"
+        self.args.min_tumor_freq = 0.1
+        self.args.max_normal_freq = 0.05
+        self.args.vps_p_value = 0.07
+
+        class Failing(SomaticProcess):
+            COMMAND = "sh -c 'echo java.lang.OutOfMemoryError >&2; exit 1' {input_vcf}"
+
+        input_vcf = os.path.join(self.tmpdir.name, "chunk.snp.vcf")
+        with self.assertLogs(level="ERROR"):
+            with self.assertRaises(CommandFailed) as found:
+                asyncio.run(
+                    MOD.AsyncVarscan.run_process(input_vcf, self.args, _process=Failing)
+                )
+        self.assertEqual(found.exception.kind, utils.OOM)
+
+
+# __END__
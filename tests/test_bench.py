@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from varscan_tool.bench import cases, fake_varscan, run, synthetic
+
+
+class ThisTestCase(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        super().tearDown()
+        self.tmpdir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.tmpdir.name, name)
+
+
+class Test_synthetic(ThisTestCase):
+    def test_mpileup_follows_spec(self):
+        spec = synthetic.MpileupSpec(
+            contigs=3, positions=300, depth=20, variant_rate=0.5
+        )
+
+        lines = list(synthetic.mpileup_lines(spec))
+
+        self.assertEqual(len(lines), 300)
+        self.assertEqual(
+            sorted({line.split("\t")[0] for line in lines}), ["chr1", "chr2", "chr3"]
+        )
+        self.assertEqual(lines, list(synthetic.mpileup_lines(spec)))
+        fields = lines[0].rstrip("\n").split("\t")
+        self.assertEqual(len(fields), 9)
+        self.assertEqual(len(fields[5]), int(fields[3]))
+
+
+class Test_fake_varscan(ThisTestCase):
+    def test_count_alleles(self):
+        self.assertEqual(
+            fake_varscan.count_alleles("^I..,A+2ACa$-1g"),
+            (3, {"A": 2, "+AC": 1, "-G": 1}),
+        )
+
+    def test_call_row(self):
+        somatic = "chr1\t10\tA\t4\t....\tIIII\t4\t..CC\tIIII\n"
+        germline = "chr1\t20\tA\t4\t..CC\tIIII\t4\t..CC\tIIII\n"
+        insertion = "chr1\t30\tA\t4\t....\tIIII\t4\t..+1T+1T\tIIII\n"
+
+        is_indel, record = fake_varscan.call_row(somatic, 1)
+        self.assertFalse(is_indel)
+        self.assertIn("SS=2", record)
+        self.assertIn("SS=1", fake_varscan.call_row(germline, 1)[1])
+        is_indel, record = fake_varscan.call_row(insertion, 1)
+        self.assertTrue(is_indel)
+        self.assertEqual(record.split("\t")[3:5], ["A", "AT"])
+        self.assertIsNone(fake_varscan.call_row(somatic, 5))
+
+
+class Test_cases(ThisTestCase):
+    def test_end_to_end_produces_merged_calls(self):
+        cases.end_to_end(2, self.tmpdir.name, threads=2)()
+
+        with open(self.path("multi_varscan2_snp_merged.vcf")) as fh:
+            records = [line for line in fh if not line.startswith("#")]
+        self.assertTrue(records)
+        with open(self.path("multi_varscan2.metrics.json")) as fh:
+            self.assertEqual(len(json.load(fh)["chunks"]), 2)
+
+    def test_run_benchmarks_reports_json(self):
+        found = run.run_benchmarks(["schedule", "merge"], [1, 3], repeat=2)
+
+        json.dumps(found)
+        self.assertEqual(
+            [(r["case"], r["chunks"]) for r in found["results"]],
+            [("schedule", 1), ("schedule", 3), ("merge", 1), ("merge", 3)],
+        )
+        for result in found["results"]:
+            self.assertEqual(len(result["seconds"]), 2)
+            self.assertLessEqual(result["min"], result["median"])
+
+    def test_vcf_cases_report_cost_per_record(self):
+        with mock.patch.object(cases, "VCF_RECORDS", 200):
+            found = run.run_benchmarks(["vcf_records", "vcf_columns"], [1], repeat=1)
+
+        for result in found["results"]:
+            with self.subTest(case=result["case"]):
+                self.assertGreater(result["records"], 150)
+                self.assertGreater(result["bytes_per_million"], 0)
+                self.assertAlmostEqual(
+                    result["seconds_per_record"], result["min"] / result["records"]
+                )
+
+    def test_merge_qc_reports_overhead(self):
+        with mock.patch.object(cases, "VCF_RECORDS", 200):
+            (result,) = run.run_benchmarks(["merge_qc"], [2], repeat=1)["results"]
+
+        self.assertGreater(result["records"], 300)
+        self.assertAlmostEqual(
+            result["overhead"], result["min"] / result["baseline"] - 1
+        )
+        self.assertEqual(result["failed"], result["overhead"] >= run.MAX_OVERHEAD)
+
+    def test_overhead_fails_the_run(self):
+        def slow_case(chunks, workdir, **_):
+            return lambda: {"baseline": 1e-9}
+
+        output = self.path("bench.json")
+        with mock.patch.dict(run.CASES, slow=slow_case):
+            found = run.main(["--cases", "slow", "--chunks", "1", "--output", output])
+
+        self.assertEqual(found, 1)
+        with open(output) as fh:
+            (result,) = json.load(fh)["results"]
+        self.assertGreaterEqual(result["overhead"], run.MAX_OVERHEAD)
+        self.assertTrue(result["failed"])
+
+    def test_startup_reports_fastest_start(self):
+        with mock.patch.object(cases, "STARTUP_COMMANDS", (("--version",),)):
+            (result,) = run.run_benchmarks(["startup"], [1], repeat=1)["results"]
+
+        self.assertEqual(sorted(result["commands"]), ["--version", "python"])
+        self.assertGreater(result["commands"]["--version"], 0)
+
+
+# __END__
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+import gzip
+import io
+import os
+import struct
+import tempfile
+import unittest
+
+from varscan_tool import bgzf as MOD
+
+
+def read_blocks(data):
+    """Yield (compressed offset, uncompressed bytes) for each BGZF block"""
+    offset = 0
+    while offset < len(data):
+        bsize = struct.unpack_from("<H", data, offset + 16)[0] + 1
+        yield offset, gzip.decompress(data[offset : offset + bsize])
+        offset += bsize
+
+
+def read_at(data, virtual_offset, size):
+    """Read `size` uncompressed bytes starting at a virtual offset"""
+    coffset, within = virtual_offset >> 16, virtual_offset & 0xFFFF
+    out = b""
+    for offset, block in read_blocks(data):
+        if offset < coffset:
+            continue
+        out += block[within:]
+        within = 0
+        if len(out) >= size:
+            break
+    return out[:size]
+
+
+class ThisTestCase(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.payload = b"".join(
+            b"chr1\t%d\t.\tA\tC\t.\tPASS\tDP=%d\n" % (i, i % 97) for i in range(50000)
+        )
+
+    def tearDown(self):
+        super().tearDown()
+
+
+class Test_BgzfWriter(ThisTestCase):
+    def write(self, threads):
+        fh = io.BytesIO()
+        writer = MOD.BgzfWriter(fh, threads=threads)
+        for start in range(0, len(self.payload), 1000):
+            writer.write(self.payload[start : start + 1000])
+        writer.close()
+        return writer, fh.getvalue()
+
+    def test_output_is_valid_bgzf(self):
+        _, data = self.write(threads=1)
+
+        self.assertEqual(gzip.decompress(data), self.payload)
+        self.assertTrue(data.endswith(MOD.EOF_BLOCK))
+        blocks = list(read_blocks(data))
+        self.assertGreater(len(blocks), 2)
+        self.assertTrue(all(len(b) <= MOD.BLOCK_SIZE for _, b in blocks))
+
+    def test_parallel_compression_is_identical(self):
+        _, serial = self.write(threads=1)
+        _, parallel = self.write(threads=4)
+
+        self.assertEqual(serial, parallel)
+
+    def test_virtual_offsets_address_uncompressed_data(self):
+        writer, data = self.write(threads=2)
+
+        for offset in (
+            0,
+            1,
+            MOD.BLOCK_SIZE - 1,
+            MOD.BLOCK_SIZE,
+            3 * MOD.BLOCK_SIZE + 7,
+        ):
+            with self.subTest(offset=offset):
+                found = read_at(data, writer.virtual_offset(offset), 20)
+                self.assertEqual(found, self.payload[offset : offset + 20])
+
+    def test_writes_to_path(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "out.gz")
+            with MOD.BgzfWriter(path, threads=2) as writer:
+                writer.write(self.payload.decode())
+            with gzip.open(path, "rb") as fh:
+                self.assertEqual(fh.read(), self.payload)
+
+
+# __END__
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+
+from varscan_tool import cache as MOD
+
+
+class ThisTestCase(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = MOD.ResultCache(os.path.join(self.tmpdir.name, "cache"))
+        self.input = self.write("chunk.mpileup", "chr1\t1\tA\n")
+        self.parameters = {"min_coverage": 8}
+
+    def tearDown(self):
+        super().tearDown()
+        self.tmpdir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.tmpdir.name, name)
+
+    def write(self, name, content):
+        with open(self.path(name), "w") as fh:
+            fh.write(content)
+        return self.path(name)
+
+    def read(self, name):
+        with open(self.path(name)) as fh:
+            return fh.read()
+
+
+class Test_ResultCache(ThisTestCase):
+    def test_key_covers_input_stage_and_parameters(self):
+        key = self.cache.key("somatic", self.input, self.parameters)
+
+        self.assertEqual(self.cache.key("somatic", self.input, self.parameters), key)
+        self.assertNotEqual(self.cache.key("process", self.input, self.parameters), key)
+        self.assertNotEqual(
+            self.cache.key("somatic", self.input, {"min_coverage": 10}), key
+        )
+        self.write("chunk.mpileup", "chr1\t1\tC\n")
+        self.assertNotEqual(self.cache.key("somatic", self.input, self.parameters), key)
+        self.assertIsNone(self.cache.key("somatic", "-", self.parameters))
+
+    def test_store_then_fetch_restores_outputs(self):
+        outputs = [self.write("a.snp.vcf", "snp"), self.write("a.indel.vcf", "indel")]
+        key = self.cache.key("somatic", self.input, self.parameters)
+
+        self.assertFalse(self.cache.fetch(key, outputs))
+        self.cache.store(key, outputs)
+        for output in outputs:
+            os.remove(output)
+        self.assertTrue(self.cache.fetch(key, outputs))
+
+        self.assertEqual(
+            (self.read("a.snp.vcf"), self.read("a.indel.vcf")), ("snp", "indel")
+        )
+        self.assertEqual(self.cache.stats["hits"], 1)
+        self.assertEqual(self.cache.stats["misses"], 1)
+        self.assertEqual(os.listdir(self.cache.tmp), [])
+
+    def test_evicts_least_recently_used(self):
+        self.cache.max_bytes = 12
+        output = self.write("out.vcf", "x" * 6)
+        self.cache.store("aa1", [output])
+        self.cache.store("bb2", [output])
+        os.utime(os.path.join(self.cache._entry("aa1"), MOD.META), (1, 1))
+        os.utime(os.path.join(self.cache._entry("bb2"), MOD.META), (2, 2))
+        self.cache.fetch("aa1", [output])
+
+        self.cache.store("cc3", [output])
+
+        self.assertTrue(self.cache.fetch("aa1", [output]))
+        self.assertFalse(self.cache.fetch("bb2", [output]))
+        self.assertTrue(self.cache.fetch("cc3", [output]))
+        self.assertEqual(self.cache.stats["evictions"], 1)
+
+
+# __END__
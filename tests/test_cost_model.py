@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import tempfile
+import unittest
+
+from varscan_tool import cost_model as MOD
+from varscan_tool.jvm import HeapPolicy
+from varscan_tool.regions import Region
+
+
+def stage(wall, max_rss, input_bytes):
+    return {"wall": wall, "max_rss": max_rss, "input_bytes": input_bytes}
+
+
+def report(*chunks):
+    """Run report of chunks given as (mpileup bytes, somatic wall, somatic rss)"""
+    return {
+        "chunks": {
+            str(idx): {
+                "mpileup": "chunk_{}.mpileup".format(idx),
+                "stages": {
+                    "somatic": stage(wall, rss, size),
+                    "process_snp": stage(wall / 10, rss / 4, size),
+                    "process_indel": stage(wall / 20, rss / 4, size),
+                },
+            }
+            for idx, (size, wall, rss) in enumerate(chunks)
+        }
+    }
+
+
+class ThisTestCase(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "model.json")
+
+    def tearDown(self):
+        super().tearDown()
+        self.tmpdir.cleanup()
+
+    def write(self, name, content):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, "w") as fh:
+            fh.write(content)
+        return path
+
+
+class Test_fit_line(ThisTestCase):
+    def test_fits(self):
+        for xs, ys, expected in (
+            ([1.0, 2.0, 3.0], [12.0, 14.0, 16.0], MOD.Fit(10.0, 2.0)),
+            ([4.0, 4.0], [2.0, 6.0], MOD.Fit(0.0, 1.0)),
+            ([0.0], [5.0], MOD.Fit(5.0, 0.0)),
+            ([1.0, 2.0], [4.0, 2.0], MOD.Fit(3.0, 0.0)),
+            ([10.0, 11.0], [1.0, 3.0], MOD.Fit(0.0, 43.0 / 221.0)),
+        ):
+            with self.subTest(xs=xs, ys=ys):
+                self.assertEqual(MOD.fit_line(xs, ys), expected)
+
+
+class Test_CostModel(ThisTestCase):
+    def test_predicts_from_reports(self):
+        model = MOD.CostModel(self.path)
+
+        added = model.add_report(report((1000, 20.0, 400), (3000, 60.0, 1200)))
+
+        self.assertEqual(added, 6)
+        found = model.predict(2000)
+        self.assertAlmostEqual(found.somatic_wall, 40.0)
+        self.assertAlmostEqual(found.process_wall, 4.0)
+        self.assertAlmostEqual(found.wall, 44.0)
+        self.assertEqual(found.max_rss, 800)
+
+    def test_skips_unsized_and_restored_chunks(self):
+        model = MOD.CostModel(self.path)
+        data = report((1000, 20.0, 400), (None, 60.0, 1200), (3000, 0.1, 0))
+        native = report((2000, 40.0, 800))["chunks"]["0"]
+        native["stages"]["process_snp"] = stage(0.5, 0, 2000)
+        data["chunks"]["3"] = native
+
+        self.assertEqual(model.add_report(data), 5)
+        self.assertEqual(
+            model.samples["somatic"], [[1000, 20.0, 400], [2000, 40.0, 800]]
+        )
+        self.assertEqual(model.samples["process_snp"], [[1000, 2.0, 100]])
+
+    def test_round_trip(self):
+        model = MOD.CostModel(self.path)
+        model.add_report(report((1000, 20.0, 400)))
+        model.save()
+
+        found = MOD.CostModel.load(self.path)
+
+        self.assertEqual(found.samples, model.samples)
+        self.assertEqual(found.predict(500), model.predict(500))
+
+    def test_unfitted_model(self):
+        for content in (None, "not json", json.dumps({"version": 0})):
+            with self.subTest(content=content):
+                if content is not None:
+                    self.write("model.json", content)
+                found = MOD.CostModel.load(self.path)
+                self.assertFalse(found.fitted)
+                with self.assertRaises(ValueError):
+                    found.predict(100)
+
+    def test_chunk_seconds(self):
+        model = MOD.CostModel(self.path)
+        model.add_report(report((10, 1.0, 1), (30, 3.0, 1)))
+        path = self.write("chunk.mpileup", "x" * 20)
+
+        self.assertAlmostEqual(model.chunk_seconds(path), 2.2)
+        self.assertEqual(model.chunk_seconds("missing.mpileup"), 0.0)
+
+
+class Test_profiles(ThisTestCase):
+    def test_profile_inputs_and_chunks(self):
+        lines = ["chr1\t{}\tA\n".format(pos) for pos in (1, 5, 9)]
+        lines += ["chr2\t{}\tA\n".format(pos) for pos in (2, 4)]
+        path = self.write("pair.mpileup", "".join(lines))
+        first, second = len(lines[0] + lines[1]), len("".join(lines[2:]))
+        chunks = [
+            [Region("chr1", 1, 5)],
+            [Region("chr1", 6, 10), Region("chr2", 1, 10)],
+        ]
+
+        self.assertEqual(
+            MOD.profile_inputs([path]),
+            [MOD.InputProfile(path, first + second, 5, 2, first + second)],
+        )
+        self.assertEqual(
+            MOD.profile_chunks([path], chunks),
+            [
+                MOD.InputProfile("chunk_0000", first, 2, 1, first),
+                MOD.InputProfile("chunk_0001", second, 3, 2, second),
+            ],
+        )
+        with self.assertRaises(ValueError):
+            MOD.profile_inputs(["-"])
+
+
+class Test_plan(ThisTestCase):
+    def setUp(self):
+        super().setUp()
+        self.policy = HeapPolicy(floor=1 << 30, ceiling=3 << 30, ratio=0.1)
+        self.profiles = [
+            MOD.InputProfile("chunk_{}".format(idx), size, 10, 1, size)
+            for idx, size in enumerate((1000, 3000, 2000))
+        ]
+
+    def test_plan_with_model(self):
+        model = MOD.CostModel(self.path)
+        model.add_report(report((1000, 10.0, 1 << 30), (3000, 30.0, 1 << 30)))
+
+        found = MOD.plan(self.profiles, model, self.policy, 2, 100 << 30)
+
+        self.assertEqual(found.workers, 2)
+        self.assertEqual([c.heap for c in found.chunks], ["1025M"] * 3)
+        self.assertAlmostEqual(found.makespan, 33.0)
+        text = MOD.format_plan(found)
+        self.assertIn("Predicted makespan 33.0s on 2 workers", text)
+        self.assertEqual(len(text.splitlines()), 5)
+
+    def test_compressed_inputs_sized_as_at_runtime(self):
+        model = MOD.CostModel(self.path)
+        model.add_report(report((1000, 10.0, 1 << 30)))
+        profiles = [self.profiles[0]._replace(name="in.mpileup.gz", input_bytes=None)]
+
+        found = MOD.plan(profiles, model, self.policy, 2, 100 << 30)
+
+        self.assertEqual([c.heap for c in found.chunks], ["3G"])
+        self.assertIsNone(found.chunks[0].cost)
+        self.assertIsNone(found.makespan)
+
+    def test_memory_caps_workers(self):
+        found = MOD.plan(self.profiles, None, self.policy, 8, 3 << 30)
+
+        self.assertEqual(found.workers, 2)
+        self.assertIsNone(found.makespan)
+        self.assertIn("No fitted cost model", MOD.format_plan(found))
+
+
+# __END__
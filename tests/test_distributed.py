@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+
+import varscan_tool
+from tests.fakes import FakeVarscan
+from varscan_tool import distributed as MOD
+from varscan_tool import multi_varscan
+from varscan_tool.bench import cases, fake_varscan, synthetic
+from varscan_tool.metrics import StageMetrics
+from varscan_tool.retry import Attempt
+from varscan_tool.utils import OOM
+from varscan_tool.varscan import VarscanReturn
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(varscan_tool.__file__)))
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = time.time()
+
+    def time(self):
+        return self.now
+
+
+class ThisTestCase(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.queue_dir = self.path("queue")
+
+    def tearDown(self):
+        super().tearDown()
+        self.tmpdir.cleanup()
+
+    def path(self, *names):
+        return os.path.join(self.tmpdir.name, *names)
+
+
+class Test_WorkQueue(ThisTestCase):
+    def setUp(self):
+        super().setUp()
+        self.clock = FakeClock()
+        self.queue = MOD.WorkQueue(
+            self.queue_dir, 60.0, _di=SimpleNamespace(time=self.clock)
+        )
+        self.queue.publish(
+            {"lease_seconds": 60.0},
+            [{"idx": 1, "mpileup": "b"}, {"idx": 0, "mpileup": "a"}],
+        )
+
+    def test_claims_each_task_once_in_order(self):
+        first = self.queue.claim("w1")
+        second = self.queue.claim("w2")
+
+        self.assertEqual((first.task["id"], first.task["mpileup"]), ("000000", "b"))
+        self.assertEqual(second.task["id"], "000001")
+        self.assertIsNone(self.queue.claim("w3"))
+
+        self.assertTrue(self.queue.complete(first, {"idx": 1}))
+        self.assertTrue(self.queue.renew(second))
+        self.queue.fail(second, "boom")
+        self.assertIsNone(self.queue.claim("w3"))
+        self.assertEqual(self.queue.results(), {"000000": {"idx": 1}})
+        self.assertEqual(
+            self.queue.failures(), {"000001": {"worker": "w2", "error": "boom"}}
+        )
+
+    def test_expired_lease_is_re_leased(self):
+        dead = self.queue.claim("dead")
+        self.queue.claim("w1")
+
+        self.assertEqual(self.queue.expire(), [])
+        self.clock.now += 61
+        renewed = (self.clock.now, self.clock.now)
+        os.utime(os.path.join(self.queue_dir, "leases", "000001"), renewed)
+        self.assertEqual(self.queue.expire(), ["000000"])
+
+        found = self.queue.claim("w2")
+        self.assertEqual(found.task["id"], "000000")
+        self.assertFalse(self.queue.renew(dead))
+        self.queue.release(dead)
+        self.assertTrue(self.queue.renew(found))
+
+        self.assertTrue(self.queue.complete(found, {"by": "w2"}))
+        self.assertFalse(self.queue.complete(dead, {"by": "dead"}))
+        self.assertEqual(self.queue.results()["000000"], {"by": "w2"})
+
+    def test_publish_needs_an_empty_directory(self):
+        with self.assertRaisesRegex(ValueError, "not empty"):
+            self.queue.publish({}, [])
+
+
+class Test_run_worker(ThisTestCase):
+    def test_chunk_runs_with_the_run_options(self):
+        argv = ["--mpileup", "a", "--ref-dict", "ref.dict", "--java-opts", "2G"]
+        argv += ["--max-attempts", "2", "--retry-backoff", "0"]
+        args = multi_varscan.process_argv(argv + ["--memory-limit", "64G"])
+        queue = MOD.WorkQueue(self.queue_dir)
+        queue.publish(
+            dict(args._asdict(), lease_seconds=60.0),
+            [{"idx": 3, "mpileup": self.path("a")}],
+        )
+        varscan = FakeVarscan(transient={self.path("a"): OOM})
+        clock = SimpleNamespace(time=time.time, sleep=lambda seconds: queue.close())
+        di = SimpleNamespace(time=clock)
+
+        with self.assertLogs("varscan_tool.pipeline", level="WARNING"):
+            count = MOD.run_worker(self.queue_dir, "w1", _varscan=varscan, _di=di)
+
+        self.assertEqual(count, 1)
+        self.assertEqual(varscan.calls[:2], [("somatic", self.path("a"))] * 2)
+        result = queue.results()["000000"]
+        self.assertEqual(result["idx"], 3)
+        somatic = [a for a in result["attempts"] if a[0] == "somatic"]
+        self.assertEqual([(a[2], a[4]) for a in somatic], [("2G", OOM), ("4G", "ok")])
+
+
+class Test_coordinate(ThisTestCase):
+    def test_chunks_in_scratch_dir_rejected(self):
+        args = SimpleNamespace(queue_dir=self.queue_dir, scratch_dir="/dev/shm")
+
+        with self.assertRaisesRegex(ValueError, "--scratch-dir"):
+            MOD.coordinate(args, ["/dev/shm/multi_varscan2.x/chunk_0000.mpileup"])
+
+        self.assertFalse(os.path.exists(self.queue_dir))
+
+    def test_best_effort_returns_finished_results(self):
+        argv = ["--mpileup", "a", "--ref-dict", "ref.dict"]
+        argv += ["--queue-dir", os.path.relpath(self.queue_dir)]
+        args = multi_varscan.process_argv(argv)
+        chunks = [self.path("a"), self.path("b")]
+        done = VarscanReturn(
+            "a.snp.vcf",
+            "a.indel.vcf",
+            chunks[0],
+            0,
+            (Attempt("somatic", 1, "2G", None, "ok"),),
+            (StageMetrics(0, "somatic", 1.5, 1.0, 0.5, 1 << 20, None, None, 7, "2G"),),
+        )
+
+        def finish(seconds):
+            queue = MOD.WorkQueue(self.queue_dir)
+            queue.complete(MOD.Lease({"id": "000000"}, "w1", ""), done._asdict())
+            queue.fail(MOD.Lease({"id": "000001"}, "w2", ""), "boom")
+
+        di = SimpleNamespace(time=SimpleNamespace(time=time.time, sleep=finish))
+        with self.assertLogs(level="ERROR") as logs:
+            found = MOD.coordinate(args, chunks, _di=di)
+
+        self.assertEqual(found, [done])
+        self.assertIn("boom", "\n".join(logs.output))
+        parameters = MOD.WorkQueue(self.queue_dir).parameters()
+        self.assertEqual(parameters["queue_dir"], self.queue_dir)
+
+
+class Test_workers(ThisTestCase):
+    """Worker processes on localhost running the stand-in VarScan"""
+
+    def setUp(self):
+        super().setUp()
+        spec = synthetic.MpileupSpec(positions=400)
+        self.mpileup = self.path("pair.mpileup")
+        self.ref_dict = self.path("ref.dict")
+        synthetic.write_mpileup(self.mpileup, spec)
+        synthetic.write_ref_dict(self.ref_dict, spec.reference())
+        bin_dir = self.path("bin")
+        os.mkdir(bin_dir)
+        fake_varscan.install(bin_dir)
+        self.variables = {
+            "PATH": bin_dir + os.pathsep + os.environ.get("PATH", ""),
+            "PYTHONPATH": PACKAGE_ROOT,
+        }
+
+    def run_multi_varscan(self, workdir, *extra):
+        os.mkdir(self.path(workdir))
+        argv = ["--mpileup", self.mpileup, "--ref-dict", self.ref_dict]
+        argv += ["--scatter-count", "3", "--varscan-jar", "varscan.jar"]
+        args = multi_varscan.process_argv(argv + list(extra))
+        with cases._environment(self.path(workdir), **self.variables):
+            multi_varscan.run(args)
+        with open(self.path(workdir, "multi_varscan2_snp_merged.vcf")) as fh:
+            return fh.read()
+
+    def test_local_workers_match_local_run(self):
+        expected = self.run_multi_varscan("local")
+
+        found = self.run_multi_varscan(
+            "queued", "--queue-dir", self.queue_dir, "--local-workers", "2"
+        )
+
+        self.assertEqual(found, expected)
+        self.assertTrue(os.path.exists(os.path.join(self.queue_dir, "closed")))
+
+    def worker(self, latency):
+        env = dict(os.environ, FAKE_VARSCAN_LATENCY=str(latency), **self.variables)
+        return subprocess.Popen(
+            [sys.executable, "-m", "varscan_tool.distributed"]
+            + ["--queue-dir", self.queue_dir, "--poll", "0.1"],
+            env=env,
+            start_new_session=True,
+            stderr=subprocess.DEVNULL,
+        )
+
+    def write_chunks(self):
+        chunks = []
+        with open(self.mpileup) as fh:
+            lines = fh.readlines()
+        for idx in range(2):
+            chunks.append(self.path("chunk_{}.mpileup".format(idx)))
+            with open(chunks[-1], "w") as fh:
+                fh.writelines(lines[idx::2])
+        args = multi_varscan.process_argv(
+            ["--mpileup", self.mpileup, "--ref-dict", self.ref_dict]
+            + ["--queue-dir", self.queue_dir, "--varscan-jar", "varscan.jar"]
+            + ["--on-failure", "fail-fast"]
+        )._replace(workdir=self.tmpdir.name)
+        return chunks, args
+
+    def wait_for_lease(self):
+        leases = os.path.join(self.queue_dir, "leases")
+        deadline = time.monotonic() + 30
+        while not (os.path.isdir(leases) and os.listdir(leases)):
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.05)
+        return os.path.join(leases, os.listdir(leases)[0])
+
+    def test_local_workers_stopped_when_a_task_fails(self):
+        chunks, args = self.write_chunks()
+        errors = []
+
+        def coordinate():
+            try:
+                MOD.coordinate(args, chunks, local_workers=1, poll=0.1)
+            except ValueError as e:
+                errors.append(e)
+
+        coordinator = threading.Thread(target=coordinate)
+        with cases._environment(
+            self.tmpdir.name, FAKE_VARSCAN_LATENCY="60", **self.variables
+        ):
+            coordinator.start()
+            lease = self.wait_for_lease()
+        with open(lease) as fh:
+            pid = int(json.load(fh)["worker"].rsplit(":", 1)[1])
+        other = "000001" if lease.endswith("000000") else "000000"
+        MOD.WorkQueue(self.queue_dir).fail(MOD.Lease({"id": other}, "w", ""), "boom")
+        coordinator.join(30)
+
+        self.assertFalse(coordinator.is_alive())
+        self.assertIn("boom", str(errors[0]))
+        with self.assertRaises(ProcessLookupError):
+            os.kill(pid, 0)
+
+    def test_survives_worker_death(self):
+        chunks, args = self.write_chunks()
+        found = []
+        coordinator = threading.Thread(
+            target=lambda: found.extend(
+                MOD.coordinate(args, chunks, lease_seconds=1.0, poll=0.1)
+            )
+        )
+        coordinator.start()
+
+        doomed = self.worker(latency=60)
+        self.wait_for_lease()
+        os.killpg(doomed.pid, signal.SIGKILL)
+        doomed.wait()
+        survivor = self.worker(latency=0)
+        coordinator.join(60)
+        survivor.wait(30)
+
+        self.assertFalse(coordinator.is_alive())
+        self.assertEqual(sorted(r.idx for r in found), [0, 1])
+        for result in found:
+            self.assertTrue(os.path.exists(result.snp_file))
+        self.assertEqual(len(os.listdir(os.path.join(self.queue_dir, "attempts"))), 3)
+
+
+# __END__
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+
+from varscan_tool import footprint as MOD
+from varscan_tool.varscan_somatic_process import output_paths
+
+
+class ThisTestCase(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        super().tearDown()
+        self.tmpdir.cleanup()
+
+    def write(self, name, size):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, "w") as fh:
+            fh.write("x" * size)
+        return path
+
+
+class Test_Footprint(ThisTestCase):
+    def test_tracks_peak(self):
+        chunk = self.write("chunk.mpileup", 100)
+        footprint = MOD.Footprint(discard=True, owned=[chunk])
+        raw = self.write("chunk.mpileup.snp.vcf", 30)
+
+        footprint.track([raw, "missing.vcf"])
+        footprint.consumed([chunk])
+        footprint.track([self.write("chunk.mpileup.snp.vcf", 50)])
+
+        self.assertFalse(os.path.exists(chunk))
+        self.assertEqual(footprint.current, 50)
+        self.assertEqual(footprint.peak, 130)
+
+    def test_only_removes_tracked_or_owned_files(self):
+        user_input = self.write("user.mpileup", 10)
+        tracked = self.write("tracked.vcf", 10)
+        footprint = MOD.Footprint(discard=True)
+        footprint.track([tracked])
+
+        footprint.consumed([user_input, tracked])
+
+        self.assertTrue(os.path.exists(user_input))
+        self.assertFalse(os.path.exists(tracked))
+
+    def test_process_consumed_keeps_merged_outputs(self):
+        raw = self.write("chunk.snp.vcf", 10)
+        outputs = [self.write(os.path.basename(p), 1) for p in output_paths(raw)]
+        merged = os.path.join(self.tmpdir.name, "chunk.snp.Somatic.hc.vcf")
+
+        footprint = MOD.Footprint()
+        footprint.track([raw] + outputs)
+        footprint.process_consumed(raw)
+        self.assertEqual(footprint.kept(raw), outputs)
+        self.assertTrue(all(os.path.exists(p) for p in [raw] + outputs))
+        self.assertEqual(footprint.current, 16)
+
+        footprint = MOD.Footprint(discard=True)
+        footprint.track([raw] + outputs)
+        footprint.process_consumed(raw)
+        self.assertEqual(footprint.kept(raw), [merged])
+        self.assertEqual([p for p in [raw] + outputs if os.path.exists(p)], [merged])
+        self.assertEqual(footprint.current, 1)
+        self.assertEqual(footprint.peak, 16)
+
+
+# __END__
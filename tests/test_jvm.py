@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+from varscan_tool import jvm as MOD
+
+
+class ThisTestCase(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.policy = MOD.HeapPolicy(
+            floor=256 << 20, ceiling=3 << 30, ratio=1.0, flags="-XX:+UseParallelGC"
+        )
+
+    def tearDown(self):
+        super().tearDown()
+
+
+class Test_HeapPolicy(ThisTestCase):
+    def test_heap_scales_with_input_between_floor_and_ceiling(self):
+        self.assertEqual(self.policy.heap_for(0), 256 << 20)
+        self.assertEqual(self.policy.heap_for(256 << 20), 512 << 20)
+        self.assertEqual(self.policy.heap_for(10 << 30), 3 << 30)
+
+    def test_unknown_size_gets_ceiling(self):
+        self.assertEqual(self.policy.heap_for(None), 3 << 30)
+
+    def test_settings(self):
+        found = self.policy.settings(768 << 20)
+
+        self.assertEqual(found, MOD.JvmSettings("1G", "-XX:+UseParallelGC"))
+        self.assertEqual(found.memory, (1 << 30) + MOD.resources.JVM_OVERHEAD)
+
+
+class Test_input_size(ThisTestCase):
+    def test_sizes(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "chunk.mpileup")
+            with open(path, "w") as fh:
+                fh.write("x" * 100)
+
+            self.assertEqual(MOD.input_size(path), 100)
+            self.assertIsNone(MOD.input_size(path + ".gz"))
+            self.assertIsNone(MOD.input_size("-"))
+            self.assertIsNone(MOD.input_size(os.path.join(tmpdir, "missing")))
+
+
+class Test_policies(ThisTestCase):
+    def test_policies_from_args(self):
+        args = SimpleNamespace(
+            java_opts="6G",
+            somatic_jvm_flags="-XX:+UseG1GC",
+            process_heap_floor="256M",
+            process_heap_ceiling="2G",
+            process_jvm_flags="-XX:+UseSerialGC",
+        )
+
+        self.assertEqual(
+            MOD.somatic_policy(args),
+            MOD.HeapPolicy(6 << 30, 6 << 30, MOD.SOMATIC_HEAP_RATIO, "-XX:+UseG1GC"),
+        )
+        for size in (0, 100 << 30, None):
+            with self.subTest(size=size):
+                self.assertEqual(MOD.somatic_policy(args).settings(size).heap, "6G")
+        self.assertEqual(
+            MOD.process_policy(args),
+            MOD.HeapPolicy(
+                256 << 20, 2 << 30, MOD.PROCESS_HEAP_PER_VCF_BYTE, "-XX:+UseSerialGC"
+            ),
+        )
+
+    def test_somatic_heap_follows_predicted_rss(self):
+        args = SimpleNamespace(
+            java_opts="6G", somatic_heap_floor="1G", somatic_jvm_flags=""
+        )
+
+        def rss(size):
+            return MOD.resources.JVM_OVERHEAD + size
+
+        policy = MOD.somatic_policy(args, rss)
+
+        for size, heap in (
+            (0, "1G"),
+            (2 << 30, "3G"),
+            (100 << 30, "6G"),
+            (None, "6G"),
+        ):
+            with self.subTest(size=size):
+                self.assertEqual(policy.settings(size).heap, heap)
+
+
+# __END__
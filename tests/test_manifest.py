@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from varscan_tool import manifest as MOD
+
+
+class ThisTestCase(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "manifest.json")
+        self.mpileup = self.write("chunk.mpileup", "chr1\t1\tA\n" * 10)
+        self.output = self.write("chunk.mpileup.snp.vcf", "#CHROM\n")
+        self.parameters = {"min_coverage": 8}
+
+    def tearDown(self):
+        super().tearDown()
+        self.tmpdir.cleanup()
+
+    def write(self, name, content):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, "w") as fh:
+            fh.write(content)
+        return path
+
+
+class Test_fingerprint(ThisTestCase):
+    def test_fingerprint_follows_content(self):
+        found = MOD.fingerprint(self.mpileup, sample_size=4)
+
+        os.utime(self.mpileup, (0, 0))
+        self.assertEqual(MOD.fingerprint(self.mpileup, sample_size=4), found)
+        self.write("chunk.mpileup", "chr1\t1\tC\n" * 10)
+        self.assertNotEqual(MOD.fingerprint(self.mpileup, sample_size=4), found)
+        self.assertIsNone(MOD.fingerprint("-"))
+
+    def test_run_parameters_ignore_resources(self):
+        args = SimpleNamespace(min_coverage=8, java_opts="3G", timeout=10)
+
+        found = MOD.run_parameters(args)
+
+        self.assertEqual(found["min_coverage"], 8)
+        self.assertNotIn("java_opts", found)
+        self.assertNotIn("timeout", found)
+
+
+class Test_Manifest(ThisTestCase):
+    def test_round_trip(self):
+        manifest = MOD.Manifest(self.path, self.parameters)
+        manifest.record(self.mpileup, 0, "somatic", [self.output])
+
+        found = MOD.Manifest.load(self.path, self.parameters)
+
+        self.assertEqual(found.stage_outputs(self.mpileup, "somatic"), [self.output])
+        self.assertIsNone(found.stage_outputs(self.mpileup, "process_snp"))
+        self.assertFalse(os.path.exists(self.path + ".tmp"))
+        with open(self.path) as fh:
+            self.assertEqual(json.load(fh)["version"], MOD.MANIFEST_VERSION)
+
+    def test_corrupt_or_changed_stages_are_invalid(self):
+        manifest = MOD.Manifest(self.path, self.parameters)
+        manifest.record(self.mpileup, 0, "somatic", [self.output])
+        self.write("chunk.mpileup.snp.vcf", "#CHROM\ttruncated")
+
+        found = MOD.Manifest.load(self.path, self.parameters)
+
+        with self.assertLogs(MOD.logger, level="WARNING"):
+            self.assertIsNone(found.stage_outputs(self.mpileup, "somatic"))
+
+    def test_other_parameters_start_empty(self):
+        MOD.Manifest(self.path, self.parameters).record(
+            self.mpileup, 0, "somatic", [self.output]
+        )
+
+        with self.assertLogs(MOD.logger, level="WARNING"):
+            found = MOD.Manifest.load(self.path, {"min_coverage": 10})
+
+        self.assertEqual(found.chunks, {})
+
+    def test_record_uses_outputs_checksummed_ahead(self):
+        manifest = MOD.Manifest(self.path, self.parameters)
+        manifest.checksum_outputs([self.output, self.output + ".missing"])
+
+        with mock.patch.object(MOD, "checksum") as checksum:
+            manifest.record(self.mpileup, 0, "somatic", [self.output])
+
+        checksum.assert_not_called()
+        self.assertEqual(manifest.stage_outputs(self.mpileup, "somatic"), [self.output])
+
+    def test_recording_a_stage_invalidates_dependents(self):
+        manifest = MOD.Manifest(self.path, self.parameters)
+        manifest.record(self.mpileup, 0, "process_snp", [self.output])
+
+        manifest.record(
+            self.mpileup, 0, "somatic", [self.output], invalidates=("process_snp",)
+        )
+
+        self.assertIsNone(manifest.stage_outputs(self.mpileup, "process_snp"))
+
+
+# __END__
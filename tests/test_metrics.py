@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import subprocess
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+from varscan_tool import metrics as MOD
+from varscan_tool import utils
+
+
+class ThisTestCase(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        super().tearDown()
+        self.tmpdir.cleanup()
+
+    def stage_metrics(self, chunk, stage, wall):
+        return MOD.StageMetrics(
+            chunk, stage, wall, 1.0, 0.5, 100 << 20, 10, 20, 1000, "1G"
+        )
+
+
+class Test_measure(ThisTestCase):
+    def test_includes_commands_run_by_fn(self):
+        path = os.path.join(self.tmpdir.name, "out")
+
+        def stage(size):
+            utils.call_subprocess(
+                "sh -c 'head -c {} /dev/zero > {}'".format(size, path),
+                stdout=subprocess.PIPE,
+            )
+            return "done"
+
+        found, usage = MOD.measure(stage, 1 << 20)
+
+        self.assertEqual(found, "done")
+        self.assertGreater(usage.wall, 0)
+        self.assertGreater(usage.max_rss, 0)
+
+    def test_in_process_stage(self):
+        found, usage = MOD.measure(sum, range(100000))
+
+        self.assertEqual(found, sum(range(100000)))
+        self.assertEqual(usage.max_rss, 0)
+        self.assertIsNone(usage.read_bytes)
+
+
+class Test_write_report(ThisTestCase):
+    def test_report_keyed_by_chunk_and_stage(self):
+        path = os.path.join(self.tmpdir.name, "metrics.json")
+        results = [
+            SimpleNamespace(
+                idx=0,
+                mpileup="chunk_0.mpileup",
+                metrics=(
+                    self.stage_metrics(0, "somatic", 10.0),
+                    self.stage_metrics(0, "process_snp", 2.0),
+                ),
+            ),
+            SimpleNamespace(
+                idx=1,
+                mpileup="chunk_1.mpileup",
+                metrics=(self.stage_metrics(1, "somatic", 30.0),),
+            ),
+        ]
+
+        MOD.write_report(path, results, {"thread_count": 2})
+
+        with open(path) as fh:
+            found = json.load(fh)
+        self.assertEqual(found["run"], {"thread_count": 2})
+        self.assertEqual(found["chunks"]["1"]["stages"]["somatic"]["wall"], 30.0)
+        self.assertEqual(found["stages"]["somatic"]["chunks"], 2)
+        self.assertEqual(found["stages"]["somatic"]["wall"], 40.0)
+        self.assertEqual(found["stages"]["somatic"]["max_rss"], 100 << 20)
+
+
+# __END__
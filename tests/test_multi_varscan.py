@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+import os
+import pathlib
+import tempfile
+import unittest
+
+from varscan_tool import multi_varscan as MOD
+from varscan_tool.varscan import VarscanReturn
+
+
+class ThisTestCase(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        super().tearDown()
+        self.tmpdir.cleanup()
+
+    def path(self, *names):
+        return os.path.join(self.tmpdir.name, *names)
+
+    def write(self, name, content=""):
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as fh:
+            fh.write(content)
+        return path
+
+
+class Test_setup_workdir(ThisTestCase):
+    def test_workdir_options(self):
+        argv = ["--mpileup", "in.mpileup", "--ref-dict", "ref.dict"]
+        workdir = self.path("work")
+
+        for extra, expected in (
+            ([], (".", False)),
+            (["--workdir", workdir], (workdir, False)),
+        ):
+            with self.subTest(extra=extra):
+                args = MOD.process_argv(argv + extra)
+                self.assertEqual(MOD.setup_workdir(args), expected)
+        self.assertTrue(os.path.isdir(workdir))
+
+        args = MOD.process_argv(argv + ["--scratch-dir", self.tmpdir.name])
+        found, scratch = MOD.setup_workdir(args)
+        self.assertTrue(scratch)
+        self.assertEqual(os.path.dirname(found), self.tmpdir.name)
+        self.assertNotEqual(MOD.setup_workdir(args)[0], found)
+
+
+class Test_stage_inputs(ThisTestCase):
+    def test_links_inputs_sharing_a_basename(self):
+        first = self.write("a/pair.mpileup", "a")
+        second = self.write("b/pair.mpileup", "b")
+        other = self.write("c/other.mpileup", "c")
+        workdir = self.path("work")
+        os.mkdir(workdir)
+
+        found = MOD.stage_inputs([first, second, other, "-"], workdir)
+
+        self.assertEqual(
+            found,
+            [
+                os.path.join(workdir, "input_0000.pair.mpileup"),
+                os.path.join(workdir, "input_0001.pair.mpileup"),
+                other,
+                "-",
+            ],
+        )
+        with open(found[1]) as fh:
+            self.assertEqual(fh.read(), "b")
+        self.assertEqual(MOD.stage_inputs([first, second], workdir), found[:2])
+
+
+class Test_chunk_outputs(ThisTestCase):
+    def test_outputs_in_chunk_order(self):
+        results = [
+            VarscanReturn("w/b.snp.vcf", "w/b.indel.vcf", "b", 1),
+            VarscanReturn("w/a.snp.vcf", "w/a.indel.vcf", "a", 0),
+        ]
+
+        snps, indels = MOD.chunk_outputs(results, ["a", "b"])
+
+        self.assertEqual(
+            snps,
+            [
+                pathlib.Path("w/a.snp.Somatic.hc.vcf"),
+                pathlib.Path("w/b.snp.Somatic.hc.vcf"),
+            ],
+        )
+        self.assertEqual(indels[0], pathlib.Path("w/a.indel.Somatic.hc.vcf"))
+
+    def test_missing_chunk(self):
+        results = [VarscanReturn("a.snp.vcf", "a.indel.vcf", "a", 0)]
+
+        with self.assertRaisesRegex(ValueError, "Missing output for b"):
+            MOD.chunk_outputs(results, ["a", "b"])
+
+
+class Test_publish(ThisTestCase):
+    def test_moves_output_and_index(self):
+        staged = self.write("work/merged.vcf.gz", "vcf")
+        self.write("work/merged.vcf.gz.tbi", "tbi")
+        destination = self.path("merged.vcf.gz")
+
+        MOD.publish(staged, destination)
+        MOD.publish(destination, destination)
+
+        self.assertFalse(os.path.exists(staged))
+        with open(destination) as fh:
+            self.assertEqual(fh.read(), "vcf")
+        self.assertTrue(os.path.exists(destination + ".tbi"))
+
+
+# __END__
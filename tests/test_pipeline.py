@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+
+import concurrent.futures
+import os
+import tempfile
+import threading
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from tests.fakes import FakeVarscan
+from varscan_tool import manifest
+from varscan_tool import pipeline as MOD
+from varscan_tool.cache import ResultCache
+from varscan_tool.footprint import Footprint
+from varscan_tool.manifest import Manifest
+from varscan_tool.retry import RetryPolicy
+from varscan_tool.scheduler import StagePool, WorkItem
+from varscan_tool.utils import OOM, TIMEOUT
+from varscan_tool.varscan_somatic_process import output_paths
+
+
+class WritingVarscan(FakeVarscan):
+    """Writes the stage outputs, so they can be checkpointed"""
+
+    def run_somatic(self, mpileup, args, jvm=None, timeout=None):
+        outputs = super().run_somatic(mpileup, args, jvm, timeout)
+        for path in outputs:
+            with open(path, "w") as fh:
+                fh.write(path)
+        return outputs
+
+    def run_process(self, input_vcf, args, jvm=None, timeout=None):
+        super().run_process(input_vcf, args, jvm, timeout)
+        for path in output_paths(input_vcf):
+            with open(path, "w") as fh:
+                fh.write(path)
+
+
+class StreamingVarscan(WritingVarscan):
+    """Runs processSomatic within somatic, writing only the merged outputs"""
+
+    def run_somatic_streamed(self, mpileup, args, jvm=None, timeout=None):
+        with self.lock:
+            self.calls.append(("somatic+process", mpileup))
+        outputs = self.somatic_outputs(mpileup)
+        for vcf in outputs:
+            with open(output_paths(vcf, ("Somatic.hc",))[0], "w") as fh:
+                fh.write(vcf)
+        return outputs
+
+
+class ThisTestCase(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.args = SimpleNamespace(
+            java_opts="3G",
+            somatic_jvm_flags="-XX:+UseSerialGC",
+            process_heap_floor="256M",
+            process_heap_ceiling="3G",
+            process_jvm_flags="-XX:+UseSerialGC",
+            process_backend="jvm",
+            timeout=100,
+            workdir=".",
+        )
+        self.work = [
+            WorkItem(idx=1, mpileup="b", cost=2.0),
+            WorkItem(idx=0, mpileup="a", cost=1.0),
+        ]
+
+    def tearDown(self):
+        super().tearDown()
+
+    def run_graph(
+        self,
+        varscan,
+        workers,
+        retry=None,
+        manifest=None,
+        cache=None,
+        footprint=None,
+        fail_fast=False,
+        somatic_rss=None,
+    ):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            graph = MOD.ChunkGraph(
+                StagePool(executor, workers),
+                self.args,
+                retry,
+                manifest,
+                cache,
+                footprint,
+                fail_fast,
+                somatic_rss,
+                _varscan=varscan,
+            )
+            for item in self.work:
+                graph.add(item)
+            return graph.run()
+
+
+class Test_ChunkGraph(ThisTestCase):
+    def test_process_stages_run_before_next_somatic(self):
+        varscan = FakeVarscan()
+
+        self.run_graph(varscan, workers=1)
+
+        self.assertEqual(
+            varscan.calls,
+            [
+                ("somatic", "b"),
+                ("process", "b.snp.vcf"),
+                ("process", "b.indel.vcf"),
+                ("somatic", "a"),
+                ("process", "a.snp.vcf"),
+                ("process", "a.indel.vcf"),
+            ],
+        )
+
+    def test_returns_one_result_per_chunk(self):
+        found = self.run_graph(FakeVarscan(), workers=3)
+
+        expected = {
+            MOD.VarscanReturn("a.snp.vcf", "a.indel.vcf", "a", 0),
+            MOD.VarscanReturn("b.snp.vcf", "b.indel.vcf", "b", 1),
+        }
+        self.assertEqual({r._replace(attempts=(), metrics=()) for r in found}, expected)
+
+    def test_failed_stages_drop_chunk(self):
+        for varscan in (
+            FakeVarscan(fail_somatic=("a",)),
+            FakeVarscan(fail_process=("a.indel.vcf",)),
+        ):
+            with self.subTest(varscan=varscan):
+                with self.assertLogs(MOD.logger, level="ERROR"):
+                    found = self.run_graph(varscan, workers=2)
+                self.assertEqual([r.mpileup for r in found], ["b"])
+
+    def test_fail_fast_cancels_remaining_chunks(self):
+        varscan = FakeVarscan(fail_somatic=("b",))
+
+        with self.assertLogs(MOD.logger, level="ERROR") as logs:
+            found = self.run_graph(varscan, workers=1, fail_fast=True)
+
+        self.assertEqual(found, [])
+        self.assertEqual(varscan.calls, [("somatic", "b")])
+        self.assertIn("cancelling remaining stages", logs.output[-1])
+
+    def test_retries_with_escalated_resources(self):
+        varscan = FakeVarscan(transient={"a": OOM, "b.snp.vcf": TIMEOUT})
+        retry = RetryPolicy(max_attempts=2, backoff=0.01)
+
+        with self.assertLogs(MOD.logger, level="WARNING"):
+            found = self.run_graph(varscan, workers=2, retry=retry)
+
+        attempts = {r.mpileup: r.attempts for r in found}
+        self.assertEqual(
+            [(a.stage, a.number, a.heap, a.outcome) for a in attempts["a"][:2]],
+            [(MOD.SOMATIC, 1, "3G", OOM), (MOD.SOMATIC, 2, "6G", "ok")],
+        )
+        snp = [a for a in attempts["b"] if a.stage == MOD.PROCESS_SNP]
+        self.assertEqual(
+            [(a.timeout, a.outcome) for a in snp], [(100, TIMEOUT), (200, "ok")]
+        )
+
+    def test_somatic_heap_sized_by_predicted_rss(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            mpileup = os.path.join(tmpdir, "a.mpileup")
+            with open(mpileup, "w") as fh:
+                fh.write("x" * 100)
+            self.work = [WorkItem(idx=0, mpileup=mpileup, cost=1.0)]
+            self.args.somatic_heap_floor = "1G"
+
+            (found,) = self.run_graph(
+                FakeVarscan(), workers=1, somatic_rss=lambda size: 2 << 30
+            )
+
+        somatic = [a.heap for a in found.attempts if a.stage == MOD.SOMATIC]
+        self.assertEqual(somatic, ["2688M"])
+
+    def test_stdin_stage_not_retried(self):
+        self.work = [WorkItem(idx=0, mpileup="-", cost=1.0)]
+        varscan = FakeVarscan(transient={"-": OOM})
+
+        with self.assertLogs(MOD.logger, level="ERROR"):
+            found = self.run_graph(varscan, workers=1, retry=RetryPolicy(3))
+
+        self.assertEqual(found, [])
+        self.assertEqual(varscan.calls, [("somatic", "-")])
+
+    def test_does_not_retry_beyond_max_attempts(self):
+        varscan = FakeVarscan(transient={"a": OOM})
+
+        with self.assertLogs(MOD.logger, level="ERROR"):
+            found = self.run_graph(varscan, workers=2, retry=RetryPolicy(1))
+
+        self.assertEqual([r.mpileup for r in found], ["b"])
+
+    def write_chunks(self, tmpdir):
+        self.work = []
+        for idx in range(2):
+            mpileup = os.path.join(tmpdir, "chunk_{}.mpileup".format(idx))
+            with open(mpileup, "w") as fh:
+                fh.write("chr1\t{}\tA\n".format(idx))
+            self.work.append(WorkItem(idx=idx, mpileup=mpileup, cost=1.0))
+
+    def test_outputs_checksummed_off_the_scheduler_thread(self):
+        threads = []
+        checksum = manifest.checksum
+
+        def record_thread(path):
+            threads.append(threading.current_thread())
+            return checksum(path)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.write_chunks(tmpdir)
+            path = os.path.join(tmpdir, "manifest.json")
+            with mock.patch.object(manifest, "checksum", side_effect=record_thread):
+                self.run_graph(WritingVarscan(), 2, manifest=Manifest(path, {}))
+
+            self.assertTrue(threads)
+            self.assertNotIn(threading.main_thread(), threads)
+            found = Manifest.load(path, {})
+            for item in self.work:
+                with self.subTest(mpileup=item.mpileup):
+                    self.assertIsNotNone(found.stage_outputs(item.mpileup, MOD.SOMATIC))
+
+    def test_resume_runs_only_missing_stages(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "manifest.json")
+            self.write_chunks(tmpdir)
+            self.run_graph(WritingVarscan(), 1, manifest=Manifest(path, {}))
+            corrupt = output_paths(self.work[1].mpileup + ".indel.vcf")[0]
+            with open(corrupt, "w") as fh:
+                fh.write("partial")
+
+            varscan = WritingVarscan()
+            with self.assertLogs("varscan_tool.manifest", level="WARNING"):
+                found = self.run_graph(varscan, 1, manifest=Manifest.load(path, {}))
+
+        self.assertEqual(
+            varscan.calls, [("process", self.work[1].mpileup + ".indel.vcf")]
+        )
+        self.assertEqual(len(found), 2)
+
+    def test_cached_stages_are_restored(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = ResultCache(os.path.join(tmpdir, "cache"))
+            self.write_chunks(tmpdir)
+            self.run_graph(WritingVarscan(), 2, cache=cache)
+            outputs = output_paths(self.work[0].mpileup + ".snp.vcf")
+            os.remove(outputs[0])
+
+            varscan = WritingVarscan()
+            found = self.run_graph(varscan, 2, cache=cache)
+
+            self.assertTrue(os.path.exists(outputs[0]))
+        self.assertEqual(varscan.calls, [])
+        self.assertEqual(len(found), 2)
+        self.assertEqual(cache.stats["hits"], 6)
+
+    def test_low_footprint_keeps_only_merged_outputs(self):
+        for backend, varscan, calls in (
+            ("jvm", WritingVarscan(), 6),
+            ("native", StreamingVarscan(), 2),
+        ):
+            with self.subTest(backend=backend), tempfile.TemporaryDirectory() as tmpdir:
+                self.args.process_backend = backend
+                self.write_chunks(tmpdir)
+                path = os.path.join(tmpdir, "manifest.json")
+                footprint = Footprint(True, [item.mpileup for item in self.work])
+
+                found = self.run_graph(
+                    varscan, 2, manifest=Manifest(path, {}), footprint=footprint
+                )
+                # Resumed runs scatter their chunks again.
+                self.write_chunks(tmpdir)
+                resumed = WritingVarscan()
+                self.run_graph(
+                    resumed,
+                    2,
+                    manifest=Manifest.load(path, {}),
+                    footprint=Footprint(True, [item.mpileup for item in self.work]),
+                )
+
+                self.assertEqual(len(found), 2)
+                self.assertEqual(len(varscan.calls), calls)
+                self.assertEqual(resumed.calls, [])
+                self.assertEqual(
+                    sorted(os.listdir(tmpdir)),
+                    [
+                        "chunk_{}.mpileup.{}.Somatic.hc.vcf".format(idx, kind)
+                        for idx in range(2)
+                        for kind in ("indel", "snp")
+                    ]
+                    + ["manifest.json"],
+                )
+                self.assertGreater(footprint.peak, footprint.current)
+
+
+# __END__
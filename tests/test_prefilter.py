@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+import io
+import unittest
+from unittest import mock
+
+from varscan_tool import prefilter as MOD
+
+
+def row(normal_depth, normal, tumor_depth, tumor, pos=1):
+    return "chr1\t{}\tA\t{}\t{}\t{}\t{}\t{}\t{}\n".format(
+        pos,
+        normal_depth,
+        normal,
+        "I" * len(normal),
+        tumor_depth,
+        tumor,
+        "I" * len(tumor),
+    ).encode()
+
+
+class ThisTestCase(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.thresholds = MOD.Thresholds(min_coverage_normal=8, min_coverage_tumor=6)
+
+
+class Test_keep_row(ThisTestCase):
+    def test_rows(self):
+        for name, line, expected in (
+            ("somatic", row(8, "." * 8, 6, "....CC"), True),
+            ("germline", row(8, "....CCCC", 6, "...CCC"), True),
+            ("indel", row(8, "." * 8, 6, "..,,.+2AC,"), True),
+            ("deletion", row(8, "." * 8, 6, ".....*"), True),
+            ("low normal coverage", row(7, "." * 7, 6, "....CC"), False),
+            ("low tumor coverage", row(8, "." * 8, 5, "...CC"), False),
+            ("both reference", row(8, "....,,,,", 6, ".,.,.,"), False),
+            ("loss of heterozygosity", row(8, "...GGGGG", 6, ".,.,.,"), True),
+            ("normal read starts", row(8, "^A.^A....,,", 6, ".,.,.,"), False),
+            ("read starts and ends", row(8, "." * 8, 6, "^A..,^..$,,$"), False),
+            ("read start then alt", row(8, "." * 8, 6, "^]A....."), True),
+            ("reference skips", row(8, "." * 8, 6, "..<<>>"), False),
+            ("not a pair", b"chr1\t1\tA\t8\t........\tIIIIIIII", True),
+            ("bad depth", row("x", "." * 8, 6, "......"), True),
+        ):
+            with self.subTest(name=name):
+                self.assertEqual(
+                    MOD.keep_row(line.rstrip(b"\n"), self.thresholds), expected
+                )
+
+
+class Test_PrefilteredReader(ThisTestCase):
+    def test_streams_kept_rows_across_batches(self):
+        rows = [
+            row(8, "." * 8, 6, "....CC" if pos % 3 == 0 else "......", pos)
+            for pos in range(1, 31)
+        ]
+        data = b"".join(rows)
+        expected = b"".join(rows[2::3])
+
+        for batch in (7, 100, 1 << 20):
+            with self.subTest(batch=batch):
+                source = io.BytesIO(data[:-1])
+                with mock.patch.object(MOD, "BATCH_BYTES", batch):
+                    reader = MOD.PrefilteredReader(source, self.thresholds)
+                    found = b"".join(iter(lambda: reader.read(13), b""))
+                    reader.close()
+
+                self.assertEqual(found, expected)
+                self.assertEqual((reader.rows_in, reader.rows_kept), (30, 10))
+                self.assertAlmostEqual(
+                    reader.fraction_removed, 1 - len(expected) / (len(data) - 1)
+                )
+                self.assertFalse(source.closed)
+
+    def test_logs_fraction_removed(self):
+        data = row(8, "." * 8, 6, "......") + row(8, "." * 8, 6, "....CC", 2)
+        reader = MOD.PrefilteredReader(io.BytesIO(data), self.thresholds)
+        reader.read()
+
+        with self.assertLogs(MOD.logger, level="INFO") as logs:
+            reader.log("pair.mpileup")
+
+        self.assertIn("kept 1 of 2 rows of pair.mpileup", logs.output[0])
+        self.assertIn("removing 50.0%", logs.output[0])
+
+
+# __END__
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Conformance of the native processSomatic engine against the VarScan JVM.
+
+Runs only when VARSCAN_JAR points at a VarScan jar and java is on PATH.
+"""
+
+import filecmp
+import os
+import shutil
+import tempfile
+import unittest
+
+from varscan_tool import varscan_somatic_process as MOD
+
+DATA = os.path.join(os.path.dirname(__file__), "data")
+FIXTURES = ("sample.snp.vcf", "sample.indel.vcf")
+VARSCAN_JAR = os.environ.get("VARSCAN_JAR")
+
+
+@unittest.skipUnless(
+    VARSCAN_JAR and shutil.which("java"), "VARSCAN_JAR and java required"
+)
+class Test_ProcessSomaticConformance(unittest.TestCase):
+    PARAMS = dict(min_tumor_freq=0.1, max_normal_freq=0.05, vps_p_value=0.07)
+
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        super().tearDown()
+        self.tmpdir.cleanup()
+
+    def run_backend(self, backend, fixture):
+        outdir = os.path.join(self.tmpdir.name, backend)
+        os.makedirs(outdir, exist_ok=True)
+        input_vcf = os.path.join(outdir, fixture)
+        shutil.copy(os.path.join(DATA, fixture), input_vcf)
+        with MOD.PROCESS_BACKENDS[backend](None, VARSCAN_JAR, **self.PARAMS) as process:
+            process.run(input_vcf)
+        return input_vcf
+
+    def test_native_outputs_match_jvm(self):
+        for fixture in FIXTURES:
+            jvm_vcf = self.run_backend("jvm", fixture)
+            native_vcf = self.run_backend("native", fixture)
+            for status in MOD.STATUSES:
+                for category in (status, status + ".hc"):
+                    with self.subTest(fixture=fixture, category=category):
+                        self.assertTrue(
+                            filecmp.cmp(
+                                MOD.output_path(jvm_vcf, category),
+                                MOD.output_path(native_vcf, category),
+                                shallow=False,
+                            )
+                        )
+
+
+# __END__
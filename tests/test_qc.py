@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import tempfile
+import unittest
+
+from varscan_tool import qc as MOD
+from varscan_tool import vcf
+
+FORMAT = "GT:GQ:DP:RD:AD:FREQ"
+
+
+def record(chrom, pos, ref="A", alt="G", ss="2", tumor="0/1:.:20:15:5:25%"):
+    return "{}\t{}\t.\t{}\t{}\t.\tPASS\tDP=40;SS={};SSC=40\t{}\t{}\t{}\n".format(
+        chrom, pos, ref, alt, ss, FORMAT, "0/0:.:20:20:0:0%", tumor
+    )
+
+
+RECORDS = [
+    record("chr1", 1),
+    record("chr1", 2, "C", "T", ss="1", tumor="0/1:.:20:10:10:50%"),
+    record("chr1", 3, "A", "C", ss="3"),
+    record("chr2", 4, "g", "t", ss="5", tumor="0/1:.:0:0:0:0%"),
+    record("chr2", 5, "A", "AT", tumor="1/1:.:20:0:20:100%"),
+    record("chr2", 6, "AT", "A", ss="0"),
+]
+
+
+class ThisTestCase(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        super().tearDown()
+        self.tmpdir.cleanup()
+
+    def tally(self, lines):
+        stats = MOD.VariantStats()
+        stats.add_lines(lines)
+        return stats.summary()
+
+
+class Test_VariantStats(ThisTestCase):
+    def test_summary(self):
+        found = self.tally(RECORDS)
+
+        self.assertEqual(found["records"], 6)
+        self.assertEqual(found["contigs"], {"chr1": 3, "chr2": 3})
+        self.assertEqual(
+            found["somatic_status"],
+            {"Somatic": 2, "Germline": 1, "LOH": 1, "Unknown": 1, "Reference": 1},
+        )
+        self.assertEqual((found["snvs"], found["transitions"]), (4, 2))
+        self.assertEqual(found["ti_tv"], 1.0)
+        self.assertEqual((found["insertions"], found["deletions"]), (1, 1))
+        histogram = found["vaf_histogram"]
+        self.assertEqual(len(histogram), MOD.VAF_BINS)
+        self.assertEqual(
+            {idx: count for idx, count in enumerate(histogram) if count},
+            {0: 1, 5: 3, 10: 1, 19: 1},
+        )
+
+    def test_batches_match_records(self):
+        lines = RECORDS + [
+            "chr3\t7\t.\tA\tG\t.\tPASS\tDP=3\tGT:FREQ\t0/0:0%\t0/1:40%\n",
+            "chr3\t8\t.\tA\tG\t.\tPASS\tDP=3\tGT\t0/0\t0/1\n",
+            "chr3\t9\t.\tA\tG\t.\tPASS\tDP=3;SS=2\t{}\t0/0\t0/1\n".format(FORMAT),
+        ]
+        stats = MOD.VariantStats()
+        for line in lines:
+            stats.add(vcf.VcfRecord(line))
+        expected = stats.summary()
+
+        for size in (1, 2, 4, len(RECORDS), len(lines)):
+            with self.subTest(batch_lines=size):
+                batches = [lines[i : i + size] for i in range(0, len(lines), size)]
+                stats = MOD.VariantStats()
+                for batch in batches:
+                    stats.add_lines(batch)
+                self.assertEqual(stats.summary(), expected)
+
+    def test_no_transversions(self):
+        self.assertIsNone(self.tally(RECORDS[:2])["ti_tv"])
+
+
+class Test_write_summary(ThisTestCase):
+    def test_json_and_tsv(self):
+        stats = MOD.VariantStats()
+        stats.tally.add_text("".join(RECORDS))
+        prefix = os.path.join(self.tmpdir.name, "multi_varscan2_snp_merged")
+
+        found = MOD.write_summary(stats, prefix)
+
+        self.assertEqual(found, [prefix + ".qc.json", prefix + ".qc.tsv"])
+        with open(found[0]) as fh:
+            summary = json.load(fh)
+        self.assertEqual(summary["records"], 6)
+        with open(found[1]) as fh:
+            rows = [line.rstrip("\n").split("\t") for line in fh]
+        self.assertEqual(rows[0], ["section", "key", "value"])
+        self.assertIn(["total", "ti_tv", "1.0"], rows)
+        self.assertIn(["contig", "chr2", "3"], rows)
+        self.assertIn(["somatic_status", "LOH", "1"], rows)
+        self.assertIn(["vaf", "0.25-0.30", "3"], rows)
+        self.assertEqual(len(rows), 1 + len(MOD.TOTALS) + 2 + 5 + MOD.VAF_BINS)
+
+
+# __END__
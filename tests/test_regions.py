@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+
+import io
+import os
+import tempfile
+import unittest
+
+from varscan_tool import regions as MOD
+
+
+class ThisTestCase(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.contigs = [
+            MOD.Contig("chr1", 1000),
+            MOD.Contig("chr2", 600),
+            MOD.Contig("chr3", 400),
+        ]
+
+    def tearDown(self):
+        super().tearDown()
+
+
+class Test_parse_ref_dict(ThisTestCase):
+    def test_reads_sq_records_in_order(self):
+        fh = io.StringIO(
+            "@HD\tVN:1.5\n@SQ\tSN:chr1\tLN:1000\tM5:abc\n@SQ\tSN:chr2\tLN:600\n"
+        )
+        found = MOD.parse_ref_dict(fh)
+        self.assertEqual(found, self.contigs[:2])
+
+    def test_malformed_record_raises_ValueError(self):
+        fh = io.StringIO("@SQ\tSN:chr1\n")
+        with self.assertRaisesRegex(ValueError, "Malformed"):
+            MOD.parse_ref_dict(fh)
+
+
+class Test_plan_chunks(ThisTestCase):
+    def test_chunks_cover_reference_with_balanced_lengths(self):
+        chunks = MOD.plan_chunks(self.contigs, 4)
+
+        self.assertEqual(len(chunks), 4)
+        lengths = [sum(r.length for r in chunk) for chunk in chunks]
+        self.assertEqual(lengths, [500, 500, 500, 500])
+        flattened = [r for chunk in chunks for r in chunk]
+        self.assertEqual(flattened[0], MOD.Region("chr1", 1, 500))
+        self.assertEqual(flattened[-1], MOD.Region("chr3", 1, 400))
+
+    def test_excluded_regions_are_skipped_and_rebalanced(self):
+        excluded = {"chr1": [(1, 800)], "chr2": [(1, 600)]}
+        chunks = MOD.plan_chunks(self.contigs, 2, excluded)
+
+        self.assertEqual(
+            chunks,
+            [
+                [MOD.Region("chr1", 801, 1000), MOD.Region("chr3", 1, 100)],
+                [MOD.Region("chr3", 101, 400)],
+            ],
+        )
+
+    def test_empty_chunks_dropped(self):
+        contigs = [MOD.Contig("chr1", 3), MOD.Contig("chr2", 2)]
+
+        for count in (3, 5, 8, 20):
+            with self.subTest(count=count):
+                chunks = MOD.plan_chunks(contigs, count)
+
+                self.assertTrue(all(chunks))
+                self.assertLessEqual(len(chunks), count)
+                self.assertEqual(sum(r.length for c in chunks for r in c), 5)
+
+    def test_invalid_count_raises_ValueError(self):
+        with self.assertRaises(ValueError):
+            MOD.plan_chunks(self.contigs, 0)
+
+
+class Test_scatter_mpileup(ThisTestCase):
+    def test_lines_routed_to_planned_chunk(self):
+        chunks = [
+            [MOD.Region("chr1", 1, 10)],
+            [MOD.Region("chr1", 11, 20), MOD.Region("chr2", 1, 5)],
+        ]
+        lines = [
+            "chr1\t5\tA\n",
+            "chr1\t11\tC\n",
+            "chr2\t3\tG\n",
+            "chr2\t9\tT\n",
+            "chrUn\t1\tA\n",
+        ]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            mpileup = os.path.join(tmpdir, "in.mpileup")
+            with open(mpileup, "w") as fh:
+                fh.writelines(lines)
+
+            paths = MOD.scatter_mpileup([mpileup], chunks, tmpdir)
+
+            found = []
+            for path in paths:
+                with open(path) as fh:
+                    found.append(fh.readlines())
+        self.assertEqual(found, [[lines[0]], [lines[1], lines[2]]])
+
+    def test_overlapping_inputs_merged_by_position(self):
+        chunks = [[MOD.Region("chr1", 1, 20), MOD.Region("chr2", 1, 20)]]
+        inputs = [
+            ["chr1\t2\tA\n", "chr1\t12\tC\n", "chr2\t5\tG\n"],
+            ["chr1\t7\tT\n", "chrUn\t1\tA\n", "chr2\t1\tC\n", "chr2\t9\tA\n"],
+        ]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            mpileups = []
+            for idx, lines in enumerate(inputs):
+                mpileups.append(os.path.join(tmpdir, "in{}.mpileup".format(idx)))
+                with open(mpileups[-1], "w") as fh:
+                    fh.writelines(lines)
+
+            (path,) = MOD.scatter_mpileup(mpileups, chunks, tmpdir)
+
+            with open(path) as fh:
+                found = [tuple(line.split("\t")[:2]) for line in fh]
+        self.assertEqual(
+            found,
+            [("chr1", "2"), ("chr1", "7"), ("chr1", "12")]
+            + [("chr2", "1"), ("chr2", "5"), ("chr2", "9")],
+        )
+
+
+# __END__
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from varscan_tool import resources as MOD
+
+
+class ThisTestCase(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.files = {
+            MOD.MEMINFO: "MemTotal:       65536000 kB\nMemFree:  1000 kB",
+        }
+
+    def tearDown(self):
+        super().tearDown()
+
+    def read(self, path):
+        return self.files.get(path)
+
+
+class Test_sizes(ThisTestCase):
+    def test_parse_size(self):
+        for value, expected in (
+            ("3G", 3 << 30),
+            ("512m", 512 << 20),
+            ("1.5g", 3 << 29),
+            ("2048", 2048),
+            ("64KB", 64 << 10),
+        ):
+            with self.subTest(value=value):
+                self.assertEqual(MOD.parse_size(value), expected)
+
+    def test_parse_size_raises_ValueError(self):
+        with self.assertRaises(ValueError):
+            MOD.parse_size("lots")
+
+    def test_format_size(self):
+        self.assertEqual(MOD.format_size(3 << 30), "3G")
+        self.assertEqual(MOD.format_size((1 << 30) + 1), "1025M")
+
+
+class Test_memory_limit(ThisTestCase):
+    def test_cgroup_v2_limit(self):
+        self.files[MOD.CGROUP_V2_MEMORY] = str(8 << 30)
+        self.assertEqual(MOD.memory_limit(_read=self.read), 8 << 30)
+
+    def test_cgroup_v1_unlimited_falls_back_to_meminfo(self):
+        self.files[MOD.CGROUP_V2_MEMORY] = "max"
+        self.files[MOD.CGROUP_V1_MEMORY] = str(MOD.UNLIMITED + 4096)
+        self.assertEqual(MOD.memory_limit(_read=self.read), 65536000 * 1024)
+
+    def test_cgroup_v1_limit(self):
+        self.files[MOD.CGROUP_V1_MEMORY] = str(4 << 30)
+        self.assertEqual(MOD.memory_limit(_read=self.read), 4 << 30)
+
+
+class Test_oom_kills(ThisTestCase):
+    def test_cgroup_v2_events(self):
+        self.files[MOD.CGROUP_V2_MEMORY_EVENTS] = "low 0\nhigh 0\noom 3\noom_kill 2"
+        self.assertEqual(MOD.oom_kills(_read=self.read), 2)
+
+    def test_cgroup_v1_oom_control(self):
+        self.files[MOD.CGROUP_V1_OOM_CONTROL] = "oom_kill_disable 0\noom_kill 5"
+        self.assertEqual(MOD.oom_kills(_read=self.read), 5)
+
+    def test_not_reported(self):
+        self.assertIsNone(MOD.oom_kills(_read=self.read))
+
+
+class Test_cpu_limit(ThisTestCase):
+    def setUp(self):
+        super().setUp()
+        self.os = mock.MagicMock()
+        self.os.sched_getaffinity.return_value = set(range(16))
+        self.di = SimpleNamespace(os=self.os)
+
+    def test_affinity_without_quota(self):
+        self.files[MOD.CGROUP_V2_CPU] = "max 100000"
+        self.assertEqual(MOD.cpu_limit(_read=self.read, _di=self.di), 16)
+
+    def test_quota_caps_cpus(self):
+        self.files[MOD.CGROUP_V2_CPU] = "250000 100000"
+        self.assertEqual(MOD.cpu_limit(_read=self.read, _di=self.di), 3)
+
+    def test_cgroup_v1_quota(self):
+        self.files[MOD.CGROUP_V1_CPU_QUOTA] = "400000"
+        self.files[MOD.CGROUP_V1_CPU_PERIOD] = "100000"
+        self.assertEqual(MOD.cpu_limit(_read=self.read, _di=self.di), 4)
+
+
+class Test_default_thread_count(ThisTestCase):
+    def test_bounded_by_memory_and_cpus(self):
+        self.assertEqual(MOD.default_thread_count(4 << 30, 10 << 30, 8), 2)
+        self.assertEqual(MOD.default_thread_count(1 << 30, 64 << 30, 8), 8)
+        self.assertEqual(MOD.default_thread_count(16 << 30, 8 << 30, 8), 1)
+
+
+class Test_MemoryBudget(ThisTestCase):
+    def test_admission(self):
+        budget = MOD.MemoryBudget(10)
+
+        self.assertTrue(budget.can_admit(20))
+        budget.reserve(6)
+        self.assertTrue(budget.can_admit(4))
+        self.assertFalse(budget.can_admit(5))
+        budget.release(6)
+        self.assertEqual(budget.reserved, 0)
+
+
+# __END__
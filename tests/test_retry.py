@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from varscan_tool import retry as MOD
+from varscan_tool.jvm import JvmSettings
+from varscan_tool.utils import ERROR, OOM, TIMEOUT, CommandFailed
+
+
+class ThisTestCase(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.policy = MOD.RetryPolicy(max_attempts=3, backoff=5.0, heap_limit=6 << 30)
+        self.jvm = JvmSettings("2G")
+
+    def tearDown(self):
+        super().tearDown()
+
+
+class Test_RetryPolicy(ThisTestCase):
+    def test_should_retry_resource_failures_only(self):
+        for error, expected in (
+            (CommandFailed("killed", OOM, 137), True),
+            (CommandFailed("timed out", TIMEOUT), True),
+            (CommandFailed("bad input", ERROR, 1), False),
+            (ValueError("bad input"), False),
+        ):
+            with self.subTest(error=error):
+                found = self.policy.should_retry(error, 1, self.jvm, 60)
+                self.assertEqual(found, expected)
+
+    def test_should_not_retry_beyond_limits(self):
+        oom = CommandFailed("killed", OOM, 137)
+
+        self.assertFalse(self.policy.should_retry(oom, 3, self.jvm, 60))
+        self.assertFalse(self.policy.should_retry(oom, 1, JvmSettings("6G"), 60))
+        self.assertFalse(self.policy.should_retry(oom, 1, None, 60))
+        timeout = CommandFailed("timed out", TIMEOUT)
+        self.assertFalse(self.policy.should_retry(timeout, 1, self.jvm, None))
+
+    def test_escalate(self):
+        self.assertEqual(
+            self.policy.escalate(OOM, self.jvm, 60), (JvmSettings("4G"), 60)
+        )
+        self.assertEqual(
+            self.policy.escalate(OOM, JvmSettings("4G"), 60), (JvmSettings("6G"), 60)
+        )
+        self.assertEqual(self.policy.escalate(TIMEOUT, self.jvm, 60), (self.jvm, 120))
+
+    def test_delay_backs_off_exponentially(self):
+        self.assertEqual([self.policy.delay(n) for n in (1, 2, 3)], [5.0, 10.0, 20.0])
+
+
+# __END__
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+
+import concurrent.futures
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from varscan_tool import scheduler as MOD
+from varscan_tool.resources import MemoryBudget
+
+
+class ThisTestCase(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+
+    def tearDown(self):
+        super().tearDown()
+
+
+class Test_lpt_order(ThisTestCase):
+    def test_orders_by_descending_cost_keeping_input_index(self):
+        costs = {"a": 1.0, "b": 5.0, "c": 3.0, "d": 5.0}
+
+        found = MOD.lpt_order(["a", "b", "c", "d"], costs.__getitem__)
+
+        expected = [
+            MOD.WorkItem(idx=1, mpileup="b", cost=5.0),
+            MOD.WorkItem(idx=3, mpileup="d", cost=5.0),
+            MOD.WorkItem(idx=2, mpileup="c", cost=3.0),
+            MOD.WorkItem(idx=0, mpileup="a", cost=1.0),
+        ]
+        self.assertEqual(found, expected)
+
+
+class Test_predict_makespan(ThisTestCase):
+    def test_lpt_order_beats_input_order(self):
+        costs = [1.0, 1.0, 1.0, 1.0, 4.0]
+
+        self.assertEqual(MOD.predict_makespan(costs, 2), 6.0)
+        self.assertEqual(MOD.predict_makespan(sorted(costs, reverse=True), 2), 4.0)
+
+    def test_empty_schedule(self):
+        self.assertEqual(MOD.predict_makespan([], 4), 0.0)
+
+
+class Test_cost_functions(ThisTestCase):
+    def test_size_and_line_costs(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "in.mpileup")
+            content = "chr1\t1\tA\nchr1\t2\tC\n"
+            with open(path, "w") as fh:
+                fh.write(content)
+
+            self.assertEqual(MOD.file_size_cost(path), float(len(content)))
+            self.assertEqual(MOD.line_count_cost(path), 2.0)
+
+    def test_missing_input_costs_nothing(self):
+        self.assertEqual(MOD.file_size_cost("/does/not/exist"), 0.0)
+        self.assertEqual(MOD.line_count_cost("/does/not/exist"), 0.0)
+
+
+class Test_StagePool(ThisTestCase):
+    def setUp(self):
+        super().setUp()
+        self.lock = threading.Lock()
+        self.running = set()
+        self.overlaps = []
+        self.finished = []
+
+    def work(self, name):
+        with self.lock:
+            self.overlaps.append((name, set(self.running)))
+            self.running.add(name)
+        time.sleep(0.02)
+        with self.lock:
+            self.running.discard(name)
+
+    def run_pool(self, tasks, budget):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
+            pool = MOD.StagePool(executor, 3, budget=budget)
+            for name, memory in tasks:
+                pool.submit(
+                    MOD.StageTask(0, name, self.work, (name,), memory),
+                    lambda task, future: self.finished.append(task.stage),
+                )
+            pool.run()
+
+    def test_tasks_only_start_within_memory_budget(self):
+        budget = MemoryBudget(10)
+
+        self.run_pool([("big_a", 6), ("big_b", 6), ("small", 4)], budget)
+
+        overlaps = dict(self.overlaps)
+        self.assertNotIn("big_a", overlaps["big_b"])
+        self.assertNotIn("big_b", overlaps["big_a"])
+        self.assertEqual(sorted(self.finished), ["big_a", "big_b", "small"])
+        self.assertEqual(budget.reserved, 0)
+
+    def test_oversized_task_runs_alone(self):
+        budget = MemoryBudget(10)
+
+        self.run_pool([("huge", 50), ("small", 1)], budget)
+
+        overlaps = dict(self.overlaps)
+        self.assertEqual(overlaps["huge"], set())
+        self.assertNotIn("huge", overlaps["small"])
+
+    def test_deferred_task_not_starved_by_smaller_ones(self):
+        budget = MemoryBudget(10)
+        tasks = [("small_0", 4), ("big", 8)]
+        tasks += [("small_{}".format(idx), 4) for idx in range(1, 8)]
+
+        with mock.patch.object(MOD, "MAX_DEFERRALS", 1):
+            self.run_pool(tasks, budget)
+
+        self.assertLess(self.finished.index("big"), 4)
+        self.assertEqual(len(self.finished), len(tasks))
+        self.assertEqual(budget.reserved, 0)
+
+    def test_delayed_task_waits(self):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            pool = MOD.StagePool(executor, 2)
+
+            def record(task, future):
+                self.finished.append(task.stage)
+
+            pool.submit(
+                MOD.StageTask(0, "later", self.work, ("later",)), record, delay=0.1
+            )
+            pool.submit(MOD.StageTask(0, "now", self.work, ("now",)), record)
+            start = time.monotonic()
+            pool.run()
+
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)
+        self.assertEqual(self.finished, ["now", "later"])
+
+
+# __END__
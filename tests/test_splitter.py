@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+import mmap
+import os
+import tempfile
+import unittest
+
+from varscan_tool import manifest, utils
+from varscan_tool import splitter as MOD
+
+
+def mpileup_lines(contig, count, start=1):
+    return [
+        "{}\t{}\tA\t10\t{}\tIIIIIIIIII\n".format(contig, pos, "." * 10)
+        for pos in range(start, start + count)
+    ]
+
+
+class ThisTestCase(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.lines = (
+            mpileup_lines("chr1", 30)
+            + mpileup_lines("chr2", 5)
+            + mpileup_lines("chrM", 5)
+        )
+        self.path = os.path.join(self.tmpdir.name, "pair.mpileup")
+        with open(self.path, "w") as fh:
+            fh.writelines(self.lines)
+        with open(self.path, "rb") as fh:
+            self.data = fh.read()
+
+    def tearDown(self):
+        super().tearDown()
+        self.tmpdir.cleanup()
+
+    def mapped(self, fn, *args):
+        with open(self.path, "rb") as fh:
+            with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return fn(mm, *args)
+
+    def read(self, spec):
+        with utils.open_mpileup(spec) as fh:
+            return fh.read()
+
+
+class Test_Slice(ThisTestCase):
+    def test_spec_round_trip(self):
+        part = MOD.Slice("/data/a@b.mpileup", 10, 25)
+
+        self.assertEqual(part.spec, "/data/a@b.mpileup@10-25")
+        self.assertEqual(MOD.parse_slice(part.spec), part)
+        self.assertEqual(MOD.byte_size(part.spec), 15)
+        self.assertEqual(MOD.source_path(part.spec), "/data/a@b.mpileup")
+        self.assertIsNone(MOD.parse_slice("/data/a@b.mpileup"))
+
+    def test_reads_and_seeks_within_the_slice(self):
+        spec = MOD.Slice(self.path, 5, 50).spec
+
+        with MOD.open_range(spec) as fh:
+            self.assertEqual(fh.read(10), self.data[5:15])
+            fh.seek(40)
+            self.assertEqual(fh.read(), self.data[45:50])
+            fh.seek(-5, os.SEEK_END)
+            self.assertEqual(fh.read(100), self.data[45:50])
+        self.assertTrue(utils.is_streamed_input(spec))
+        self.assertEqual(self.read(spec), self.data[5:50])
+
+    def test_fingerprint_of_slice_matches_its_bytes(self):
+        spec = MOD.Slice(self.path, 7, 300).spec
+        copy = os.path.join(self.tmpdir.name, "copy.mpileup")
+        with open(copy, "wb") as fh:
+            fh.write(self.data[7:300])
+
+        for sample_size in (None, 16):
+            with self.subTest(sample_size=sample_size):
+                self.assertEqual(
+                    manifest.fingerprint(spec, sample_size),
+                    manifest.fingerprint(copy, sample_size),
+                )
+
+
+class Test_cut_points(ThisTestCase):
+    def test_contig_starts(self):
+        chr2 = len("".join(self.lines[:30]))
+        chrm = chr2 + len("".join(self.lines[30:35]))
+
+        self.assertEqual(self.mapped(MOD.contig_starts), [0, chr2, chrm])
+
+    def test_cuts_at_line_starts(self):
+        cuts = self.mapped(MOD.cut_points, 4)
+
+        self.assertEqual(len(cuts), 5)
+        self.assertEqual((cuts[0], cuts[-1]), (0, len(self.data)))
+        for cut in cuts[1:-1]:
+            self.assertEqual(self.data[cut - 1 : cut], b"\n")
+            self.assertLess(abs(cut - len(self.data) * cuts.index(cut) / 4), 40)
+
+    def test_cuts_at_contig_starts(self):
+        starts = self.mapped(MOD.contig_starts)
+
+        self.assertEqual(
+            self.mapped(MOD.cut_points, 4, True), [0, starts[1], len(self.data)]
+        )
+
+    def test_more_slices_than_lines(self):
+        self.assertEqual(len(self.mapped(MOD.cut_points, 1000)), len(self.lines) + 1)
+
+
+class Test_split_mpileup(ThisTestCase):
+    def test_slices_cover_the_file(self):
+        for count, contigs in ((1, False), (3, False), (3, True)):
+            with self.subTest(count=count, contigs=contigs):
+                found = MOD.split_mpileup(self.path, count, contigs)
+                self.assertEqual(b"".join(self.read(spec) for spec in found), self.data)
+
+    def test_empty_file_is_not_split(self):
+        empty = os.path.join(self.tmpdir.name, "empty.mpileup")
+        open(empty, "w").close()
+
+        self.assertEqual(MOD.split_mpileup(empty, 4), [empty])
+
+
+# __END__
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+import gzip
+import os
+import struct
+import tempfile
+import unittest
+
+from tests.test_bgzf import read_at
+from varscan_tool import tabix as MOD
+
+
+def parse_index(data):
+    """Decode a .tbi into {contig: {"bins": {bin: chunks}, "linear": [...]}}"""
+    raw = gzip.decompress(data)
+    n_ref, fmt, col_seq, col_beg, col_end, meta, skip, l_nm = struct.unpack_from(
+        "<8i", raw, 4
+    )
+    assert raw[:4] == b"TBI\1" and fmt == MOD.TBI_VCF
+    offset = 36
+    names = raw[offset : offset + l_nm].split(b"\0")[:n_ref]
+    offset += l_nm
+    index = {}
+    for name in names:
+        (n_bin,) = struct.unpack_from("<i", raw, offset)
+        offset += 4
+        bins = {}
+        for _ in range(n_bin):
+            bin_id, n_chunk = struct.unpack_from("<Ii", raw, offset)
+            offset += 8
+            bins[bin_id] = [
+                struct.unpack_from("<2Q", raw, offset + 16 * i) for i in range(n_chunk)
+            ]
+            offset += 16 * n_chunk
+        (n_intv,) = struct.unpack_from("<i", raw, offset)
+        linear = struct.unpack_from("<{}Q".format(n_intv), raw, offset + 4)
+        offset += 4 + 8 * n_intv
+        index[name.decode()] = {"bins": bins, "linear": linear}
+    return index
+
+
+class ThisTestCase(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "merged.vcf.gz")
+        self.header = ["##fileformat=VCFv4.1\n", "#CHROM\tPOS\tID\tREF\tALT\n"]
+        self.records = [
+            "{}\t{}\t.\tAC\tA\n".format(chrom, pos)
+            for chrom in ("chr1", "chr2")
+            for pos in range(1, 2000000, 97)
+        ]
+
+    def tearDown(self):
+        super().tearDown()
+        self.tmpdir.cleanup()
+
+
+class Test_reg2bin(ThisTestCase):
+    def test_bins_match_sam_spec(self):
+        self.assertEqual(MOD.reg2bin(0, 1), 4681)
+        self.assertEqual(MOD.reg2bin(16384, 16385), 4682)
+        self.assertEqual(MOD.reg2bin(16383, 16385), 585)
+        self.assertEqual(MOD.reg2bin(0, 1 << 29), 0)
+
+
+class Test_TabixVcfWriter(ThisTestCase):
+    def test_index_locates_records(self):
+        with MOD.TabixVcfWriter(self.path, threads=2) as writer:
+            writer.writelines(self.header)
+            for line in self.records:
+                writer.write(line)
+
+        with open(self.path, "rb") as fh:
+            data = fh.read()
+        with open(self.path + ".tbi", "rb") as fh:
+            index = parse_index(fh.read())
+
+        self.assertEqual(
+            gzip.decompress(data).decode(), "".join(self.header + self.records)
+        )
+        self.assertEqual(list(index), ["chr1", "chr2"])
+        self.assertIn(MOD.META_BIN, index["chr1"]["bins"])
+
+        # The linear index entry for a window points at its first record.
+        for chrom in index:
+            linear = index[chrom]["linear"]
+            for window in (0, 5, len(linear) - 1):
+                with self.subTest(chrom=chrom, window=window):
+                    line = read_at(data, linear[window], 200).split(b"\n")[0]
+                    fields = line.decode().split("\t")
+                    self.assertEqual(fields[0], chrom)
+                    self.assertEqual((int(fields[1]) - 1) >> MOD.MIN_SHIFT, window)
+
+    def test_unsorted_records_raise_ValueError(self):
+        with self.assertRaisesRegex(ValueError, "not sorted"):
+            with MOD.TabixVcfWriter(self.path) as writer:
+                writer.write(self.records[1])
+                writer.write(self.records[0])
+        self.assertFalse(os.path.exists(self.path + ".tbi"))
+
+
+# __END__
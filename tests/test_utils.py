@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+
+import gzip
+import io
+import pathlib
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+from varscan_tool import qc
+from varscan_tool import utils as MOD
+from varscan_tool.regions import Contig
+
+HEADER = [
+    "##fileformat=VCFv4.1\n",
+    "##source=VarScan2\n",
+    '##INFO=<ID=DP,Number=1,Type=Integer,Description="Total depth">\n',
+    "#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tNORMAL\tTUMOR\n",
+]
+
+
+def record(chrom, pos):
+    return "{}\t{}\t.\tA\tC\t.\tPASS\tDP=10\tGT\t0/0\t0/1\n".format(chrom, pos)
+
+
+class ThisTestCase(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.contigs = [Contig("chr1", 1000), Contig("chr2", 500)]
+
+    def tearDown(self):
+        super().tearDown()
+        self.tmpdir.cleanup()
+
+    def write_vcf(self, name, lines):
+        path = pathlib.Path(self.tmpdir.name, name)
+        path.write_text("".join(lines))
+        return path
+
+
+class Test_merge_outputs(ThisTestCase):
+    def test_records_merged_in_reference_order(self):
+        files = [
+            self.write_vcf("b.vcf", HEADER + [record("chr2", 5), record("chr2", 50)]),
+            self.write_vcf("a.vcf", HEADER + [record("chr1", 7), record("chr2", 6)]),
+            self.write_vcf("c.vcf", HEADER + [record("chr1", 3), record("chr1", 900)]),
+        ]
+        fout = io.StringIO()
+
+        MOD.merge_outputs(files, fout, self.contigs)
+
+        records = [line for line in fout.getvalue().splitlines(True) if line[0] != "#"]
+        self.assertEqual(
+            records,
+            [
+                record("chr1", 3),
+                record("chr1", 7),
+                record("chr1", 900),
+                record("chr2", 5),
+                record("chr2", 6),
+                record("chr2", 50),
+            ],
+        )
+
+    def test_headers_reconciled_across_inputs(self):
+        extra = '##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">\n'
+        files = [
+            self.write_vcf("a.vcf", HEADER),
+            self.write_vcf("b.vcf", HEADER[:3] + [extra, HEADER[3]]),
+        ]
+        fout = io.StringIO()
+
+        MOD.merge_outputs(files, fout, self.contigs)
+
+        self.assertEqual(
+            fout.getvalue().splitlines(True),
+            HEADER[:3]
+            + [
+                extra,
+                "##contig=<ID=chr1,length=1000>\n",
+                "##contig=<ID=chr2,length=500>\n",
+                HEADER[3],
+            ],
+        )
+
+    def test_written_records_tallied(self):
+        files = [
+            self.write_vcf("a.vcf", HEADER + [record("chr1", 7), record("chr2", 6)]),
+            self.write_vcf("b.vcf", HEADER + [record("chr1", 3)]),
+        ]
+        expected = io.StringIO()
+        MOD.merge_outputs(files, expected, self.contigs)
+
+        for size in (1, 2, MOD.MERGE_BATCH_LINES):
+            with self.subTest(batch_lines=size):
+                stats = qc.VariantStats()
+                output = io.StringIO()
+                with mock.patch.object(MOD, "MERGE_BATCH_LINES", size):
+                    MOD.merge_outputs(files, output, self.contigs, stats.add_lines)
+                self.assertEqual(stats.summary()["contigs"], {"chr1": 2, "chr2": 1})
+                self.assertEqual(output.getvalue(), expected.getvalue())
+
+    def test_inconsistent_columns_raise_ValueError(self):
+        files = [
+            self.write_vcf("a.vcf", HEADER),
+            self.write_vcf("b.vcf", HEADER[:3] + ["#CHROM\tPOS\tID\n"]),
+        ]
+        with self.assertRaisesRegex(ValueError, "Inconsistent"):
+            MOD.merge_outputs(files, io.StringIO(), self.contigs)
+
+
+class Test_call_subprocess(ThisTestCase):
+    def test_stdin_source_streamed_to_command(self):
+        path = pathlib.Path(self.tmpdir.name, "in.mpileup.gz")
+        with gzip.open(path, "wb") as fh:
+            fh.write(b"chr1\t1\tA\n" * 100000)
+
+        with MOD.open_mpileup(str(path)) as source:
+            found = MOD.call_subprocess(
+                "wc -l", stdin_source=source, stdout=subprocess.PIPE
+            )
+
+        self.assertEqual(found.retcode, 0)
+        self.assertEqual(found.stdout.strip(), "100000")
+
+    def test_stdin_source_failure_fails_command(self):
+        path = pathlib.Path(self.tmpdir.name, "corrupt.mpileup.gz")
+        path.write_bytes(b"not gzip data")
+
+        with MOD.open_mpileup(str(path)) as source:
+            found = MOD.call_subprocess(
+                "cat",
+                stdin_source=source,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
+
+        self.assertEqual(found.retcode, 1)
+        self.assertIn("stdin feed failed", found.stderr)
+
+    def test_is_streamed_input(self):
+        for path, expected in (
+            ("-", True),
+            ("a.mpileup.gz", True),
+            ("a.mpileup.bgz", True),
+            ("a.mpileup", False),
+        ):
+            with self.subTest(path=path):
+                self.assertEqual(MOD.is_streamed_input(path), expected)
+
+    def test_output_streamed_to_log_with_bounded_tail(self):
+        log_path = pathlib.Path(self.tmpdir.name, "chunk.log")
+
+        with self.assertLogs(MOD.logger, level="DEBUG") as logs:
+            found = MOD.call_subprocess(
+                "sh -c 'seq 1 1000; echo oops >&2'",
+                log_path=str(log_path),
+                tail_lines=3,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
+
+        self.assertEqual(found.retcode, 0)
+        self.assertEqual(found.stdout, "998\n999\n1000\n")
+        self.assertEqual(found.stderr, "oops\n")
+        log = log_path.read_text().splitlines()
+        self.assertEqual(len(log), 1002)
+        self.assertTrue(log[0].startswith("==> "))
+        self.assertIn("[stderr] oops", log)
+        self.assertIn("DEBUG:varscan_tool.utils:stdout: 1", logs.output)
+
+    def test_retried_attempts_appended_to_log(self):
+        log_path = pathlib.Path(self.tmpdir.name, "chunk.log")
+
+        for attempt in range(2):
+            MOD.call_subprocess(
+                "sh -c 'echo attempt {}'".format(attempt),
+                log_path=str(log_path),
+                stdout=subprocess.PIPE,
+            )
+
+        log = log_path.read_text().splitlines()
+        self.assertEqual([line for line in log if "attempt:" in line], log[::2])
+        self.assertEqual(log[1::2], ["[stdout] attempt 0", "[stdout] attempt 1"])
+
+    def test_oom_found_before_tail(self):
+        found = MOD.call_subprocess(
+            "sh -c 'echo java.lang.OutOfMemoryError >&2; seq 1 10 >&2; exit 1'",
+            tail_lines=3,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+
+        self.assertNotIn(MOD.OOM_MARKER, found.stderr)
+        self.assertEqual(MOD.classify_failure(found), MOD.OOM)
+
+    def test_resource_usage_is_reported(self):
+        with MOD.collect_usage() as collected:
+            found = MOD.call_subprocess("sh -c 'exit 3'")
+
+        self.assertEqual(found.retcode, 3)
+        self.assertEqual(collected, [found.usage])
+        if found.usage is not None:
+            self.assertGreater(found.usage.max_rss, 0)
+            self.assertGreater(found.usage.wall, 0)
+
+    def test_timeout_is_reported(self):
+        found = MOD.call_subprocess("sleep 5", timeout=0.1)
+
+        self.assertTrue(found.timed_out)
+        self.assertEqual(MOD.classify_failure(found), MOD.TIMEOUT)
+
+
+class Test_classify_failure(ThisTestCase):
+    def test_classify_failure(self):
+        for cmd_return, expected in (
+            (MOD.PopenReturn(0, "", ""), None),
+            (MOD.PopenReturn(137, "", ""), MOD.ERROR),
+            (MOD.PopenReturn(1, "", "java.lang.OutOfMemoryError: heap"), MOD.OOM),
+            (MOD.PopenReturn(-9, "", "", timed_out=True), MOD.TIMEOUT),
+            (MOD.PopenReturn(-9, "", ""), MOD.ERROR),
+            (MOD.PopenReturn(-9, "", "", oom_killed=True), MOD.OOM),
+            (MOD.PopenReturn(1, "", "", out_of_memory=True), MOD.OOM),
+            (MOD.PopenReturn(1, "", "Exception"), MOD.ERROR),
+        ):
+            with self.subTest(cmd_return=cmd_return):
+                self.assertEqual(MOD.classify_failure(cmd_return), expected)
+
+    def test_sigkill_is_oom_only_with_cgroup_oom_kills(self):
+        for before, after, retcode, expected in (
+            (2, 3, -9, True),
+            (2, 2, -9, False),
+            (2, 3, 1, False),
+            (None, 3, -9, False),
+            (2, None, -9, False),
+        ):
+            with self.subTest(before=before, after=after, retcode=retcode):
+                with mock.patch.object(MOD.resources, "oom_kills", return_value=after):
+                    found = MOD.oom_killed_since(before, retcode)
+                self.assertEqual(found, expected)
+
+
+class Test_fifo_readers(ThisTestCase):
+    def test_readers_consume_command_output(self):
+        paths = [pathlib.Path(self.tmpdir.name, name) for name in ("a", "b")]
+        found = {}
+
+        def reader(path, fh):
+            found[path] = fh.read()
+
+        with MOD.fifo_readers([str(p) for p in paths], reader):
+            MOD.call_subprocess(
+                "sh -c 'seq 20000 > {}; echo done > {}'".format(*paths),
+                stdout=subprocess.PIPE,
+            )
+
+        self.assertEqual(
+            found[str(paths[0])].split(), [str(i) for i in range(1, 20001)]
+        )
+        self.assertEqual(found[str(paths[1])], "done\n")
+        self.assertFalse(any(p.exists() for p in paths))
+
+    def test_failed_reader_does_not_block_writer(self):
+        path = str(pathlib.Path(self.tmpdir.name, "a"))
+
+        def reader(path, fh):
+            fh.readline()
+            raise ValueError("bad record")
+
+        with self.assertRaisesRegex(ValueError, "bad record"):
+            with MOD.fifo_readers([path], reader):
+                cmd_return = MOD.call_subprocess(
+                    "sh -c 'seq 100000 > {}'".format(path),
+                    timeout=30,
+                    stdout=subprocess.PIPE,
+                )
+        self.assertEqual(cmd_return.retcode, 0)
+
+
+# __END__
@@ -1,10 +1,12 @@
 #!/usr/bin/env python3
 import os
+import tempfile
 import unittest
 from types import SimpleNamespace
 from unittest import mock
 
 from varscan_tool import varscan as MOD
+from varscan_tool.varscan_somatic_process import SomaticProcess
 
 
 class ThisTestCase(unittest.TestCase):
@@ -24,12 +26,13 @@ class Test_Varscan2(ThisTestCase):
         self.mocks = SimpleNamespace(
             os=mock.MagicMock(spec_set=os),
             SOMATIC=mock.MagicMock(spec_set=MOD.VarscanSomatic),
-            PROCESS=mock.MagicMock(spec_set=MOD.SomaticProcess),
+            PROCESS=mock.MagicMock(spec_set=SomaticProcess),
         )
 
         self.somatic_mock = mock.MagicMock(spec_set=MOD.VarscanSomatic)
-        self.process_mock = mock.MagicMock(spec_set=MOD.SomaticProcess)
+        self.process_mock = mock.MagicMock(spec_set=SomaticProcess)
 
+        self.mocks.os.path.join.side_effect = os.path.join
         self.mocks.SOMATIC.return_value = self.somatic_mock
         self.mocks.PROCESS.return_value.__enter__.return_value = self.process_mock
 
@@ -39,7 +42,9 @@ class Test_Varscan2(ThisTestCase):
             min_tumor_freq=0.5,
             max_normal_freq=0.3,
             vps_p_value=0.05,
+            workdir="work",
         )
+        self.process_args = {k: v for k, v in vars(self.args).items() if k != "workdir"}
 
     def tearDown(self):
         super().tearDown()
@@ -62,7 +67,7 @@ class Test_Varscan2(ThisTestCase):
         self.mocks.SOMATIC.assert_called_once_with()
         self.somatic_mock.run.assert_called_once_with(
             mpileup,
-            mock_basename,
+            os.path.join("work", mock_basename),
         )
 
     def test_varscan_process_somatic_called_as_expected(self):
@@ -81,11 +86,11 @@ class Test_Varscan2(ThisTestCase):
         )
 
         expected_process_calls = (
-            mock.call("{}.snp.vcf".format(mock_basename)),
-            mock.call("{}.indel.vcf".format(mock_basename)),
+            mock.call("work/{}.snp.vcf".format(mock_basename)),
+            mock.call("work/{}.indel.vcf".format(mock_basename)),
         )
 
-        self.mocks.PROCESS.assert_called_once_with(**vars(self.args))
+        self.mocks.PROCESS.assert_called_once_with(**self.process_args)
         self.process_mock.run.assert_has_calls(expected_process_calls)
 
     def test_varscan_returns_as_expected(self):
@@ -95,8 +100,8 @@ class Test_Varscan2(ThisTestCase):
         self.mocks.os.path.basename.return_value = mock_basename
 
         expected = MOD.VarscanReturn(
-            snp_file="{}.snp.vcf".format(mock_basename),
-            indel_file="{}.indel.vcf".format(mock_basename),
+            snp_file="work/{}.snp.vcf".format(mock_basename),
+            indel_file="work/{}.indel.vcf".format(mock_basename),
             mpileup=mpileup,
             idx=idx,
         )
@@ -111,5 +116,59 @@ class Test_Varscan2(ThisTestCase):
         )
         self.assertEqual(found, expected)
 
+    def test_run_process_runs_single_vcf(self):
+        input_vcf = "base.snp.vcf"
+
+        found = self.CLASS_OBJ.run_process(
+            input_vcf, self.args, _process=self.mocks.PROCESS
+        )
+
+        self.mocks.PROCESS.assert_called_once_with(**self.process_args)
+        self.process_mock.run.assert_called_once_with(input_vcf)
+        self.assertIsNone(found)
+
+
+class Test_run_somatic_streamed(ThisTestCase):
+    RECORD = (
+        "chr1\t{}\t.\tA\tC\t.\tPASS\tDP=60;SS={};SPV=1E-4;GPV=1\t"
+        "GT:GQ:DP:RD:AD:FREQ\t0/0:.:30:30:0:0%\t0/1:.:30:15:15:50%\n"
+    )
+
+    def test_processes_somatic_output_through_pipes(self):
+        record = self.RECORD
+
+        class Somatic:
+            def run(self, mpileup, output_base, **kwargs):
+                for kind in ("snp", "indel"):
+                    with open("{}.{}.vcf".format(output_base, kind), "w") as fh:
+                        fh.write("#CHROM\n")
+                        fh.write(record.format(1, 2) + record.format(2, 1))
+
+        with tempfile.TemporaryDirectory() as workdir:
+            args = SimpleNamespace(
+                workdir=workdir,
+                timeout=None,
+                varscan_jar="varscan.jar",
+                min_tumor_freq=0.1,
+                max_normal_freq=0.05,
+                vps_p_value=0.07,
+            )
+
+            found = MOD.Varscan2.run_somatic_streamed(
+                "/data/chunk.mpileup", args, _somatic=Somatic
+            )
+
+            base = os.path.join(workdir, "chunk.mpileup")
+            self.assertEqual(found, (base + ".snp.vcf", base + ".indel.vcf"))
+            self.assertEqual(
+                sorted(os.listdir(workdir)),
+                [
+                    "chunk.mpileup.indel.Somatic.hc.vcf",
+                    "chunk.mpileup.snp.Somatic.hc.vcf",
+                ],
+            )
+            with open(base + ".snp.Somatic.hc.vcf") as fh:
+                self.assertEqual(fh.read(), "#CHROM\n" + record.format(1, 2))
+
 
 # __END__
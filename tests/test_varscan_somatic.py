@@ -42,6 +42,7 @@ class Test_VarscanSomatic(ThisTestCase):
             retcode=0, stdout="stdout", stderr="stderr"
         )
         self.mocks.UTILS.call_subprocess.return_value = self.process_return
+        self.mocks.UTILS.is_streamed_input.return_value = False
 
     def tearDown(self):
         super().tearDown()
@@ -68,15 +69,94 @@ class Test_VarscanSomatic(ThisTestCase):
         mpileup = "mpileup"
         attrs.update({"output_base": output_base, "mpileup": mpileup})
 
-        expected_cmd = self.CLASS_OBJ.COMMAND.format(**attrs)
+        expected_cmd = self.CLASS_OBJ.COMMAND.format(
+            jvm_flags=MOD.DEFAULT_JVM_FLAGS, **attrs
+        )
         obj = self.CLASS_OBJ(_utils=self.mocks.UTILS)
         obj.run(mpileup, output_base)
 
         self.mocks.UTILS.call_subprocess.assert_called_once_with(
             expected_cmd,
             timeout,
+            log_path="out.somatic.log",
+            stdout=MOD.PIPE,
+            stderr=MOD.PIPE,
+        )
+
+    def test_jvm_settings_override_heap_and_flags(self):
+        self.CLASS_OBJ.set_attributes(SimpleNamespace(**self.attrs))
+        jvm = MOD.JvmSettings(heap="1536M", flags="-XX:+UseParallelGC")
+
+        attrs = self.attrs.copy()
+        attrs.update(
+            validation="", output_base="out", mpileup="mpileup", java_opts=jvm.heap
+        )
+        expected_cmd = self.CLASS_OBJ.COMMAND.format(jvm_flags=jvm.flags, **attrs)
+        obj = self.CLASS_OBJ(_utils=self.mocks.UTILS)
+        obj.run("mpileup", "out", jvm=jvm)
+
+        self.mocks.UTILS.call_subprocess.assert_called_once_with(
+            expected_cmd,
+            None,
+            log_path="out.somatic.log",
+            stdout=MOD.PIPE,
+            stderr=MOD.PIPE,
+        )
+
+    def test_compressed_mpileup_streamed_to_stdin(self):
+        self.CLASS_OBJ.set_attributes(SimpleNamespace(**self.attrs))
+        self.mocks.UTILS.is_streamed_input.return_value = True
+        stream = self.mocks.UTILS.open_mpileup.return_value
+
+        attrs = self.attrs.copy()
+        attrs["validation"] = ""
+        output_base = "out"
+        mpileup = "mpileup.gz"
+        attrs.update({"output_base": output_base, "mpileup": MOD.STREAM_PATH})
+
+        expected_cmd = self.CLASS_OBJ.COMMAND.format(
+            jvm_flags=MOD.DEFAULT_JVM_FLAGS, **attrs
+        )
+        obj = self.CLASS_OBJ(_utils=self.mocks.UTILS)
+        obj.run(mpileup, output_base)
+
+        self.mocks.UTILS.open_mpileup.assert_called_once_with(mpileup)
+        self.mocks.UTILS.call_subprocess.assert_called_once_with(
+            expected_cmd,
+            None,
+            log_path="out.somatic.log",
             stdout=MOD.PIPE,
             stderr=MOD.PIPE,
+            stdin_source=stream,
+        )
+        stream.close.assert_called_once_with()
+
+    def test_prefilter_streams_plain_mpileup(self):
+        self.CLASS_OBJ.set_attributes(SimpleNamespace(**self.attrs, prefilter=True))
+        stream = self.mocks.UTILS.open_mpileup.return_value
+
+        obj = self.CLASS_OBJ(_utils=self.mocks.UTILS)
+        obj.run("mpileup", "out")
+
+        args, kwargs = self.mocks.UTILS.call_subprocess.call_args
+        stdin_source = kwargs["stdin_source"]
+        self.assertIn("somatic {} out".format(MOD.STREAM_PATH), args[0])
+        self.assertIsInstance(stdin_source, MOD.prefilter.PrefilteredReader)
+        self.assertIs(stdin_source.source, stream)
+        self.assertEqual(stdin_source.thresholds, (3, 4))
+        stream.close.assert_called_once_with()
+
+    def test_prefilter_off_in_validation_mode(self):
+        attrs = dict(self.attrs, prefilter=True, validation=True)
+        self.CLASS_OBJ.set_attributes(SimpleNamespace(**attrs))
+
+        obj = self.CLASS_OBJ(_utils=self.mocks.UTILS)
+        obj.run("mpileup", "out")
+
+        self.assertFalse(obj.prefiltering)
+        self.mocks.UTILS.open_mpileup.assert_not_called()
+        self.assertNotIn(
+            "stdin_source", self.mocks.UTILS.call_subprocess.call_args.kwargs
         )
 
     def test_run_raises_ValueError_with_failed_command(self):
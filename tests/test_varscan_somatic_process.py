@@ -1,5 +1,8 @@
 #!/usr/bin/env python3
 
+import os
+import shutil
+import tempfile
 import unittest
 from types import SimpleNamespace
 from unittest import mock
@@ -57,13 +60,18 @@ class Test_SomaticProcess(ThisTestCase):
         timeout = 3600
         input_vcf = "input.vcf"
         expected_command = self.CLASS_OBJ.COMMAND.format(
-            input_vcf=input_vcf, timeout=timeout, **args_dict
+            input_vcf=input_vcf,
+            timeout=timeout,
+            heap=self.CLASS_OBJ.HEAP,
+            jvm_flags=MOD.DEFAULT_JVM_FLAGS,
+            **args_dict,
         )
         obj = self.CLASS_OBJ(**args_dict, timeout=timeout, _utils=self.mocks.UTILS)
         found = obj.run(input_vcf)
         self.mocks.UTILS.call_subprocess.assert_called_once_with(
             expected_command,
             timeout,
+            log_path="input.process.log",
             stdout=MOD.PIPE,
             stderr=MOD.PIPE,
         )
@@ -79,7 +87,11 @@ class Test_SomaticProcess(ThisTestCase):
         timeout = 3600
         input_vcf = "input.vcf"
         expected_command = self.CLASS_OBJ.COMMAND.format(
-            input_vcf=input_vcf, timeout=timeout, **args_dict
+            input_vcf=input_vcf,
+            timeout=timeout,
+            heap=self.CLASS_OBJ.HEAP,
+            jvm_flags=MOD.DEFAULT_JVM_FLAGS,
+            **args_dict,
         )
         with self.CLASS_OBJ(
             **args_dict, timeout=timeout, _utils=self.mocks.UTILS
@@ -88,11 +100,40 @@ class Test_SomaticProcess(ThisTestCase):
         self.mocks.UTILS.call_subprocess.assert_called_once_with(
             expected_command,
             timeout,
+            log_path="input.process.log",
             stdout=MOD.PIPE,
             stderr=MOD.PIPE,
         )
         self.assertIsNone(found)
 
+    def test_command_passes_max_normal_freq(self):
+        obj = self.CLASS_OBJ(
+            timeout=None,
+            varscan_jar="/path/to/varscan.jar",
+            min_tumor_freq=0.1,
+            max_normal_freq=0.99,
+            vps_p_value=0.05,
+        )
+
+        self.assertIn("--max-normal-freq 0.99", obj.command("input.vcf"))
+
+    def test_heap_and_flags_set_per_instance(self):
+        args_dict = dict(
+            varscan_jar="/path/to/varscan.jar",
+            min_tumor_freq=0.1,
+            max_normal_freq=0.99,
+            vps_p_value=0.05,
+            heap="384M",
+            jvm_flags="-XX:+UseParallelGC -XX:TieredStopAtLevel=1",
+        )
+        obj = self.CLASS_OBJ(**args_dict, timeout=None, _utils=self.mocks.UTILS)
+        obj.run("input.vcf")
+
+        command = self.mocks.UTILS.call_subprocess.call_args[0][0]
+        self.assertIn("-Xmx384M", command)
+        self.assertIn(args_dict["jvm_flags"], command)
+        self.assertNotIn("-XX:+UseSerialGC", command)
+
     def test_ValueError_raised_on_command_error(self):
         mock_return = MOD.utils.PopenReturn(retcode=1, stdout=None, stderr=None)
         self.mocks.UTILS.call_subprocess.return_value = mock_return
@@ -126,4 +167,115 @@ class Test_SomaticProcess(ThisTestCase):
                 obj.run(input_vcf)
 
 
+class Test_NativeSomaticProcess(ThisTestCase):
+    CLASS_OBJ = MOD.NativeSomaticProcess
+    DATA = os.path.join(os.path.dirname(__file__), "data")
+
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.args = dict(
+            timeout=None,
+            varscan_jar="/path/to/varscan.jar",
+            min_tumor_freq=0.1,
+            max_normal_freq=0.05,
+            vps_p_value=0.07,
+        )
+
+    def tearDown(self):
+        super().tearDown()
+        self.tmpdir.cleanup()
+
+    def run_fixture(self, name):
+        input_vcf = os.path.join(self.tmpdir.name, name)
+        shutil.copy(os.path.join(self.DATA, name), input_vcf)
+        with self.CLASS_OBJ(**self.args, _utils=self.mocks.UTILS) as obj:
+            found = obj.run(input_vcf)
+        self.assertIsNone(found)
+        outputs = {}
+        for status in MOD.STATUSES:
+            for category in (status, status + ".hc"):
+                with open(MOD.output_path(input_vcf, category)) as fh:
+                    outputs[category] = [
+                        tuple(line.split("\t")[:2])
+                        for line in fh
+                        if not line.startswith("#")
+                    ]
+        return outputs
+
+    def test_snps_split_by_status_and_confidence(self):
+        found = self.run_fixture("sample.snp.vcf")
+
+        expected = {
+            "Somatic": [
+                ("chr1", "100"),
+                ("chr1", "200"),
+                ("chr1", "300"),
+                ("chr1", "400"),
+            ],
+            "Somatic.hc": [("chr1", "100")],
+            "Germline": [("chr1", "500"), ("chr1", "600")],
+            "Germline.hc": [("chr1", "500")],
+            "LOH": [("chr2", "100"), ("chr2", "200")],
+            "LOH.hc": [("chr2", "100")],
+        }
+        self.assertEqual(found, expected)
+        self.mocks.UTILS.call_subprocess.assert_not_called()
+
+    def test_outputs_keep_input_header(self):
+        self.run_fixture("sample.indel.vcf")
+
+        input_vcf = os.path.join(self.tmpdir.name, "sample.indel.vcf")
+        with open(input_vcf) as fh:
+            header = [line for line in fh if line.startswith("#")]
+        with open(MOD.output_path(input_vcf, "Somatic.hc")) as fh:
+            lines = fh.readlines()
+        self.assertEqual(lines[: len(header)], header)
+        self.assertEqual(len(lines), len(header) + 1)
+
+    def test_only_requested_categories_are_written(self):
+        input_vcf = os.path.join(self.tmpdir.name, "sample.snp.vcf")
+        shutil.copy(os.path.join(self.DATA, "sample.snp.vcf"), input_vcf)
+
+        with self.CLASS_OBJ(**self.args) as obj:
+            obj.run(input_vcf, categories=("Somatic.hc",))
+
+        written = sorted(os.listdir(self.tmpdir.name))
+        self.assertEqual(written, ["sample.snp.Somatic.hc.vcf", "sample.snp.vcf"])
+        with open(MOD.output_path(input_vcf, "Somatic.hc")) as fh:
+            records = [line for line in fh if not line.startswith("#")]
+        self.assertEqual([r.split("\t")[1] for r in records], ["100"])
+
+    def test_thresholds_apply_to_reported_freq(self):
+        def record(normal, tumor):
+            return "\t".join(
+                (
+                    "chr1\t100\t.\tA\tG\t.\tPASS\tSS=2;GPV=1.0;SPV=0.01",
+                    "GT:GQ:DP:RD:AD:FREQ",
+                    "0/0:.:{}:{}:{}:{}".format(sum(normal[:2]), *normal),
+                    "0/1:.:{}:{}:{}:{}\n".format(sum(tumor[:2]), *tumor),
+                )
+            )
+
+        cases = (
+            # RD/AD below min_tumor_freq, FREQ rounded up onto it
+            ((30, 0, "0%"), (9001, 999, "10%"), True),
+            # RD/AD above max_normal_freq, FREQ rounded down onto it
+            ((9499, 500, "5%"), (20, 20, "50%"), True),
+            # No FREQ: the read counts decide
+            ((30, 0, "."), (9001, 999, "."), False),
+        )
+        with self.CLASS_OBJ(**self.args) as obj:
+            for normal, tumor, hc in cases:
+                with self.subTest(normal=normal, tumor=tumor):
+                    self.assertEqual(
+                        obj.classify(record(normal, tumor)), ("Somatic", hc)
+                    )
+
+    def test_output_path(self):
+        self.assertEqual(
+            MOD.output_path("base.snp.vcf", "Somatic.hc"), "base.snp.Somatic.hc.vcf"
+        )
+
+
 # __END__
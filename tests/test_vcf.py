@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+import io
+import unittest
+
+from varscan_tool import vcf as MOD
+
+HEADER = [
+    "##fileformat=VCFv4.1\n",
+    "#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tNORMAL\tTUMOR\n",
+]
+SOMATIC = (
+    "chr1\t100\t.\tA\tC\t.\tPASS\tDP=60;SOMATIC;SS=2;SSC=40;GPV=1E0;SPV=1.5E-4\t"
+    "GT:GQ:DP:RD:AD:FREQ\t0/0:.:30:30:0:0%\t0/1:.:30:20:10:33.33%\n"
+)
+INDEL = (
+    "chr2\t7\t.\tA\tAT\t.\tPASS\tDP=40;SS=1;SSC=0;GPV=1E-10;SPV=1E0\t"
+    "GT:GQ:DP:FREQ\t0/1:.:20:50%\t0/1:.:20:45%\n"
+)
+
+
+class ThisTestCase(unittest.TestCase):
+    def read(self, lines):
+        return MOD.VcfReader(io.StringIO("".join(lines)))
+
+
+class Test_VcfRecord(ThisTestCase):
+    def test_parses_columns_on_demand(self):
+        record = MOD.VcfRecord(SOMATIC)
+
+        self.assertEqual((record.chrom, record.pos), ("chr1", 100))
+        self.assertIsNone(record._fields)
+        self.assertEqual((record.ref, record.alt, record.is_indel), ("A", "C", False))
+        self.assertIsNone(record._info)
+        self.assertEqual(record.ss, "2")
+        self.assertEqual(record.info["SOMATIC"], "")
+        self.assertEqual((record.gpv, record.spv), (1.0, 1.5e-4))
+        self.assertEqual(record.line, SOMATIC)
+
+    def test_samples(self):
+        record = MOD.VcfRecord(SOMATIC)
+
+        self.assertEqual(record.sample(MOD.TUMOR)["FREQ"], "33.33%")
+        self.assertEqual(record.depths(MOD.NORMAL), (30, 0))
+        self.assertEqual(record.depths(MOD.TUMOR), (20, 10))
+        self.assertAlmostEqual(record.freq(MOD.TUMOR), 1 / 3)
+
+    def test_freq_falls_back_to_FREQ(self):
+        record = MOD.VcfRecord(INDEL)
+
+        self.assertTrue(record.is_indel)
+        self.assertIsNone(record.depths(MOD.TUMOR))
+        self.assertAlmostEqual(record.freq(MOD.TUMOR), 0.45)
+        self.assertEqual(record.spv, 1.0)
+
+    def test_missing_p_values_are_1(self):
+        record = MOD.VcfRecord("chr1\t5\t.\tA\tC\t.\tPASS\tDP=3\tGT\t0/0\t0/1\n")
+
+        self.assertEqual((record.ss, record.gpv, record.spv), ("", 1.0, 1.0))
+
+
+class Test_VcfReader(ThisTestCase):
+    def test_header_and_records(self):
+        reader = self.read(HEADER + [SOMATIC, INDEL])
+
+        self.assertEqual(reader.header, HEADER)
+        self.assertEqual([r.line for r in reader], [SOMATIC, INDEL])
+
+    def test_header_only(self):
+        reader = self.read(HEADER)
+
+        self.assertEqual(reader.header, HEADER)
+        self.assertEqual(list(reader), [])
+
+
+class Test_read_columns(ThisTestCase):
+    def test_batches(self):
+        records = self.read(HEADER + [SOMATIC, INDEL, SOMATIC])
+
+        found = list(MOD.read_columns(records, batch_records=2))
+
+        self.assertEqual([len(batch) for batch in found], [2, 1])
+        first = found[0]
+        self.assertEqual(first.chroms, ["chr1", "chr2"])
+        self.assertEqual(list(first.chrom), [0, 1])
+        self.assertEqual(list(first.pos), [100, 7])
+        self.assertEqual(list(first.ss), [2, 1])
+        self.assertEqual(list(first.gpv), [1.0, 1e-10])
+        self.assertEqual(list(first.spv), [1.5e-4, 1.0])
+        self.assertEqual(list(first.normal_rd), [30, -1])
+        self.assertEqual(list(first.tumor_ad), [10, -1])
+        self.assertEqual(found[1].chroms, ["chr1"])
+
+    def test_no_status(self):
+        record = MOD.VcfRecord("chr1\t5\t.\tA\tC\t.\tPASS\tDP=3\tGT\t0/0\t0/1\n")
+
+        (found,) = MOD.read_columns([record])
+
+        self.assertEqual(list(found.ss), [MOD.NO_STATUS])
+
+
+# __END__
@@ -1,18 +1,156 @@
 #!/usr/bin/env python3
 
+import json
+import os
+import subprocess
+import sys
+import tempfile
 import unittest
+from unittest import mock
 
 from click.testing import CliRunner
+
 from varscan_tool import __main__ as MOD
 
+HEADER = (
+    "##fileformat=VCFv4.1\n"
+    "#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tNORMAL\tTUMOR\n"
+)
+
+
+def record(chrom, pos, ss="2"):
+    return (
+        "{}\t{}\t.\tA\tG\t.\tPASS\tDP=60;SS={};SPV=1E-4;GPV=1E0\t"
+        "GT:GQ:DP:RD:AD:FREQ\t0/0:.:30:30:0:0%\t0/1:.:30:20:10:33.33%\n"
+    ).format(chrom, pos, ss)
+
 
 class ThisTestCase(unittest.TestCase):
     def setUp(self) -> None:
         self.runner = CliRunner()
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.tmpdir.name, name)
+
+    def write_vcf(self, name, records):
+        with open(self.path(name), "w") as fh:
+            fh.write(HEADER + "".join(records))
+        return self.path(name)
 
     def test_pass(self):
         result = self.runner.invoke(MOD.main)
         self.assertEqual(result.exit_code, 0)
 
 
+class Test_main(ThisTestCase):
+    def test_version(self):
+        result = self.runner.invoke(MOD.main, ["--version"])
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn(MOD.__version__, result.output)
+
+    def test_pipeline_not_imported_at_start(self):
+        code = (
+            "import sys\n"
+            "import varscan_tool.__main__\n"
+            "print(' '.join(m for m in sys.modules if m.startswith('varscan_tool')))\n"
+        )
+        found = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=os.path.dirname(os.path.dirname(MOD.__file__)),
+            check=True,
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+        ).stdout.split()
+
+        for module in ("multi_varscan", "utils", "qc", "bench"):
+            with self.subTest(module=module):
+                self.assertNotIn("varscan_tool." + module, found)
+
+
+class Test_forwarded(ThisTestCase):
+    def test_arguments_forwarded(self):
+        for command, module, expected in (
+            ("run", "multi_varscan", ["--mpileup", "a", "--help"]),
+            ("plan", "multi_varscan", ["--plan", "--mpileup", "a", "--help"]),
+            ("bench", "bench.run", ["--mpileup", "a", "--help"]),
+        ):
+            with self.subTest(command=command):
+                target = "varscan_tool.{}.main".format(module)
+                with mock.patch(target, return_value=3) as main:
+                    result = self.runner.invoke(
+                        MOD.main, [command, "--mpileup", "a", "--help"]
+                    )
+
+                main.assert_called_once_with(expected)
+                self.assertEqual(result.exit_code, 3)
+
+
+class Test_merge(ThisTestCase):
+    def test_merged_with_qc(self):
+        first = self.write_vcf("a.vcf", [record("chr1", 5), record("chr2", 1)])
+        second = self.write_vcf("b.vcf", [record("chr1", 9)])
+        output = self.path("merged.vcf")
+
+        result = self.runner.invoke(MOD.main, ["merge", "-o", output, second, first])
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        with open(output) as fh:
+            self.assertEqual(
+                [line for line in fh if not line.startswith("#")],
+                [record("chr1", 5), record("chr1", 9), record("chr2", 1)],
+            )
+        with open(self.path("merged.qc.json")) as fh:
+            self.assertEqual(json.load(fh)["contigs"], {"chr1": 2, "chr2": 1})
+        self.assertTrue(os.path.exists(self.path("merged.qc.tsv")))
+
+    def test_no_qc(self):
+        vcf = self.write_vcf("a.vcf", [record("chr1", 5)])
+
+        result = self.runner.invoke(
+            MOD.main, ["merge", "--no-qc", "-o", self.path("merged.vcf"), vcf]
+        )
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(sorted(os.listdir(self.tmpdir.name)), ["a.vcf", "merged.vcf"])
+
+
+class Test_process(ThisTestCase):
+    def test_defaults_match_multi_varscan(self):
+        from varscan_tool import multi_varscan, varscan_somatic_process
+
+        args = multi_varscan.process_argv(["--mpileup", "a", "--ref-dict", "r"])
+        found = {param.name: param.default for param in MOD.process.params}
+
+        for name, option in (
+            ("backend", "process_backend"),
+            ("varscan_jar", "varscan_jar"),
+            ("min_tumor_freq", "min_tumor_freq"),
+            ("max_normal_freq", "max_normal_freq"),
+            ("vps_p_value", "vps_p_value"),
+        ):
+            with self.subTest(name=name):
+                self.assertEqual(found[name], getattr(args, option))
+        self.assertEqual(
+            tuple(varscan_somatic_process.PROCESS_BACKENDS),
+            MOD.defaults.PROCESS_BACKENDS,
+        )
+
+    def test_native_backend(self):
+        vcf = self.write_vcf(
+            "chunk.snp.vcf", [record("chr1", 5), record("chr1", 9, "1")]
+        )
+
+        result = self.runner.invoke(MOD.main, ["process", "--backend", "native", vcf])
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        with open(self.path("chunk.snp.Somatic.hc.vcf")) as fh:
+            self.assertEqual(fh.read(), HEADER + record("chr1", 5))
+        self.assertTrue(os.path.exists(self.path("chunk.snp.Germline.vcf")))
+
+
 # __END__
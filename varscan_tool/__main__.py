@@ -1,81 +1,189 @@
-#!/usr/bin/env python
+#!/usr/bin/env python3
 """
-Python Project Template Entrypoint Script
+varscan_tool command line.
+
+Subcommands import the modules they need only when they run, so that
+--version, --help and small subcommands such as merge start without
+loading the pipeline.
 """
 
-import datetime
-import logging
 import sys
 
 import click
 
-try:
-    from varscan_tool import __version__
-except Exception:
-    __version__ = "0.0.0"
+from varscan_tool import __version__, defaults
 
-log = logging.getLogger(__name__)
+LOG_FORMAT = "%(asctime)s %(name)s:%(lineno)s %(levelname)s | %(message)s"
+# Subcommands passing their arguments, --help included, to another parser.
+FORWARDED = {"ignore_unknown_options": True, "help_option_names": []}
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s %(name)s:%(lineno)s %(levelname)s | %(message)s",
-)
 
+def setup_logging() -> None:
+    import logging
 
-def run() -> int:
-    """Method for running script logic.
+    logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
 
-    Accepts:
-        run_args (namespace): Collection of parsed arguments
-    Returns:
-        ret_code (int): Return code for sys.exit()
-    """
 
-    ret_val = 0
+def qc_prefix(output: str) -> str:
+    """Path of the QC summaries of a merged VCF, without .qc.json/.qc.tsv"""
+    for suffix in (".vcf.gz", ".vcf"):
+        if output.endswith(suffix):
+            return output[: -len(suffix)]
+    return output
 
-    start_time = datetime.datetime.now()
 
-    log.info("Running process...")
+@click.group(invoke_without_command=True)
+@click.version_option(version=__version__)
+@click.pass_context
+def main(ctx: click.Context) -> None:
+    """VarScan2 somatic calling on chunks of tumor/normal mpileups."""
+    if ctx.invoked_subcommand is None:
+        click.echo(ctx.get_help())
 
-    # Log runtime info
-    end_time = datetime.datetime.now()
-    run_time = end_time - start_time
-    log.info("Run time: %d seconds", run_time.seconds)
-    return ret_val
 
+@main.command(context_settings=FORWARDED)
+@click.argument("argv", nargs=-1, type=click.UNPROCESSED)
+@click.pass_context
+def run(ctx: click.Context, argv) -> None:
+    """Call variants; `run --help` lists the options."""
+    from varscan_tool import multi_varscan
 
-@click.command()
-@click.version_option(version=__version__)
-# Add new cli args, e.g.:
-# @click.option("--foo")
-# @click.option("--bar")
-# def main(foo: str, bar: int):
-def main() -> int:
-    """Main Entrypoint."""
-    exit_code = 0
-    args = sys.argv
-
-    log.info("Version: %s", __version__)
-    log.info("Process called with %s", args)
-
-    try:
-        exit_code = run()
-    except Exception as e:
-        log.exception(e)
-        exit_code = 1
-    return exit_code
+    ctx.exit(multi_varscan.main(list(argv)))
+
+
+@main.command(context_settings=FORWARDED)
+@click.argument("argv", nargs=-1, type=click.UNPROCESSED)
+@click.pass_context
+def plan(ctx: click.Context, argv) -> None:
+    """Print the predicted cost of a run given the options of `run`."""
+    from varscan_tool import multi_varscan
+
+    ctx.exit(multi_varscan.main(["--plan"] + list(argv)))
+
+
+@main.command()
+@click.option(
+    "--output",
+    "-o",
+    required=True,
+    help="Merged VCF; a .vcf.gz is BGZF compressed with a tabix index.",
+)
+@click.option(
+    "--ref-dict",
+    default=None,
+    help="Order contigs as in this sequence dictionary (by name).",
+)
+@click.option(
+    "--qc/--no-qc",
+    default=True,
+    help="Write QC statistics next to the output as .qc.json and .qc.tsv (on).",
+)
+@click.option(
+    "--compress-threads",
+    type=int,
+    default=1,
+    help="BGZF compression threads of a .vcf.gz output (1).",
+)
+@click.argument(
+    "vcfs", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False)
+)
+def merge(output: str, ref_dict, qc: bool, compress_threads: int, vcfs) -> None:
+    """Merge coordinate-sorted VCFs of chunks into one sorted VCF."""
+    import pathlib
+
+    from varscan_tool import qc as _qc
+    from varscan_tool import regions, utils
+
+    setup_logging()
+    contigs = regions.read_ref_dict(ref_dict) if ref_dict else ()
+    files = [pathlib.Path(vcf) for vcf in vcfs]
+
+    def merge_to_output(tally=None) -> None:
+        if output.endswith(".gz"):
+            from varscan_tool.tabix import TabixVcfWriter
+
+            fout = TabixVcfWriter(output, threads=compress_threads)
+        else:
+            fout = open(output, "w")
+        with fout:
+            utils.merge_outputs(files, fout, contigs, tally)
+
+    if not qc:
+        merge_to_output()
+        return
+    stats = _qc.VariantStats()
+    merge_to_output(stats.add_lines)
+    _qc.write_summary(stats, qc_prefix(output))
+
+
+@main.command()
+@click.option(
+    "--backend",
+    type=click.Choice(defaults.PROCESS_BACKENDS),
+    default=defaults.PROCESS_BACKENDS[0],
+    help="processSomatic implementation: VarScan JVM or in-process (jvm).",
+)
+@click.option("--varscan-jar", default=defaults.VARSCAN_JAR)
+@click.option(
+    "--min-tumor-freq",
+    type=float,
+    default=defaults.MIN_TUMOR_FREQ,
+    help="Minimum variant allele frequency in tumor ({:.2f}).".format(
+        defaults.MIN_TUMOR_FREQ
+    ),
+)
+@click.option(
+    "--max-normal-freq",
+    type=float,
+    default=defaults.MAX_NORMAL_FREQ,
+    help="Maximum variant allele frequency in normal ({:.2f}).".format(
+        defaults.MAX_NORMAL_FREQ
+    ),
+)
+@click.option(
+    "--vps-p-value",
+    type=float,
+    default=defaults.VPS_P_VALUE,
+    help="P-value for high-confidence calling ({:.2f}).".format(defaults.VPS_P_VALUE),
+)
+@click.option(
+    "--timeout", type=int, default=None, help="Max seconds per JVM processSomatic."
+)
+@click.argument(
+    "vcfs", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False)
+)
+def process(
+    backend: str,
+    varscan_jar: str,
+    min_tumor_freq: float,
+    max_normal_freq: float,
+    vps_p_value: float,
+    timeout,
+    vcfs,
+) -> None:
+    """Split VarScan somatic VCFs into Somatic, Germline and LOH calls."""
+    from varscan_tool.varscan_somatic_process import PROCESS_BACKENDS
+
+    setup_logging()
+    with PROCESS_BACKENDS[backend](
+        timeout, varscan_jar, min_tumor_freq, max_normal_freq, vps_p_value
+    ) as somatic_process:
+        for vcf in vcfs:
+            somatic_process.run(vcf)
+
+
+@main.command(context_settings=FORWARDED)
+@click.argument("argv", nargs=-1, type=click.UNPROCESSED)
+@click.pass_context
+def bench(ctx: click.Context, argv) -> None:
+    """Run the benchmarks; `bench --help` lists the options."""
+    from varscan_tool.bench import run as bench_run
+
+    ctx.exit(bench_run.main(list(argv)))
 
 
 if __name__ == "__main__":
-    """CLI Entrypoint"""
-
-    status_code = 0
-    try:
-        status_code = main()
-    except Exception as e:
-        log.exception(e)
-        sys.exit(1)
-    sys.exit(status_code)
+    sys.exit(main())
 
 
 # __END__
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+asyncio engine for the per-chunk VarScan pipeline.
+
+AsyncStagePool runs ChunkGraph stage tasks on a single event loop, admitting
+them from the same StageQueue as the threaded StagePool. AsyncVarscan provides the stages
+as coroutines driving the JVMs through asyncio subprocesses, so no thread is
+held per running JVM. Cancelling the pool, e.g. after a fail-fast failure,
+cancels running stages, which kill their JVMs.
+"""
+
+import asyncio
+import collections
+import contextlib
+import inspect
+import logging
+import os
+import shlex
+import time
+from types import SimpleNamespace
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+from varscan_tool import resources, utils
+from varscan_tool.jvm import JvmSettings
+from varscan_tool.scheduler import StageQueue, StageTask
+from varscan_tool.utils import PopenReturn, ResourceUsage
+from varscan_tool.varscan import Varscan2
+from varscan_tool.varscan_somatic import VarscanSomatic
+from varscan_tool.varscan_somatic_process import MERGED, log_path
+
+DI = SimpleNamespace(asyncio=asyncio)
+logger = logging.getLogger(__name__)
+
+# Seconds between /proc samples of a running command's resource usage.
+SAMPLE_SECONDS = 0.5
+# Longest output line read from a command.
+LINE_LIMIT = 1 << 20
+# Bytes read from a streamed input per write to a command's stdin.
+FEED_BYTES = 1 << 20
+
+
+def _proc_sample(pid: int) -> Dict[str, Any]:
+    """CPU seconds, peak RSS and I/O bytes of a live process, from /proc"""
+    sample: Dict[str, Any] = {}
+    proc = "/proc/{}".format(pid)
+    try:
+        with open(os.path.join(proc, "stat")) as fh:
+            fields = fh.read().rsplit(")", 1)[1].split()
+        ticks = os.sysconf("SC_CLK_TCK")
+        sample["user"] = int(fields[11]) / ticks
+        sample["sys"] = int(fields[12]) / ticks
+        with open(os.path.join(proc, "status")) as fh:
+            for line in fh:
+                if line.startswith("VmHWM:"):
+                    sample["max_rss"] = int(line.split()[1]) * 1024
+        with open(os.path.join(proc, "io")) as fh:
+            for line in fh:
+                key, _, value = line.partition(": ")
+                if key in ("read_bytes", "write_bytes"):
+                    sample[key] = int(value)
+    except (OSError, ValueError, IndexError):
+        pass
+    return sample
+
+
+async def _sample_usage(pid: int, found: Dict[str, Any]) -> None:
+    while True:
+        found.update(_proc_sample(pid))
+        await asyncio.sleep(SAMPLE_SECONDS)
+
+
+async def _drain(
+    stream: asyncio.StreamReader, name: str, tail: Deque[str], log_fh, markers: Set[str]
+) -> None:
+    """Log a command's output line by line as it is written"""
+    async for raw in stream:
+        line = raw.decode(errors="replace")
+        tail.append(line)
+        if utils.OOM_MARKER in line:
+            markers.add(utils.OOM_MARKER)
+        logger.debug("%s: %s", name, line.rstrip("\n"))
+        if log_fh is not None:
+            log_fh.write("[{}] {}".format(name, line))
+            log_fh.flush()
+
+
+async def _feed_stdin(source: IO[bytes], sink, errors: List[str]) -> None:
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            data = await loop.run_in_executor(None, source.read, FEED_BYTES)
+            if not data:
+                break
+            sink.write(data)
+            await sink.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        # The command stopped reading; its return code reports why.
+        pass
+    except Exception as e:
+        errors.append("stdin feed failed: {!r}".format(e))
+    finally:
+        sink.close()
+
+
+async def run_command(
+    cmd: str,
+    timeout: Optional[float] = None,
+    stdin_source: Optional[IO[bytes]] = None,
+    log_path: Optional[str] = None,
+    tail_lines: int = utils.TAIL_LINES,
+    _di=DI,
+) -> PopenReturn:
+    """Run a command as an asyncio subprocess, like utils.call_subprocess.
+
+    stdout and stderr are logged line by line to `log_path` and their last
+    `tail_lines` returned. The command is killed after `timeout` seconds, or
+    when the awaiting task is cancelled. Its usage is sampled from /proc
+    while it runs, so CPU time of its last moments may be missing; the usage
+    is added to the enclosing utils.collect_usage block.
+    """
+    oom_kills = resources.oom_kills()
+    proc = await _di.asyncio.create_subprocess_exec(
+        *shlex.split(cmd),
+        stdin=asyncio.subprocess.PIPE if stdin_source is not None else None,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        limit=LINE_LIMIT,
+    )
+    start = time.monotonic()
+    tails = {
+        name: collections.deque(maxlen=tail_lines) for name in ("stdout", "stderr")
+    }
+    feed_errors: List[str] = []
+    markers: Set[str] = set()
+    sampled: Dict[str, Any] = {}
+    timed_out = False
+    with contextlib.ExitStack() as stack:
+        log_fh = None
+        if log_path is not None:
+            log_fh = stack.enter_context(utils.open_log(log_path, cmd))
+        io_tasks = [
+            asyncio.ensure_future(
+                _drain(getattr(proc, name), name, tail, log_fh, markers)
+            )
+            for name, tail in tails.items()
+        ]
+        if stdin_source is not None:
+            io_tasks.append(
+                asyncio.ensure_future(
+                    _feed_stdin(stdin_source, proc.stdin, feed_errors)
+                )
+            )
+        sampler = asyncio.ensure_future(_sample_usage(proc.pid, sampled))
+        try:
+            try:
+                await asyncio.wait_for(proc.wait(), timeout)
+            except asyncio.TimeoutError:
+                timed_out = True
+                proc.kill()
+                await proc.wait()
+            await asyncio.gather(*io_tasks)
+        except asyncio.CancelledError:
+            logger.warning("Killing cancelled command %s", proc.pid)
+            with contextlib.suppress(ProcessLookupError):
+                proc.kill()
+            for task in io_tasks:
+                task.cancel()
+            await proc.wait()
+            raise
+        finally:
+            sampler.cancel()
+
+    usage = ResourceUsage(
+        wall=time.monotonic() - start,
+        user=sampled.get("user", 0.0),
+        sys=sampled.get("sys", 0.0),
+        max_rss=sampled.get("max_rss", 0),
+        read_bytes=sampled.get("read_bytes"),
+        write_bytes=sampled.get("write_bytes"),
+    )
+    utils.record_usage(usage)
+    retcode = proc.returncode
+    oom_killed = utils.oom_killed_since(oom_kills, retcode)
+    stderr = "".join(tails["stderr"])
+    if feed_errors:
+        retcode = retcode or 1
+        stderr = "\n".join(filter(None, [stderr] + feed_errors))
+    return PopenReturn(
+        retcode=retcode,
+        stdout="".join(tails["stdout"]),
+        stderr=stderr,
+        timed_out=timed_out,
+        usage=usage,
+        oom_killed=oom_killed,
+        out_of_memory=utils.OOM_MARKER in markers,
+    )
+
+
+class AsyncVarscan:
+    """Varscan2 stages as coroutine functions, run by AsyncStagePool"""
+
+    somatic_outputs = staticmethod(Varscan2.somatic_outputs)
+
+    @staticmethod
+    async def run_somatic(
+        mpileup: str,
+        args,
+        jvm: Optional[JvmSettings] = None,
+        timeout: Optional[int] = None,
+        _somatic=VarscanSomatic,
+        _di=DI,
+    ) -> Tuple[str, str]:
+        """Run VarScan somatic in args.workdir, returning the raw snp and indel VCFs"""
+        output_base = Varscan2.somatic_base(mpileup, args.workdir)
+        somatic = _somatic()
+        command = somatic.command(mpileup, output_base, jvm)
+        with contextlib.ExitStack() as stack:
+            stdin_source = somatic.open_input(mpileup, stack)
+            logger.info(command)
+            cmd_return = await run_command(
+                command,
+                timeout or somatic.timeout,
+                stdin_source,
+                log_path="{}.somatic.log".format(output_base),
+                _di=_di,
+            )
+        somatic.check(cmd_return)
+        return Varscan2.somatic_outputs(mpileup, args.workdir)
+
+    @staticmethod
+    async def run_somatic_streamed(
+        mpileup: str,
+        args,
+        jvm: Optional[JvmSettings] = None,
+        timeout: Optional[int] = None,
+        categories: Sequence[str] = (MERGED,),
+        _somatic=VarscanSomatic,
+        _di=DI,
+    ) -> Tuple[str, str]:
+        """Varscan2.run_somatic_streamed, with somatic run as a subprocess"""
+        with Varscan2.streamed_outputs(mpileup, args, timeout, categories) as raw_vcfs:
+            await AsyncVarscan.run_somatic(mpileup, args, jvm, timeout, _somatic, _di)
+        return raw_vcfs
+
+    @staticmethod
+    async def run_process(
+        input_vcf: str,
+        args,
+        jvm: Optional[JvmSettings] = None,
+        timeout: Optional[int] = None,
+        _process=None,
+        _di=DI,
+    ) -> None:
+        """Run processSomatic on a raw VCF; the native backend runs in a thread"""
+        if args.process_backend != "jvm":
+            await asyncio.to_thread(Varscan2.run_process, input_vcf, args, jvm, timeout)
+            return
+        with Varscan2.somatic_process(args, jvm, timeout, _process) as process:
+            command = process.command(input_vcf)
+            logger.info(command)
+            cmd_return = await run_command(
+                command, process.timeout, log_path=log_path(input_vcf), _di=_di
+            )
+        process.check(cmd_return)
+
+
+class AsyncStagePool:
+    """StagePool counterpart running stage tasks on an event loop.
+
+    At most `max_workers` tasks run at a time, admitted from a StageQueue
+    like StagePool's. Coroutine stage functions are awaited; others run in a
+    worker thread. Callbacks run on the event loop between tasks. Once
+    cancelled, queued tasks are dropped, new ones ignored, and running ones
+    cancelled without their callbacks.
+    """
+
+    def __init__(self, max_workers: int, budget=None, _di=DI):
+        self.max_workers = max_workers
+        self.queue = StageQueue(budget)
+        self._di = _di
+        self._running: Dict[Any, Tuple[StageTask, Callable]] = {}
+        self.cancelled = False
+
+    def submit(
+        self, task: StageTask, callback: Callable, priority=0, delay: float = 0.0
+    ) -> None:
+        """Queue a task; callback(task, future) runs once it completes"""
+        if not self.cancelled:
+            self.queue.push(task, callback, priority, delay)
+
+    def cancel(self) -> None:
+        """Drop queued tasks and cancel running ones, killing their commands"""
+        self.cancelled = True
+        self.queue.clear()
+        for future in self._running:
+            future.cancel()
+
+    def run(self) -> None:
+        """Run until no task is queued, delayed or in flight"""
+        self._di.asyncio.run(self._run())
+
+    @staticmethod
+    async def _execute(task: StageTask):
+        if inspect.iscoroutinefunction(task.fn):
+            return await task.fn(*task.args)
+        return await asyncio.to_thread(task.fn, *task.args)
+
+    def _dispatch(self) -> None:
+        for task, callback in self.queue.admit(self.max_workers - len(self._running)):
+            future = asyncio.ensure_future(self._execute(task))
+            self._running[future] = (task, callback)
+
+    async def _run(self) -> None:
+        self._dispatch()
+        while self._running or self.queue.next_delay() is not None:
+            timeout = self.queue.next_delay()
+            if not self._running:
+                await asyncio.sleep(timeout)
+            else:
+                done, _ = await asyncio.wait(
+                    list(self._running),
+                    timeout=timeout,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                for future in done:
+                    task, callback = self._running.pop(future)
+                    self.queue.release(task)
+                    if not future.cancelled():
+                        callback(task, future)
+            self._dispatch()
+
+
+# __END__
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Benchmark cases. Each case prepares its inputs under a work directory and
+returns the zero-argument callable that is timed.
+"""
+
+import contextlib
+import os
+import pathlib
+import shutil
+import subprocess
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+from typing import Callable, Dict, List
+
+from varscan_tool import jvm, multi_varscan, prefilter, qc, resources, utils, vcf
+from varscan_tool.bench import fake_varscan, synthetic
+from varscan_tool.regions import Contig
+
+# Records per chunk VCF in the merge case.
+MERGE_RECORDS = 200
+# Mpileup rows per chunk in the end-to-end case.
+ROWS_PER_CHUNK = 50
+# Mpileup rows per chunk in the prefilter case.
+PREFILTER_ROWS = 10000
+# VarScan VCF records per chunk in the vcf and merge_qc cases.
+VCF_RECORDS = 10000
+# Untimed plain merges of the merge_qc case; the fastest is its baseline.
+BASELINE_RUNS = 3
+# varscan_tool command lines whose start the startup case times.
+STARTUP_COMMANDS = (
+    ("--version",),
+    ("--help",),
+    ("merge", "--help"),
+    ("run", "--help"),
+)
+
+
+class NoopVarscan:
+    """Returns stage outputs without running anything, to time orchestration"""
+
+    @staticmethod
+    def run_somatic(mpileup, args, jvm=None, timeout=None):
+        return "{}.snp.vcf".format(mpileup), "{}.indel.vcf".format(mpileup)
+
+    @staticmethod
+    def run_process(input_vcf, args, jvm=None, timeout=None):
+        return None
+
+
+def _pipeline_args(**kwargs) -> SimpleNamespace:
+    defaults = dict(
+        schedule_cost="size",
+        java_opts="3G",
+        somatic_jvm_flags=jvm.DEFAULT_JVM_FLAGS,
+        process_heap_floor="256M",
+        process_heap_ceiling="3G",
+        process_jvm_flags=jvm.DEFAULT_JVM_FLAGS,
+        process_backend="jvm",
+        engine=multi_varscan.THREADS,
+        on_failure=multi_varscan.BEST_EFFORT,
+        timeout=None,
+    )
+    defaults.update(kwargs)
+    return SimpleNamespace(**defaults)
+
+
+def schedule(chunks: int, workdir: str, threads: int = 8, **_) -> Callable:
+    """tpe_submit_commands over `chunks` chunks with instant stages"""
+    mpileups = []
+    for idx in range(chunks):
+        path = os.path.join(workdir, "chunk_{:04d}.mpileup".format(idx))
+        with open(path, "w") as fh:
+            fh.write("x" * (idx % 97 + 1))
+        mpileups.append(path)
+    args = _pipeline_args()
+
+    def run():
+        budget = resources.MemoryBudget(1 << 40)
+        multi_varscan.tpe_submit_commands(
+            args, mpileups, threads, budget, _varscan=NoopVarscan
+        )
+
+    return run
+
+
+def merge(chunks: int, workdir: str, **_) -> Callable:
+    """merge_outputs of `chunks` region-ordered chunk VCFs"""
+    contigs = [Contig("chr1", chunks * MERGE_RECORDS * 10 + 10)]
+    files: List[pathlib.Path] = []
+    for idx in range(chunks):
+        path = os.path.join(workdir, "chunk_{:04d}.snp.Somatic.hc.vcf".format(idx))
+        with open(path, "w") as fh:
+            fh.write(fake_varscan.VCF_HEADER)
+            for row in range(MERGE_RECORDS):
+                pos = (idx * MERGE_RECORDS + row) * 10 + 1
+                fh.write(
+                    "chr1\t{}\t.\tA\tC\t.\tPASS\tDP=60;SS=2\t"
+                    "GT:GQ:DP:RD:AD:FREQ\t0/0:.:30:30:0:0%\t"
+                    "0/1:.:30:20:10:33.33%\n".format(pos)
+                )
+        files.append(pathlib.Path(path))
+    merged = os.path.join(workdir, "merged.vcf")
+
+    def run():
+        with open(merged, "w") as fout:
+            utils.merge_outputs(files, fout, contigs)
+
+    return run
+
+
+def prefilter_rows(chunks: int, workdir: str, **_) -> Callable:
+    """PrefilteredReader over a synthetic pair of `chunks` * PREFILTER_ROWS rows"""
+    spec = synthetic.MpileupSpec(positions=chunks * PREFILTER_ROWS)
+    mpileup = os.path.join(workdir, "pair.mpileup")
+    synthetic.write_mpileup(mpileup, spec)
+    thresholds = prefilter.Thresholds(min_coverage_normal=8, min_coverage_tumor=6)
+
+    def run():
+        with open(mpileup, "rb") as source, open(os.devnull, "wb") as sink:
+            reader = prefilter.PrefilteredReader(source, thresholds)
+            shutil.copyfileobj(reader, sink, 1 << 20)
+        reader.log(mpileup)
+
+    return run
+
+
+def _write_calls(path: str, records: int) -> int:
+    """Write a VarScan somatic VCF of about `records` calls; returns the count"""
+    spec = synthetic.MpileupSpec(positions=records, variant_rate=1.0)
+    count = 0
+    with open(path, "w") as fh:
+        fh.write(fake_varscan.VCF_HEADER)
+        for line in synthetic.mpileup_lines(spec):
+            called = fake_varscan.call_row(line, 1)
+            if called:
+                fh.write(called[1])
+                count += 1
+    return count
+
+
+def _bytes_per_million(build: Callable[[], object], records: int) -> int:
+    """Memory held by what `build` returns, per million records, by tracemalloc"""
+    tracemalloc.start()
+    try:
+        held = build()
+        size = tracemalloc.get_traced_memory()[0]
+        del held
+    finally:
+        tracemalloc.stop()
+    return round(size * 1e6 / records)
+
+
+def vcf_records(chunks: int, workdir: str, **_) -> Callable:
+    """VcfReader over `chunks` * VCF_RECORDS calls, reading SS, p-values and depths"""
+    path = os.path.join(workdir, "calls.vcf")
+    count = _write_calls(path, chunks * VCF_RECORDS)
+
+    def load():
+        with open(path) as fh:
+            return list(vcf.VcfReader(fh))
+
+    report = {"records": count, "bytes_per_million": _bytes_per_million(load, count)}
+
+    def run() -> Dict:
+        with open(path) as fh:
+            for record in vcf.VcfReader(fh):
+                record.ss, record.gpv, record.spv
+                record.depths(vcf.NORMAL), record.depths(vcf.TUMOR)
+        return report
+
+    return run
+
+
+def vcf_columns(chunks: int, workdir: str, **_) -> Callable:
+    """read_columns over `chunks` * VCF_RECORDS calls"""
+    path = os.path.join(workdir, "calls.vcf")
+    count = _write_calls(path, chunks * VCF_RECORDS)
+
+    def load():
+        with open(path) as fh:
+            return list(vcf.read_columns(vcf.VcfReader(fh)))
+
+    report = {"records": count, "bytes_per_million": _bytes_per_million(load, count)}
+
+    def run() -> Dict:
+        load()
+        return report
+
+    return run
+
+
+def merge_qc(chunks: int, workdir: str, **_) -> Callable:
+    """merge_outputs of `chunks` * VCF_RECORDS calls with QC statistics
+
+    Each run merges and tallies the written records inline, as multi_varscan
+    does, and summarizes them. The fastest of BASELINE_RUNS plain merges of
+    the same chunks is reported as the baseline, for the overhead of the
+    statistics.
+    """
+    path = os.path.join(workdir, "calls.vcf")
+    count = _write_calls(path, chunks * VCF_RECORDS)
+    with open(path) as fh:
+        reader = vcf.VcfReader(fh)
+        lines = [record.line for record in reader]
+    files: List[pathlib.Path] = []
+    for idx in range(chunks):
+        chunk = pathlib.Path(workdir, "chunk_{:04d}.snp.Somatic.hc.vcf".format(idx))
+        part = lines[idx * len(lines) // chunks : (idx + 1) * len(lines) // chunks]
+        chunk.write_text("".join(reader.header + part))
+        files.append(chunk)
+    merged = os.path.join(workdir, "merged.vcf")
+
+    def merge_calls(tally=None):
+        with open(merged, "w") as fout:
+            utils.merge_outputs(files, fout, tally=tally)
+
+    baseline = float("inf")
+    for _ in range(BASELINE_RUNS):
+        start = time.perf_counter()
+        merge_calls()
+        baseline = min(baseline, time.perf_counter() - start)
+
+    def run() -> Dict:
+        stats = qc.VariantStats()
+        merge_calls(stats.add_lines)
+        stats.summary()
+        return {"records": count, "baseline": baseline}
+
+    return run
+
+
+def startup(chunks: int, workdir: str, **_) -> Callable:
+    """`chunks` starts of each STARTUP_COMMANDS line, a new interpreter each
+
+    The fastest start of each command line over all runs is reported under
+    "commands", with that of a bare interpreter as the "python" floor.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+    env = dict(os.environ, PYTHONPATH=root)
+    commands = {"python": [sys.executable, "-c", "pass"]}
+    for command in STARTUP_COMMANDS:
+        commands[" ".join(command)] = [sys.executable, "-m", "varscan_tool", *command]
+    fastest = {name: float("inf") for name in commands}
+
+    def run() -> Dict:
+        for name, argv in commands.items():
+            for _ in range(chunks):
+                start = time.perf_counter()
+                subprocess.run(
+                    argv, cwd=workdir, env=env, stdout=subprocess.DEVNULL, check=True
+                )
+                fastest[name] = min(fastest[name], time.perf_counter() - start)
+        return {"commands": dict(fastest)}
+
+    return run
+
+
+@contextlib.contextmanager
+def _environment(workdir: str, **variables):
+    saved_cwd, saved_env = os.getcwd(), dict(os.environ)
+    os.environ.update(variables)
+    os.chdir(workdir)
+    try:
+        yield
+    finally:
+        os.chdir(saved_cwd)
+        os.environ.clear()
+        os.environ.update(saved_env)
+
+
+def end_to_end(
+    chunks: int,
+    workdir: str,
+    threads: int = 8,
+    latency: float = 0.0,
+    memory: int = 0,
+    **_,
+) -> Callable:
+    """multi_varscan.run scattering a synthetic pair into `chunks` chunks,
+    with the stand-in VarScan in place of java"""
+    spec = synthetic.MpileupSpec(positions=max(chunks * ROWS_PER_CHUNK, 1000))
+    mpileup = os.path.join(workdir, "pair.mpileup")
+    ref_dict = os.path.join(workdir, "ref.dict")
+    synthetic.write_mpileup(mpileup, spec)
+    synthetic.write_ref_dict(ref_dict, spec.reference())
+    bin_dir = os.path.join(workdir, "bin")
+    os.makedirs(bin_dir, exist_ok=True)
+    fake_varscan.install(bin_dir)
+    args = multi_varscan.process_argv(
+        [
+            "--mpileup",
+            mpileup,
+            "--ref-dict",
+            ref_dict,
+            "--scatter-count",
+            str(chunks),
+            "--thread-count",
+            str(threads),
+            "--memory-limit",
+            "1T",
+            "--varscan-jar",
+            "varscan.jar",
+        ]
+    )
+    variables = {
+        "PATH": bin_dir + os.pathsep + os.environ.get("PATH", ""),
+        "FAKE_VARSCAN_LATENCY": str(latency),
+        "FAKE_VARSCAN_MEMORY": str(memory),
+    }
+
+    def run():
+        with _environment(workdir, **variables):
+            multi_varscan.run(args)
+
+    return run
+
+
+CASES = {
+    "schedule": schedule,
+    "merge": merge,
+    "end_to_end": end_to_end,
+    "prefilter": prefilter_rows,
+    "vcf_records": vcf_records,
+    "vcf_columns": vcf_columns,
+    "merge_qc": merge_qc,
+    "startup": startup,
+}
+
+
+# __END__
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Stand-in for `java -jar varscan.jar` with tunable latency and memory.
+
+Installed as a `java` executable ahead of the real one on PATH, it accepts
+the somatic and processSomatic command lines built by this tool and writes
+the same output files VarScan would. Calls are deliberately simple: a row is
+a somatic call when only the tumor carries the alt allele, and a germline
+call when both samples do.
+
+FAKE_VARSCAN_LATENCY adds fixed seconds per command,
+FAKE_VARSCAN_SECONDS_PER_MB adds seconds per MB of input, and
+FAKE_VARSCAN_MEMORY holds that many bytes for the life of the command.
+"""
+
+import contextlib
+import os
+import re
+import stat
+import sys
+import time
+from textwrap import dedent
+from typing import Dict, List, Optional, Tuple
+
+from varscan_tool.varscan_somatic_process import NativeSomaticProcess
+
+VCF_HEADER = dedent(
+    """\
+    ##fileformat=VCFv4.1
+    ##source=VarScan2
+    ##INFO=<ID=DP,Number=1,Type=Integer,Description="Total depth of quality bases">
+    ##INFO=<ID=SOMATIC,Number=0,Type=Flag,Description="Indicates if record is a somatic mutation">
+    ##INFO=<ID=SS,Number=1,Type=String,Description="Somatic status of variant (0=Reference,1=Germline,2=Somatic,3=LOH, or 5=Unknown)">
+    ##INFO=<ID=SSC,Number=1,Type=String,Description="Somatic score in Phred scale (0-255) derived from somatic p-value">
+    ##INFO=<ID=GPV,Number=1,Type=Float,Description="Fisher's Exact Test P-value of tumor+normal versus no variant for Germline calls">
+    ##INFO=<ID=SPV,Number=1,Type=Float,Description="Fisher's Exact Test P-value of tumor versus normal for Somatic/LOH calls">
+    ##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">
+    ##FORMAT=<ID=GQ,Number=1,Type=Integer,Description="Genotype Quality">
+    ##FORMAT=<ID=DP,Number=1,Type=Integer,Description="Read Depth">
+    ##FORMAT=<ID=RD,Number=1,Type=Integer,Description="Depth of reference-supporting bases (reads1)">
+    ##FORMAT=<ID=AD,Number=1,Type=Integer,Description="Depth of variant-supporting bases (reads2)">
+    ##FORMAT=<ID=FREQ,Number=1,Type=String,Description="Variant allele frequency">
+    #CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tNORMAL\tTUMOR
+    """
+)
+_READ_MARKS = re.compile(r"\^.|\$")
+_INDEL = re.compile(r"([+-])(\d+)")
+
+
+def count_alleles(bases: str) -> Tuple[int, Dict[str, int]]:
+    """Reference read count and alt allele counts of a pileup base string
+
+    Indels are keyed as VarScan writes them, e.g. +T or -AC.
+    """
+    bases = _READ_MARKS.sub("", bases)
+    ref_reads = 0
+    alts: Dict[str, int] = {}
+    idx = 0
+    while idx < len(bases):
+        base = bases[idx]
+        match = _INDEL.match(bases, idx)
+        if match:
+            end = match.end() + int(match.group(2))
+            allele = match.group(1) + bases[match.end() : end].upper()
+            alts[allele] = alts.get(allele, 0) + 1
+            idx = end
+            continue
+        if base in ".,":
+            ref_reads += 1
+        elif base.upper() in "ACGT":
+            alts[base.upper()] = alts.get(base.upper(), 0) + 1
+        idx += 1
+    return ref_reads, alts
+
+
+def _sample(ref_reads: int, alt_reads: int) -> str:
+    depth = ref_reads + alt_reads
+    freq = 100.0 * alt_reads / depth if depth else 0.0
+    gt = "0/0" if freq < 10 else ("1/1" if freq > 75 else "0/1")
+    return "{}:.:{}:{}:{}:{:.2f}%".format(gt, depth, ref_reads, alt_reads, freq)
+
+
+def call_row(line: str, min_coverage: int) -> Optional[Tuple[bool, str]]:
+    """(is_indel, VCF record) for a pair mpileup row, None without a call"""
+    fields = line.rstrip("\n").split("\t")
+    chrom, pos, ref = fields[0], fields[1], fields[2].upper()
+    normal_ref, normal_alts = count_alleles(fields[4])
+    tumor_ref, tumor_alts = count_alleles(fields[7])
+    if not tumor_alts:
+        return None
+    allele = max(tumor_alts, key=tumor_alts.get)
+    normal_alt, tumor_alt = normal_alts.get(allele, 0), tumor_alts[allele]
+    if min(normal_ref + normal_alt, tumor_ref + tumor_alt) < min_coverage:
+        return None
+    if normal_alt:
+        info = "SS=1;SSC=0;GPV=1E-10;SPV=1E0"
+    else:
+        info = "SOMATIC;SS=2;SSC=40;GPV=1E0;SPV=1E-4"
+    if allele.startswith("+"):
+        ref_allele, alt_allele = ref, ref + allele[1:]
+    elif allele.startswith("-"):
+        ref_allele, alt_allele = ref + allele[1:], ref
+    else:
+        ref_allele, alt_allele = ref, allele
+    depth = normal_ref + normal_alt + tumor_ref + tumor_alt
+    record = "\t".join(
+        [
+            chrom,
+            pos,
+            ".",
+            ref_allele,
+            alt_allele,
+            ".",
+            "PASS",
+            "DP={};{}".format(depth, info),
+            "GT:GQ:DP:RD:AD:FREQ",
+            _sample(normal_ref, normal_alt),
+            _sample(tumor_ref, tumor_alt),
+        ]
+    )
+    return allele[0] in "+-", record + "\n"
+
+
+def _options(argv: List[str]) -> Dict[str, str]:
+    options = {}
+    for idx, arg in enumerate(argv):
+        if arg.startswith("--"):
+            following = argv[idx + 1] if idx + 1 < len(argv) else ""
+            options[arg] = "" if following.startswith("--") else following
+    return options
+
+
+def somatic(mpileup: str, output_base: str, options: Dict[str, str]) -> None:
+    min_coverage = int(options.get("--min-coverage", 0) or 0)
+    with contextlib.ExitStack() as stack:
+        fh = stack.enter_context(open(mpileup))
+        snp = stack.enter_context(open(output_base + ".snp.vcf", "w"))
+        indel = stack.enter_context(open(output_base + ".indel.vcf", "w"))
+        snp.write(VCF_HEADER)
+        indel.write(VCF_HEADER)
+        for line in fh:
+            called = call_row(line, min_coverage)
+            if called:
+                is_indel, record = called
+                (indel if is_indel else snp).write(record)
+
+
+def process_somatic(input_vcf: str, options: Dict[str, str]) -> None:
+    NativeSomaticProcess(
+        None,
+        "",
+        float(options.get("--min-tumor-freq", 0.1)),
+        float(options.get("--max-normal-freq", 0.05)),
+        float(options.get("--p-value", 0.07)),
+    ).run(input_vcf)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    held = bytearray(int(os.environ.get("FAKE_VARSCAN_MEMORY", 0)))
+    held[:: 1 << 12] = b"\1" * len(held[:: 1 << 12])
+    command = argv[argv.index("-jar") + 2 :]
+    options = _options(command)
+    input_path = command[1]
+    delay = float(os.environ.get("FAKE_VARSCAN_LATENCY", 0))
+    if input_path != "/dev/stdin":
+        size_mb = os.stat(input_path).st_size / (1 << 20)
+        delay += size_mb * float(os.environ.get("FAKE_VARSCAN_SECONDS_PER_MB", 0))
+    time.sleep(delay)
+    if command[0] == "somatic":
+        somatic(input_path, command[2], options)
+    elif command[0] == "processSomatic":
+        process_somatic(input_path, options)
+    else:
+        sys.stderr.write("Unknown VarScan command {}\n".format(command[0]))
+        return 1
+    return 0
+
+
+def install(directory: str) -> str:
+    """Write a `java` executable running this stand-in; returns its path"""
+    path = os.path.join(directory, "java")
+    with open(path, "w") as fh:
+        fh.write(
+            "#!{}\nimport sys\nsys.path.insert(0, {!r})\n"
+            "from varscan_tool.bench.fake_varscan import main\n"
+            "sys.exit(main())\n".format(
+                sys.executable,
+                os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+            )
+        )
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return path
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+
+# __END__
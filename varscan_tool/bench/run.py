@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Run benchmark cases at several chunk counts and write the timings as JSON.
+
+    python -m varscan_tool.bench --chunks 1 10 100 --output bench.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Sequence
+
+from varscan_tool import __version__
+from varscan_tool.bench.cases import CASES
+
+DEFAULT_CHUNKS = (1, 10, 100, 1000)
+# Overhead over its baseline at which a case fails.
+MAX_OVERHEAD = 0.1
+
+
+def time_case(name: str, chunks: int, repeat: int, **options) -> Dict:
+    """Prepare a case once, then time `repeat` runs of it
+
+    A case's run may return a dict of extra measurements for the result;
+    with a "records" count, the seconds per record are added too, and with
+    the "baseline" seconds of the work without the measured feature, the
+    fractional overhead of the fastest run over it, failing at MAX_OVERHEAD.
+    """
+    with tempfile.TemporaryDirectory(prefix="varscan-bench-") as workdir:
+        run = CASES[name](chunks, workdir, **options)
+        seconds = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            extra = run()
+            seconds.append(time.perf_counter() - start)
+    result = {
+        "case": name,
+        "chunks": chunks,
+        "seconds": seconds,
+        "min": min(seconds),
+        "median": statistics.median(seconds),
+    }
+    if extra:
+        result.update(extra)
+        if extra.get("records"):
+            result["seconds_per_record"] = result["min"] / extra["records"]
+        if extra.get("baseline"):
+            result["overhead"] = result["min"] / extra["baseline"] - 1
+            result["failed"] = result["overhead"] >= MAX_OVERHEAD
+    return result
+
+
+def run_benchmarks(
+    cases: Sequence[str], chunk_counts: Sequence[int], repeat: int = 3, **options
+) -> Dict:
+    results: List[Dict] = []
+    for name in cases:
+        for chunks in chunk_counts:
+            result = time_case(name, chunks, repeat, **options)
+            line = (
+                "{case:<12} {chunks:>5} chunks  min {min:8.3f}s  median {median:8.3f}s"
+            )
+            if "overhead" in result:
+                line += "  overhead {:6.1%}".format(result["overhead"])
+            if result.get("failed"):
+                line += "  FAILED (>= {:.0%})".format(MAX_OVERHEAD)
+            print(line.format(**result), file=sys.stderr)
+            results.append(result)
+    return {
+        "version": __version__,
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "options": options,
+        "results": results,
+    }
+
+
+def setup_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--cases", nargs="+", choices=sorted(CASES), default=sorted(CASES)
+    )
+    parser.add_argument("--chunks", nargs="+", type=int, default=list(DEFAULT_CHUNKS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Stand-in VarScan seconds per call."
+    )
+    parser.add_argument(
+        "--memory", type=int, default=0, help="Stand-in VarScan bytes held per call."
+    )
+    parser.add_argument("--output", default=None, help="JSON results (stdout).")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = setup_parser().parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    report = run_benchmarks(
+        args.cases,
+        args.chunks,
+        args.repeat,
+        threads=args.threads,
+        latency=args.latency,
+        memory=args.memory,
+    )
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(report, fh, indent=1)
+    else:
+        json.dump(report, sys.stdout, indent=1)
+        print()
+    return 1 if any(result.get("failed") for result in report["results"]) else 0
+
+
+# __END__
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Synthetic tumor/normal mpileups and reference dictionaries for benchmarks.
+"""
+
+import random
+from typing import List, NamedTuple
+
+from varscan_tool.regions import Contig
+
+BASES = "ACGT"
+
+
+class MpileupSpec(NamedTuple):
+    """Shape of a synthetic pair: `positions` covered rows spread evenly
+    over `contigs` contigs, `depth` reads per sample, and a `variant_rate`
+    fraction of rows carrying a somatic, germline or indel allele."""
+
+    contigs: int = 2
+    positions: int = 10000
+    depth: int = 30
+    variant_rate: float = 0.01
+    seed: int = 0
+
+    def reference(self) -> List[Contig]:
+        per_contig = -(-self.positions // self.contigs)
+        return [
+            Contig("chr{}".format(idx + 1), per_contig * 10)
+            for idx in range(self.contigs)
+        ]
+
+
+def write_ref_dict(path: str, contigs: List[Contig]) -> None:
+    with open(path, "w") as fh:
+        fh.write("@HD\tVN:1.6\n")
+        for contig in contigs:
+            fh.write("@SQ\tSN:{}\tLN:{}\n".format(contig.name, contig.length))
+
+
+def _pileup(rng: random.Random, depth: int, alt: str, alt_freq: float) -> str:
+    alt_reads = round(depth * alt_freq)
+    reads = ["."] * (depth - alt_reads) + [alt] * alt_reads
+    rng.shuffle(reads)
+    return "^I" + "".join(reads) + "$" if reads else "*"
+
+
+def mpileup_lines(spec: MpileupSpec):
+    """Yield tab-separated pair mpileup rows in reference order"""
+    rng = random.Random(spec.seed)
+    contigs = spec.reference()
+    per_contig = -(-spec.positions // spec.contigs)
+    emitted = 0
+    for contig in contigs:
+        for row in range(per_contig):
+            if emitted == spec.positions:
+                return
+            emitted += 1
+            ref = rng.choice(BASES)
+            alt = rng.choice([b for b in BASES if b != ref])
+            normal_freq = tumor_freq = 0.0
+            if rng.random() < spec.variant_rate:
+                kind = rng.random()
+                if kind < 0.6:
+                    tumor_freq = rng.uniform(0.1, 0.6)
+                elif kind < 0.9:
+                    normal_freq = tumor_freq = 0.5
+                else:
+                    alt = rng.choice(["+1{}".format(alt), "-1{}".format(alt)])
+                    tumor_freq = rng.uniform(0.2, 0.5)
+            normal_depth = max(1, int(rng.gauss(spec.depth, spec.depth / 10)))
+            tumor_depth = max(1, int(rng.gauss(spec.depth, spec.depth / 10)))
+            normal = _pileup(rng, normal_depth, alt, normal_freq)
+            tumor = _pileup(rng, tumor_depth, alt, tumor_freq)
+            yield (
+                "\t".join(
+                    [
+                        contig.name,
+                        str(row * 10 + 1),
+                        ref,
+                        str(normal_depth),
+                        normal,
+                        "I" * normal_depth,
+                        str(tumor_depth),
+                        tumor,
+                        "I" * tumor_depth,
+                    ]
+                )
+                + "\n"
+            )
+
+
+def write_mpileup(path: str, spec: MpileupSpec) -> None:
+    with open(path, "w") as fh:
+        fh.writelines(mpileup_lines(spec))
+
+
+# __END__
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+BGZF writer with thread-parallel block compression.
+"""
+
+import collections
+import concurrent.futures
+import struct
+import zlib
+from typing import IO, Deque, List, Optional, Union
+
+# Uncompressed bytes per block, as written by htslib.
+BLOCK_SIZE = 0xFF00
+EOF_BLOCK = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+_HEADER = struct.Struct("<4BI2BH2BHH")
+_FOOTER = struct.Struct("<2I")
+
+
+def compress_block(data: bytes, level: int = 6) -> bytes:
+    """Compress up to BLOCK_SIZE bytes into a single BGZF block"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    deflated = compressor.compress(data) + compressor.flush()
+    block_size = _HEADER.size + len(deflated) + _FOOTER.size
+    header = _HEADER.pack(
+        0x1F, 0x8B, 8, 4, 0, 0, 0xFF, 6, ord("B"), ord("C"), 2, block_size - 1
+    )
+    return header + deflated + _FOOTER.pack(zlib.crc32(data), len(data))
+
+
+class BgzfWriter:
+    """Write a BGZF stream, compressing blocks on a thread pool.
+
+    zlib releases the GIL while compressing, so `threads` > 1 compresses
+    blocks in parallel; blocks are still written in order. `tell()` is the
+    uncompressed offset; after `close()`, `virtual_offset()` maps it to a
+    BGZF virtual file offset for indexing.
+    """
+
+    def __init__(self, path: Union[str, IO[bytes]], threads: int = 1, level: int = 6):
+        if isinstance(path, str):
+            self._fh: IO[bytes] = open(path, "wb")
+            self._owns_fh = True
+        else:
+            self._fh = path
+            self._owns_fh = False
+        self.level = level
+        self._buffer = bytearray()
+        self._offset = 0
+        self._block_sizes: List[int] = []
+        self._block_starts: Optional[List[int]] = None
+        self._pending: Deque[concurrent.futures.Future] = collections.deque()
+        self._max_pending = max(1, threads) * 4
+        self._executor = None
+        if threads > 1:
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=threads)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def tell(self) -> int:
+        return self._offset
+
+    def write(self, data: Union[str, bytes]) -> int:
+        if isinstance(data, str):
+            data = data.encode()
+        self._buffer += data
+        self._offset += len(data)
+        while len(self._buffer) >= BLOCK_SIZE:
+            self._submit(bytes(self._buffer[:BLOCK_SIZE]))
+            del self._buffer[:BLOCK_SIZE]
+        return len(data)
+
+    def writelines(self, lines) -> None:
+        for line in lines:
+            self.write(line)
+
+    def _submit(self, block: bytes) -> None:
+        if self._executor is None:
+            self._write_block(compress_block(block, self.level))
+            return
+        self._pending.append(self._executor.submit(compress_block, block, self.level))
+        while len(self._pending) >= self._max_pending:
+            self._write_block(self._pending.popleft().result())
+
+    def _write_block(self, block: bytes) -> None:
+        self._fh.write(block)
+        self._block_sizes.append(len(block))
+
+    def close(self) -> None:
+        if self._block_starts is not None:
+            return
+        if self._buffer:
+            self._submit(bytes(self._buffer))
+            self._buffer.clear()
+        while self._pending:
+            self._write_block(self._pending.popleft().result())
+        if self._executor is not None:
+            self._executor.shutdown()
+        self._fh.write(EOF_BLOCK)
+        if self._owns_fh:
+            self._fh.close()
+        starts = [0]
+        for size in self._block_sizes:
+            starts.append(starts[-1] + size)
+        self._block_starts = starts
+
+    def virtual_offset(self, offset: int) -> int:
+        """Map an uncompressed offset to a virtual offset; valid after close"""
+        if self._block_starts is None:
+            raise ValueError("Virtual offsets are known once the writer is closed")
+        block, within = divmod(offset, BLOCK_SIZE)
+        return self._block_starts[block] << 16 | within
+
+
+# __END__
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Content-addressed on-disk cache of per-chunk stage outputs.
+
+Entries are keyed by the stage, the input's content fingerprint and the
+caller parameters, so a re-run of the same pair restores its VCFs instead of
+running VarScan again. Entries are published with a directory rename and
+evicted least recently used first once the cache exceeds its size cap.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from typing import Dict, List, Optional
+
+from varscan_tool import manifest, splitter
+
+logger = logging.getLogger(__name__)
+
+META = "meta.json"
+FULL = "full"
+SAMPLED = "sampled"
+
+
+class ResultCache:
+    def __init__(self, root: str, max_bytes: Optional[int] = None, digest: str = FULL):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.digest = digest
+        self.objects = os.path.join(root, "objects")
+        self.tmp = os.path.join(root, "tmp")
+        os.makedirs(self.objects, exist_ok=True)
+        os.makedirs(self.tmp, exist_ok=True)
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self._lock = threading.Lock()
+
+    def key(self, stage: str, input_path: str, parameters: Dict) -> Optional[str]:
+        """Cache key of a stage run on `input_path`; None for stdin
+
+        A sampled digest can miss edits to the unsampled middle of an input,
+        so sampled keys also include the mtime.
+        """
+        if self.digest == FULL:
+            fingerprint = manifest.fingerprint(input_path, sample_size=None)
+        else:
+            fingerprint = manifest.fingerprint(input_path)
+        if fingerprint is None:
+            return None
+        if self.digest == SAMPLED:
+            source = splitter.source_path(input_path)
+            fingerprint += ":{}".format(os.stat(source).st_mtime_ns)
+        material = json.dumps([stage, fingerprint, parameters], sort_keys=True)
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    def _entry(self, key: str) -> str:
+        return os.path.join(self.objects, key[:2], key)
+
+    def _count(self, stat: str) -> None:
+        with self._lock:
+            self.stats[stat] += 1
+
+    def fetch(self, key: str, outputs: List[str]) -> bool:
+        """Restore a cached entry to `outputs`, in order; False on a miss"""
+        entry = self._entry(key)
+        try:
+            with open(os.path.join(entry, META)) as fh:
+                meta = json.load(fh)
+            if len(meta["files"]) != len(outputs):
+                raise ValueError("Cache entry {} has other outputs".format(key))
+            for name, output in zip(meta["files"], outputs):
+                tmp = "{}.cache.tmp".format(output)
+                shutil.copyfile(os.path.join(entry, name), tmp)
+                os.replace(tmp, output)
+            os.utime(os.path.join(entry, META))
+        except (OSError, ValueError) as e:
+            if not isinstance(e, FileNotFoundError):
+                logger.warning("Unusable cache entry %s: %s", key, e)
+            self._count("misses")
+            return False
+        logger.info("Cache hit %s for %s", key[:12], outputs[0])
+        self._count("hits")
+        return True
+
+    def store(self, key: str, outputs: List[str]) -> None:
+        """Publish `outputs` under `key`, then evict down to the size cap"""
+        staging = tempfile.mkdtemp(dir=self.tmp)
+        try:
+            files = []
+            for idx, output in enumerate(outputs):
+                name = str(idx)
+                shutil.copyfile(output, os.path.join(staging, name))
+                files.append(name)
+            size = sum(os.path.getsize(output) for output in outputs)
+            with open(os.path.join(staging, META), "w") as fh:
+                json.dump({"files": files, "size": size}, fh)
+            entry = self._entry(key)
+            os.makedirs(os.path.dirname(entry), exist_ok=True)
+            try:
+                os.rename(staging, entry)
+            except OSError:
+                # Published concurrently by another worker or run.
+                return
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        self._count("stores")
+        self.evict()
+
+    def _entries(self):
+        for prefix in os.listdir(self.objects):
+            for key in os.listdir(os.path.join(self.objects, prefix)):
+                entry = os.path.join(self.objects, prefix, key)
+                try:
+                    used = os.stat(os.path.join(entry, META)).st_mtime
+                    with open(os.path.join(entry, META)) as fh:
+                        size = json.load(fh)["size"]
+                except (OSError, ValueError):
+                    continue
+                yield used, size, entry
+
+    def evict(self) -> None:
+        """Remove least recently used entries until within max_bytes"""
+        if self.max_bytes is None:
+            return
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, entry in entries:
+                if total <= self.max_bytes:
+                    break
+                doomed = tempfile.mkdtemp(dir=self.tmp)
+                try:
+                    os.rename(entry, os.path.join(doomed, "entry"))
+                except OSError:
+                    continue
+                finally:
+                    shutil.rmtree(doomed, ignore_errors=True)
+                total -= size
+                self.stats["evictions"] += 1
+
+    def log_stats(self) -> None:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        logger.info(
+            "Result cache: %s hits, %s misses (%.0f%% hit rate), %s stored, %s evicted",
+            self.stats["hits"],
+            self.stats["misses"],
+            100.0 * self.stats["hits"] / lookups if lookups else 0.0,
+            self.stats["stores"],
+            self.stats["evictions"],
+        )
+
+
+# __END__
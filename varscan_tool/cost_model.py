@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Per-chunk runtime and memory model fitted from earlier runs' metrics.
+
+Each stage's wall time and peak RSS are fitted as linear functions of the
+chunk's mpileup bytes, from the metrics reports of finished runs. The model
+file keeps the most recent samples per stage and is refitted on load. It
+plans a run without starting any JVMs, and orders chunks for scheduling.
+"""
+
+import json
+import logging
+import os
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from varscan_tool import jvm, regions, scheduler, utils
+from varscan_tool.pipeline import PROCESS_INDEL, PROCESS_SNP, SOMATIC
+
+logger = logging.getLogger(__name__)
+
+MODEL_VERSION = 1
+# Schedule cost name of the fitted model.
+MODEL = "model"
+# Most recent samples kept per stage.
+MAX_SAMPLES = 2000
+
+
+class Fit(NamedTuple):
+    intercept: float
+    slope: float
+
+    def __call__(self, x: float) -> float:
+        return self.intercept + self.slope * x
+
+
+def fit_line(xs: List[float], ys: List[float]) -> Fit:
+    """Least squares line through (xs, ys), kept non-negative
+
+    A line with a negative intercept is refitted through the origin, and one
+    with a negative slope is flattened to the mean.
+    """
+    n = len(xs)
+    mean_x, mean_y = sum(xs) / n, sum(ys) / n
+    var = sum((x - mean_x) ** 2 for x in xs)
+    slope = 0.0
+    if var:
+        slope = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / var
+    if slope < 0:
+        return Fit(mean_y, 0.0)
+    if mean_y - slope * mean_x >= 0 and var:
+        return Fit(mean_y - slope * mean_x, slope)
+    squares = sum(x * x for x in xs)
+    if not squares:
+        return Fit(mean_y, 0.0)
+    return Fit(0.0, sum(x * y for x, y in zip(xs, ys)) / squares)
+
+
+class ChunkCost(NamedTuple):
+    somatic_wall: float
+    process_wall: float
+    max_rss: int
+
+    @property
+    def wall(self) -> float:
+        return self.somatic_wall + self.process_wall
+
+
+class CostModel:
+    def __init__(self, path: str, samples: Optional[Dict[str, List[List]]] = None):
+        self.path = path
+        # stage -> [[chunk mpileup bytes, wall seconds, peak RSS bytes], ...]
+        self.samples: Dict[str, List[List]] = samples or {}
+        self._fits: Dict[str, Optional[Fit]] = {}
+
+    @classmethod
+    def load(cls, path: str) -> "CostModel":
+        """Read a model file; a missing or unreadable file starts empty"""
+        try:
+            with open(path) as fh:
+                data = json.load(fh)
+        except FileNotFoundError:
+            return cls(path)
+        except ValueError:
+            logger.warning("Ignoring unreadable cost model %s", path)
+            return cls(path)
+        if data.get("version") != MODEL_VERSION:
+            logger.warning("Ignoring cost model %s from another version", path)
+            return cls(path)
+        return cls(path, data.get("samples", {}))
+
+    def save(self) -> None:
+        tmp = "{}.tmp".format(self.path)
+        with open(tmp, "w") as fh:
+            json.dump({"version": MODEL_VERSION, "samples": self.samples}, fh)
+        os.replace(tmp, self.path)
+
+    def add_report(self, report: Dict) -> int:
+        """Add the stage metrics of a run report, returning the samples added
+
+        Chunks streamed from stdin or compressed inputs have no size and are
+        skipped, as are stages that ran no command: those restored from a
+        cache, and processSomatic run in-process by the native backend.
+        """
+        added = 0
+        for chunk in report.get("chunks", {}).values():
+            stages = chunk["stages"]
+            size = stages.get(SOMATIC, {}).get("input_bytes")
+            if size is None:
+                continue
+            for stage, stage_metrics in stages.items():
+                if not stage_metrics["max_rss"]:
+                    continue
+                samples = self.samples.setdefault(stage, [])
+                samples.append([size, stage_metrics["wall"], stage_metrics["max_rss"]])
+                del samples[:-MAX_SAMPLES]
+                added += 1
+        self._fits.clear()
+        return added
+
+    def add_report_file(self, path: str) -> int:
+        with open(path) as fh:
+            added = self.add_report(json.load(fh))
+        logger.info("Added %s stage samples from %s to the cost model", added, path)
+        return added
+
+    def _fit(self, stage: str, column: int) -> Optional[Fit]:
+        key = "{}:{}".format(stage, column)
+        if key not in self._fits:
+            samples = self.samples.get(stage)
+            self._fits[key] = None
+            if samples:
+                xs = [float(sample[0]) for sample in samples]
+                ys = [float(sample[column]) for sample in samples]
+                self._fits[key] = fit_line(xs, ys)
+        return self._fits[key]
+
+    def stage_rss(self, stage: str) -> Optional[Fit]:
+        """Peak RSS of a stage by chunk mpileup bytes; None without samples"""
+        return self._fit(stage, 2)
+
+    @property
+    def fitted(self) -> bool:
+        return bool(self.samples.get(SOMATIC))
+
+    def predict(self, size: int) -> ChunkCost:
+        """Cost of a chunk of `size` mpileup bytes
+
+        The snp and indel processSomatic stages of a chunk run side by side,
+        so the chunk takes the longer of the two and holds both at once.
+        """
+        if not self.fitted:
+            raise ValueError("Cost model {} has no somatic samples".format(self.path))
+        process_wall, process_rss = 0.0, 0.0
+        for stage in (PROCESS_SNP, PROCESS_INDEL):
+            wall, rss = self._fit(stage, 1), self._fit(stage, 2)
+            if wall is not None:
+                process_wall = max(process_wall, wall(size))
+                process_rss += rss(size)
+        return ChunkCost(
+            somatic_wall=self._fit(SOMATIC, 1)(size),
+            process_wall=process_wall,
+            max_rss=int(max(self._fit(SOMATIC, 2)(size), process_rss)),
+        )
+
+    def chunk_seconds(self, mpileup: str) -> float:
+        """Schedule cost: predicted wall seconds of a chunk"""
+        size = jvm.input_size(mpileup)
+        return self.predict(size).wall if size is not None else 0.0
+
+
+class InputProfile(NamedTuple):
+    name: str
+    size: int
+    lines: int
+    contigs: int
+    # Size the run sizes heaps and predicts costs by, jvm.input_size: None
+    # for compressed inputs, which get the heap ceiling.
+    input_bytes: Optional[int]
+
+
+def _profile(name: str, lines: Iterable[bytes]) -> InputProfile:
+    size = count = 0
+    contigs = set()
+    for line in lines:
+        size += len(line)
+        count += 1
+        contigs.add(line[: line.find(b"\t")])
+    return InputProfile(name, size, count, len(contigs), jvm.input_size(name))
+
+
+def profile_inputs(mpileups: List[str]) -> List[InputProfile]:
+    """Uncompressed bytes, lines and contigs of each input mpileup"""
+    profiles = []
+    for mpileup in mpileups:
+        if mpileup == utils.STDIN:
+            raise ValueError("Cannot plan a run reading its mpileup from stdin")
+        with utils.open_mpileup(mpileup) as fh:
+            profiles.append(_profile(mpileup, fh))
+    return profiles
+
+
+def profile_chunks(
+    mpileups: List[str], chunks: List[List[regions.Region]]
+) -> List[InputProfile]:
+    """Profiles of the chunks scatter_mpileup would write, without writing"""
+    if utils.STDIN in mpileups:
+        raise ValueError("Cannot plan a run reading its mpileup from stdin")
+    lookup = regions.RegionLookup(chunks)
+    sizes = [0] * len(chunks)
+    lines = [0] * len(chunks)
+    contigs: List[set] = [set() for _ in chunks]
+    for mpileup in mpileups:
+        with utils.open_mpileup(mpileup) as fh:
+            for line in fh:
+                contig, pos = line.split(b"\t", 2)[:2]
+                idx = lookup.find(contig.decode(), int(pos))
+                if idx is not None:
+                    sizes[idx] += len(line)
+                    lines[idx] += 1
+                    contigs[idx].add(contig)
+    return [
+        InputProfile(
+            "chunk_{:04d}".format(idx),
+            sizes[idx],
+            lines[idx],
+            len(contigs[idx]),
+            sizes[idx],
+        )
+        for idx in range(len(chunks))
+    ]
+
+
+class ChunkPlan(NamedTuple):
+    profile: InputProfile
+    heap: str
+    cost: Optional[ChunkCost]
+
+
+class Plan(NamedTuple):
+    chunks: List[ChunkPlan]
+    workers: int
+    makespan: Optional[float]
+
+
+def plan(
+    profiles: List[InputProfile],
+    model: Optional[CostModel],
+    heap_policy: jvm.HeapPolicy,
+    thread_count: int,
+    memory_limit: int,
+) -> Plan:
+    """Heaps, predicted costs and makespan of a run over `profiles`
+
+    Concurrency is the thread count, capped by the somatic JVMs that fit in
+    the memory limit at once. Costs are None without a fitted model, or for
+    inputs of unknown size.
+    """
+    chunks, reserved = [], 0
+    for profile in profiles:
+        size = profile.input_bytes
+        settings = heap_policy.settings(size)
+        reserved = max(reserved, settings.memory)
+        cost = None
+        if model and model.fitted and size is not None:
+            cost = model.predict(size)
+        chunks.append(ChunkPlan(profile, settings.heap, cost))
+    workers = max(1, min(thread_count, memory_limit // max(reserved, 1)))
+    makespan = None
+    if chunks and all(chunk.cost for chunk in chunks):
+        walls = sorted((chunk.cost.wall for chunk in chunks), reverse=True)
+        makespan = scheduler.predict_makespan(walls, workers)
+    return Plan(chunks, workers, makespan)
+
+
+def format_plan(run_plan: Plan) -> str:
+    lines = ["chunk\tinput\tbytes\tlines\tcontigs\theap\twall_s\tpeak_rss_mib"]
+    for idx, chunk in enumerate(run_plan.chunks):
+        profile, cost = chunk.profile, chunk.cost
+        lines.append(
+            "\t".join(
+                [
+                    str(idx),
+                    profile.name,
+                    str(profile.size),
+                    str(profile.lines),
+                    str(profile.contigs),
+                    chunk.heap,
+                    "{:.1f}".format(cost.wall) if cost else "?",
+                    str(cost.max_rss >> 20) if cost else "?",
+                ]
+            )
+        )
+    if run_plan.makespan is None:
+        lines.append(
+            "No fitted cost model, or compressed inputs; runtime and memory are unknown."
+        )
+    else:
+        peak = max(chunk.cost.max_rss for chunk in run_plan.chunks)
+        lines.append(
+            "Predicted makespan {:.1f}s on {} workers, peak RSS {} MiB per chunk".format(
+                run_plan.makespan, run_plan.workers, peak >> 20
+            )
+        )
+    return "\n".join(lines) + "\n"
+
+
+# __END__
@@ -0,0 +1,18 @@
+#!/usr/bin/env python3
+"""
+Option defaults shared by the multi_varscan and varscan_tool command lines.
+
+Kept free of imports, so the varscan_tool command line can use them without
+loading the pipeline.
+"""
+
+VARSCAN_JAR = "/usr/local/bin/varscan.jar"
+# processSomatic implementations, the VarScan JVM first as the default.
+PROCESS_BACKENDS = ("jvm", "native")
+# processSomatic calling thresholds.
+MIN_TUMOR_FREQ = 0.10
+MAX_NORMAL_FREQ = 0.05
+VPS_P_VALUE = 0.07
+
+
+# __END__
@@ -0,0 +1,462 @@
+#!/usr/bin/env python3
+"""
+Coordinator and workers sharing chunk tasks through a queue directory.
+
+The coordinator publishes one task per chunk, in scheduling order, to a
+directory on a filesystem shared with the worker hosts. Workers claim a
+task by creating its lease file, keep the lease fresh while they run the
+chunk's stages as a local run would, and publish the result. A lease that is not renewed
+within the lease time, e.g. because its worker died, is removed by the
+coordinator so another worker can claim the task. Every attempt writes to
+its own directory and only the first result of a task is kept, so a worker
+that lost its lease cannot clobber another attempt's outputs.
+
+Layout of the queue directory:
+
+    run.json            run parameters shared by all tasks
+    tasks/<id>.json     published tasks
+    leases/<id>         current claim of a task: worker and attempt token
+    attempts/<id>.<token>/
+                        stage outputs of one attempt
+    done/<id>.json      result of the first attempt to finish
+    failed/<id>.json    error of the first attempt to fail
+    closed              written by the coordinator once it stops
+"""
+
+import argparse
+import json
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+from typing import Dict, List, NamedTuple, Optional
+
+from varscan_tool import scheduler, utils
+from varscan_tool.footprint import Footprint
+from varscan_tool.metrics import StageMetrics
+from varscan_tool.retry import Attempt
+from varscan_tool.varscan import VarscanReturn
+from varscan_tool.varscan_somatic import VarscanSomatic
+
+DI = SimpleNamespace(subprocess=subprocess, time=time)
+logger = logging.getLogger(__name__)
+
+LEASE_SECONDS = 60.0
+POLL_SECONDS = 1.0
+DIRECTORIES = ("tasks", "leases", "attempts", "done", "failed")
+
+
+class Lease(NamedTuple):
+    task: Dict
+    worker: str
+    token: str
+
+
+def _write_json(path: str, data) -> None:
+    tmp = "{}.{}.tmp".format(path, uuid.uuid4().hex)
+    with open(tmp, "w") as fh:
+        json.dump(data, fh)
+    os.replace(tmp, path)
+
+
+def _publish_once(path: str, data) -> bool:
+    """Write `path` unless it exists; False if another writer got there first"""
+    tmp = "{}.{}.tmp".format(path, uuid.uuid4().hex)
+    with open(tmp, "w") as fh:
+        json.dump(data, fh)
+    try:
+        os.link(tmp, path)
+    except FileExistsError:
+        return False
+    finally:
+        os.remove(tmp)
+    return True
+
+
+def _read_json(path: str):
+    with open(path) as fh:
+        return json.load(fh)
+
+
+class WorkQueue:
+    def __init__(self, root: str, lease_seconds: float = LEASE_SECONDS, _di=DI):
+        self.root = root
+        self.lease_seconds = lease_seconds
+        self._di = _di
+
+    def _path(self, *names: str) -> str:
+        return os.path.join(self.root, *names)
+
+    def publish(self, parameters: Dict, tasks: List[Dict]) -> None:
+        """Create the queue with tasks to be claimed in the given order"""
+        os.makedirs(self.root, exist_ok=True)
+        if os.listdir(self.root):
+            raise ValueError("Queue directory {} is not empty".format(self.root))
+        for name in DIRECTORIES:
+            os.mkdir(self._path(name))
+        _write_json(self._path("run.json"), parameters)
+        for rank, task in enumerate(tasks):
+            task = dict(task, id="{:06d}".format(rank))
+            _write_json(self._path("tasks", task["id"] + ".json"), task)
+
+    def parameters(self) -> Dict:
+        return _read_json(self._path("run.json"))
+
+    def task_ids(self) -> List[str]:
+        return sorted(name[: -len(".json")] for name in os.listdir(self._path("tasks")))
+
+    def _finished(self, task_id: str) -> bool:
+        return os.path.exists(self._path("done", task_id + ".json")) or os.path.exists(
+            self._path("failed", task_id + ".json")
+        )
+
+    def claim(self, worker: str) -> Optional[Lease]:
+        """Lease the first unfinished, unleased task; None if there is none"""
+        for task_id in self.task_ids():
+            if self._finished(task_id):
+                continue
+            token = uuid.uuid4().hex
+            try:
+                fd = os.open(
+                    self._path("leases", task_id), os.O_CREAT | os.O_EXCL | os.O_WRONLY
+                )
+            except FileExistsError:
+                continue
+            with os.fdopen(fd, "w") as fh:
+                json.dump({"worker": worker, "token": token}, fh)
+            if self._finished(task_id):
+                # Finished between the check and the claim.
+                self.release(Lease({"id": task_id}, worker, token))
+                continue
+            task = _read_json(self._path("tasks", task_id + ".json"))
+            return Lease(task, worker, token)
+        return None
+
+    def holds(self, lease: Lease) -> bool:
+        try:
+            claim = _read_json(self._path("leases", lease.task["id"]))
+        except (OSError, ValueError):
+            return False
+        return claim.get("token") == lease.token
+
+    def renew(self, lease: Lease) -> bool:
+        """Refresh a lease; False once it expired and may be claimed by another"""
+        if not self.holds(lease):
+            return False
+        try:
+            os.utime(self._path("leases", lease.task["id"]))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def release(self, lease: Lease) -> None:
+        if self.holds(lease):
+            try:
+                os.remove(self._path("leases", lease.task["id"]))
+            except FileNotFoundError:
+                pass
+
+    def attempt_dir(self, lease: Lease) -> str:
+        path = self._path("attempts", "{}.{}".format(lease.task["id"], lease.token))
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def complete(self, lease: Lease, result: Dict) -> bool:
+        """Publish a task's result; False if another attempt finished first"""
+        published = _publish_once(
+            self._path("done", lease.task["id"] + ".json"), result
+        )
+        self.release(lease)
+        return published
+
+    def fail(self, lease: Lease, error: str) -> None:
+        _publish_once(
+            self._path("failed", lease.task["id"] + ".json"),
+            {"worker": lease.worker, "error": error},
+        )
+        self.release(lease)
+
+    def expire(self) -> List[str]:
+        """Remove leases not renewed within the lease time, returning their tasks"""
+        expired = []
+        now = self._di.time.time()
+        for task_id in os.listdir(self._path("leases")):
+            path = self._path("leases", task_id)
+            try:
+                if now - os.stat(path).st_mtime <= self.lease_seconds:
+                    continue
+                # Renaming first means one remover wins and a fresh lease
+                # created meanwhile is left alone.
+                stale = "{}.{}.expired".format(path, uuid.uuid4().hex)
+                os.rename(path, stale)
+                claim = _read_json(stale)
+                os.remove(stale)
+            except (OSError, ValueError):
+                continue
+            logger.warning(
+                "Lease of task %s by %s expired, re-leasing", task_id, claim["worker"]
+            )
+            expired.append(task_id)
+        return expired
+
+    def results(self) -> Dict[str, Dict]:
+        return {
+            name[: -len(".json")]: _read_json(self._path("done", name))
+            for name in os.listdir(self._path("done"))
+            if name.endswith(".json")
+        }
+
+    def failures(self) -> Dict[str, Dict]:
+        return {
+            name[: -len(".json")]: _read_json(self._path("failed", name))
+            for name in os.listdir(self._path("failed"))
+            if name.endswith(".json")
+        }
+
+    def close(self) -> None:
+        _write_json(self._path("closed"), {})
+
+    @property
+    def closed(self) -> bool:
+        return os.path.exists(self._path("closed"))
+
+
+class _Heartbeat:
+    """Renews a lease from a background thread until stopped"""
+
+    def __init__(self, queue: WorkQueue, lease: Lease):
+        self.queue = queue
+        self.lease = lease
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.queue.lease_seconds / 3):
+            if not self.queue.renew(self.lease):
+                logger.warning("Lost the lease of task %s", self.lease.task["id"])
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_chunk(task: Dict, args, _varscan=None) -> VarscanReturn:
+    """Run a task's chunk through the stage graph of a local run
+
+    Stages are retried, sized and scheduled as the run's options ask, within
+    this host's memory budget unless the run set --memory-limit. The chunk is
+    not owned by the worker, so --low-footprint leaves it for other attempts.
+    Raises ValueError if the chunk fails.
+    """
+    # Imported here, as multi_varscan imports this module.
+    from varscan_tool import multi_varscan
+
+    thread_count, budget = multi_varscan.setup_resources(args)
+    results = multi_varscan.tpe_submit_commands(
+        args,
+        [task["mpileup"]],
+        thread_count,
+        budget,
+        multi_varscan.retry_policy(args, budget),
+        footprint=Footprint(args.low_footprint),
+        _varscan=_varscan,
+    )
+    if not results:
+        raise ValueError("Chunk {} failed".format(task["mpileup"]))
+    return results[0]._replace(idx=task["idx"])
+
+
+def run_worker(
+    queue_dir: str,
+    worker: Optional[str] = None,
+    poll: float = POLL_SECONDS,
+    _varscan=None,
+    _di=DI,
+) -> int:
+    """Run queued tasks until the coordinator closes the queue; returns tasks run"""
+    worker = worker or "{}:{}".format(socket.gethostname(), os.getpid())
+    parameters = WorkQueue(queue_dir).parameters()
+    queue = WorkQueue(queue_dir, parameters["lease_seconds"], _di=_di)
+    VarscanSomatic.set_attributes(SimpleNamespace(**parameters))
+    count = 0
+    while not queue.closed:
+        lease = queue.claim(worker)
+        if lease is None:
+            _di.time.sleep(poll)
+            continue
+        task = lease.task
+        logger.info(
+            "Worker %s running task %s: %s", worker, task["id"], task["mpileup"]
+        )
+        args = SimpleNamespace(**dict(parameters, workdir=queue.attempt_dir(lease)))
+        with _Heartbeat(queue, lease):
+            try:
+                result = run_chunk(task, args, _varscan)
+            except Exception as e:
+                logger.exception(e)
+                queue.fail(lease, repr(e))
+                continue
+        if not queue.complete(lease, result._asdict()):
+            logger.warning("Task %s was already finished elsewhere", task["id"])
+        count += 1
+    logger.info("Worker %s stopping after %s task(s)", worker, count)
+    return count
+
+
+def _spawn_worker(queue_dir: str, _di=DI):
+    # In its own session, so stopping it also stops the commands it runs.
+    return _di.subprocess.Popen(
+        [sys.executable, "-m", "varscan_tool.distributed", "--queue-dir", queue_dir],
+        start_new_session=True,
+    )
+
+
+def _stop_worker(process) -> None:
+    if process.poll() is None:
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+
+def _in_scratch(path: str, scratch_dir: Optional[str]) -> bool:
+    if not scratch_dir:
+        return False
+    scratch = os.path.abspath(scratch_dir)
+    return os.path.commonpath([scratch, os.path.abspath(path)]) == scratch
+
+
+def _varscan_return(result: Dict) -> VarscanReturn:
+    """A VarscanReturn from the JSON of a published result"""
+    return VarscanReturn(
+        snp_file=result["snp_file"],
+        indel_file=result["indel_file"],
+        mpileup=result["mpileup"],
+        idx=result["idx"],
+        attempts=tuple(Attempt(*attempt) for attempt in result["attempts"]),
+        metrics=tuple(StageMetrics(*metrics) for metrics in result["metrics"]),
+    )
+
+
+def _describe(failures: Dict[str, Dict]) -> str:
+    return "; ".join(
+        "{} on {}: {}".format(k, v["worker"], v["error"])
+        for k, v in sorted(failures.items())
+    )
+
+
+def coordinate(
+    args,
+    mpileups: List[str],
+    local_workers: int = 0,
+    lease_seconds: float = LEASE_SECONDS,
+    poll: float = POLL_SECONDS,
+    _di=DI,
+) -> List[VarscanReturn]:
+    """Publish chunk tasks to args.queue_dir and wait for workers to run them
+
+    `local_workers` worker processes are started on this host and replaced
+    if they die while tasks remain; others may join from any host sharing
+    the queue directory. With --on-failure fail-fast, raises ValueError once
+    any task fails, stopping the local workers; otherwise failed tasks are
+    logged and the results of the others returned once all have finished.
+    Raises ValueError for chunks in --scratch-dir, which is local to this host.
+    """
+    # Imported here, as multi_varscan imports this module.
+    from varscan_tool.multi_varscan import FAIL_FAST
+
+    # Workers may start in another directory.
+    queue_dir = os.path.abspath(args.queue_dir)
+    if utils.STDIN in mpileups:
+        raise ValueError("Queued workers cannot read stdin; scatter it first")
+    local = [path for path in mpileups if _in_scratch(path, args.scratch_dir)]
+    if local:
+        raise ValueError(
+            "Queued workers cannot read chunks in --scratch-dir {}: {}; "
+            "use a --workdir on the shared filesystem".format(
+                args.scratch_dir, ", ".join(local)
+            )
+        )
+    queue = WorkQueue(queue_dir, lease_seconds, _di=_di)
+    work = scheduler.lpt_order(mpileups, scheduler.file_size_cost)
+    tasks = [
+        {"idx": item.idx, "mpileup": os.path.abspath(item.mpileup)} for item in work
+    ]
+    parameters = dict(args._asdict(), queue_dir=queue_dir, lease_seconds=lease_seconds)
+    queue.publish(parameters, tasks)
+    logger.info("Published %s tasks to %s", len(tasks), queue_dir)
+
+    workers = [_spawn_worker(queue_dir, _di) for _ in range(local_workers)]
+    spawns = len(workers)
+    reported: Dict[str, Dict] = {}
+    try:
+        while True:
+            failures = queue.failures()
+            if failures and args.on_failure == FAIL_FAST:
+                raise ValueError("Task(s) failed: {}".format(_describe(failures)))
+            new = {k: v for k, v in failures.items() if k not in reported}
+            if new:
+                logger.error("Task(s) failed: %s", _describe(new))
+                reported.update(new)
+            results = queue.results()
+            finished = set(results) | set(failures)
+            if len(finished) == len(tasks):
+                break
+            queue.expire()
+            for idx, process in enumerate(workers):
+                if process.poll() is not None and spawns < local_workers + len(tasks):
+                    logger.warning(
+                        "Local worker %s exited (%s), starting another",
+                        process.pid,
+                        process.returncode,
+                    )
+                    workers[idx] = _spawn_worker(queue_dir, _di)
+                    spawns += 1
+            _di.time.sleep(poll)
+    except BaseException:
+        for process in workers:
+            _stop_worker(process)
+        raise
+    finally:
+        queue.close()
+        for process in workers:
+            process.wait()
+    return [_varscan_return(result) for _, result in sorted(results.items())]
+
+
+def setup_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Run multi_varscan queued tasks.")
+    parser.add_argument("--queue-dir", required=True, help="Shared queue directory.")
+    parser.add_argument("--worker-id", default=None, help="Name in leases (host:pid).")
+    parser.add_argument(
+        "--poll", type=float, default=POLL_SECONDS, help="Seconds between claims (1)."
+    )
+    return parser
+
+
+def main(argv=None) -> int:
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+    )
+    args = setup_parser().parse_args(argv)
+    run_worker(args.queue_dir, args.worker_id, args.poll)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+
+# __END__
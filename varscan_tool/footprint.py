@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Scratch space held by a run's intermediate files, and their eager removal.
+"""
+
+import logging
+import os
+from typing import Dict, Iterable, List
+
+from varscan_tool.varscan_somatic_process import CATEGORIES, MERGED, output_paths
+
+logger = logging.getLogger(__name__)
+
+
+class Footprint:
+    """Bytes of intermediates on disk, and their peak.
+
+    Files are counted from when the stage writing them finishes until they
+    are removed. With `discard`, intermediates are removed as soon as no
+    stage reads them any more, leaving only the outputs that are merged.
+    Inputs are only removed when `owned` by the run, e.g. scattered chunks.
+    """
+
+    def __init__(self, discard: bool = False, owned: Iterable[str] = ()):
+        self.discard = discard
+        self.owned = set(owned)
+        self.current = 0
+        self.peak = 0
+        self._sizes: Dict[str, int] = {}
+        self.track(self.owned)
+
+    def kept(self, input_vcf: str) -> List[str]:
+        """processSomatic outputs of a raw VCF left on disk"""
+        return output_paths(input_vcf, (MERGED,) if self.discard else CATEGORIES)
+
+    def track(self, paths: Iterable[str]) -> None:
+        """Count files that were just written"""
+        for path in paths:
+            try:
+                size = os.stat(path).st_size
+            except OSError:
+                continue
+            self.current += size - self._sizes.get(path, 0)
+            self._sizes[path] = size
+        self.peak = max(self.peak, self.current)
+
+    def consumed(self, paths: Iterable[str]) -> None:
+        """Remove intermediates no longer read, when discarding"""
+        if not self.discard:
+            return
+        for path in paths:
+            if path not in self._sizes and path not in self.owned:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.current -= self._sizes.pop(path, 0)
+
+    def process_consumed(self, input_vcf: str) -> None:
+        """Remove a raw VCF and the processSomatic outputs that are not merged"""
+        kept = set(self.kept(input_vcf))
+        unused = [path for path in output_paths(input_vcf) if path not in kept]
+        self.consumed([input_vcf] + unused)
+
+    def log(self) -> None:
+        logger.info(
+            "Peak scratch usage %.1f MiB of intermediates%s",
+            self.peak / (1 << 20),
+            " (removed once consumed)" if self.discard else "",
+        )
+
+
+# __END__
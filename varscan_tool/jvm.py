@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Per-stage JVM heap sizing and flags.
+"""
+
+from typing import Callable, NamedTuple, Optional
+
+from varscan_tool import resources, splitter, utils
+
+DEFAULT_JVM_FLAGS = "-XX:+UseSerialGC"
+
+# Heap bytes added per input byte, before clamping to the stage's floor and
+# ceiling. somatic streams its mpileup, so its heap does not grow with the
+# input; without a fitted cost model every chunk gets --java-opts.
+SOMATIC_HEAP_RATIO = 0.0
+# processSomatic heap bytes per raw VCF byte. VarScan reads the VCF record
+# by record, and Java keeps ASCII text at one byte per character, so a heap
+# the size of the VCF could hold all of it: a bound that errs towards too
+# much heap rather than an OOM, with the ceiling capping large VCFs.
+PROCESS_HEAP_PER_VCF_BYTE = 1.0
+# Heap given per byte of a stage's predicted peak RSS beyond JVM_OVERHEAD.
+RSS_HEADROOM = 1.5
+
+
+class JvmSettings(NamedTuple):
+    heap: str
+    flags: str = DEFAULT_JVM_FLAGS
+
+    @property
+    def memory(self) -> int:
+        """Bytes to reserve while this JVM runs"""
+        return resources.parse_size(self.heap) + resources.JVM_OVERHEAD
+
+
+class HeapPolicy(NamedTuple):
+    floor: int
+    ceiling: int
+    ratio: float
+    flags: str = DEFAULT_JVM_FLAGS
+    # Predicted peak RSS by input bytes; sizes the heap instead of `ratio`.
+    rss: Optional[Callable[[int], float]] = None
+
+    def heap_for(self, input_size: Optional[int]) -> int:
+        """Heap for an input of `input_size` bytes; unknown sizes get the ceiling"""
+        if input_size is None:
+            return self.ceiling
+        if self.rss is None:
+            heap = self.floor + input_size * self.ratio
+        else:
+            heap = (self.rss(input_size) - resources.JVM_OVERHEAD) * RSS_HEADROOM
+        return int(max(self.floor, min(self.ceiling, heap)))
+
+    def settings(self, input_size: Optional[int]) -> JvmSettings:
+        return JvmSettings(resources.format_size(self.heap_for(input_size)), self.flags)
+
+
+def input_size(path: str) -> Optional[int]:
+    """Size of a stage input, None when it is streamed or missing
+
+    Slices are streamed, but their size is known.
+    """
+    if splitter.parse_slice(path) is None and utils.is_streamed_input(path):
+        return None
+    try:
+        return splitter.byte_size(path)
+    except OSError:
+        return None
+
+
+def somatic_policy(args, rss: Optional[Callable[[int], float]] = None) -> HeapPolicy:
+    """somatic's heap policy
+
+    Every chunk gets --java-opts, unless `rss` predicts its peak RSS, e.g. a
+    fitted cost model: then the heap has RSS_HEADROOM over the predicted heap
+    use, within --somatic-heap-floor and --java-opts.
+    """
+    heap = resources.parse_size(args.java_opts)
+    return HeapPolicy(
+        floor=heap if rss is None else resources.parse_size(args.somatic_heap_floor),
+        ceiling=heap,
+        ratio=SOMATIC_HEAP_RATIO,
+        flags=args.somatic_jvm_flags,
+        rss=rss,
+    )
+
+
+def process_policy(args) -> HeapPolicy:
+    return HeapPolicy(
+        floor=resources.parse_size(args.process_heap_floor),
+        ceiling=resources.parse_size(args.process_heap_ceiling),
+        ratio=PROCESS_HEAP_PER_VCF_BYTE,
+        flags=args.process_jvm_flags,
+    )
+
+
+# __END__
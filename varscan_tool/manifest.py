@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Checkpoint manifest of finished per-chunk stages, for resuming killed runs.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Dict, List, Optional
+
+from varscan_tool import splitter, utils
+from varscan_tool.varscan_somatic import VarscanSomatic
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+# Bytes hashed at each of the head, middle and tail of an input fingerprint.
+SAMPLE_SIZE = 1 << 20
+_READ_SIZE = 1 << 20
+
+PROCESS_ATTRS = (
+    "varscan_jar",
+    "min_tumor_freq",
+    "max_normal_freq",
+    "vps_p_value",
+    "process_backend",
+)
+# Resource settings that do not change the calls.
+IGNORED_ATTRS = ("java_opts", "timeout")
+
+
+def checksum(path: str) -> str:
+    """sha256 of a file's contents, or of a slice spec's bytes"""
+    digest = hashlib.sha256()
+    with splitter.open_range(path) as fh:
+        for block in iter(lambda: fh.read(_READ_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def fingerprint(path: str, sample_size: Optional[int] = SAMPLE_SIZE) -> Optional[str]:
+    """Size and a sampled sha256 of an input; None for stdin
+
+    Only the head, middle and tail are hashed, so fingerprinting a large
+    mpileup stays cheap; the mtime is left out so rewritten chunks with the
+    same content keep their fingerprint. An edit elsewhere that keeps the
+    size goes unnoticed, so inputs edited in place must not be resumed. A
+    `sample_size` of None hashes the whole file.
+    """
+    if path == utils.STDIN:
+        return None
+    size = splitter.byte_size(path)
+    if sample_size is None:
+        return "{}:{}".format(size, checksum(path))
+    digest = hashlib.sha256()
+    with splitter.open_range(path) as fh:
+        for offset in sorted(
+            {0, max(0, size // 2 - sample_size // 2), max(0, size - sample_size)}
+        ):
+            fh.seek(offset)
+            digest.update(fh.read(sample_size))
+    return "{}:{}".format(size, digest.hexdigest())
+
+
+def somatic_parameters(args) -> Dict:
+    """VarScan somatic parameters that determine its outputs"""
+    attrs = [a for a in VarscanSomatic.ATTRS if a not in IGNORED_ATTRS]
+    return {attr: getattr(args, attr, None) for attr in attrs}
+
+
+def process_parameters(args) -> Dict:
+    """processSomatic parameters that determine its outputs"""
+    return {attr: getattr(args, attr, None) for attr in PROCESS_ATTRS}
+
+
+def run_parameters(args) -> Dict:
+    """Caller parameters that determine a chunk's outputs"""
+    return {**somatic_parameters(args), **process_parameters(args)}
+
+
+class Manifest:
+    """Per-chunk stage outputs with their checksums.
+
+    The file is rewritten atomically after every recorded stage, so a run
+    killed at any point leaves a manifest describing only complete stages.
+    Output checksums can be taken ahead of `record` with `checksum_outputs`,
+    on the thread that ran the stage.
+    """
+
+    def __init__(self, path: str, parameters: Dict):
+        self.path = path
+        self.parameters = parameters
+        self.chunks: Dict[str, Dict] = {}
+        self._fingerprints: Dict[str, Optional[str]] = {}
+        self._checksums: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str, parameters: Dict) -> "Manifest":
+        """Resume from `path`; a missing or mismatched manifest starts empty"""
+        manifest = cls(path, parameters)
+        try:
+            with open(path) as fh:
+                data = json.load(fh)
+        except FileNotFoundError:
+            logger.info("No manifest at %s, running all chunks", path)
+            return manifest
+        except ValueError:
+            logger.warning("Ignoring unreadable manifest %s", path)
+            return manifest
+        if data.get("version") != MANIFEST_VERSION:
+            logger.warning("Ignoring manifest %s from another version", path)
+        elif data.get("parameters") != parameters:
+            logger.warning("Ignoring manifest %s run with other parameters", path)
+        else:
+            manifest.chunks = data.get("chunks", {})
+        return manifest
+
+    def fingerprint(self, mpileup: str) -> Optional[str]:
+        if mpileup not in self._fingerprints:
+            self._fingerprints[mpileup] = fingerprint(mpileup)
+        return self._fingerprints[mpileup]
+
+    def stage_outputs(self, mpileup: str, stage: str) -> Optional[List[str]]:
+        """Outputs of a finished stage, None unless all are present and intact"""
+        chunk = self.chunks.get(mpileup)
+        if chunk is None or stage not in chunk["stages"]:
+            return None
+        current = self.fingerprint(mpileup)
+        if current is None or chunk["fingerprint"] != current:
+            return None
+        outputs = chunk["stages"][stage]
+        for path, expected in outputs:
+            if not os.path.exists(path) or checksum(path) != expected:
+                logger.warning("%s output %s is missing or corrupt", stage, path)
+                return None
+        return [path for path, _ in outputs]
+
+    def checksum_outputs(self, paths: List[str]) -> None:
+        """Checksum stage outputs for their coming `record`"""
+        checksums = {path: checksum(path) for path in paths if os.path.exists(path)}
+        with self._lock:
+            self._checksums.update(checksums)
+
+    def _checksum(self, path: str) -> str:
+        with self._lock:
+            found = self._checksums.pop(path, None)
+        return checksum(path) if found is None else found
+
+    def record(
+        self,
+        mpileup: str,
+        idx: int,
+        stage: str,
+        outputs: List[str],
+        invalidates=(),
+    ) -> None:
+        """Record a finished stage, forgetting the stages that consume it"""
+        current = self.fingerprint(mpileup)
+        chunk = self.chunks.get(mpileup)
+        if chunk is None or chunk["fingerprint"] != current:
+            chunk = {"idx": idx, "fingerprint": current, "stages": {}}
+            self.chunks[mpileup] = chunk
+        for dependent in invalidates:
+            chunk["stages"].pop(dependent, None)
+        chunk["stages"][stage] = [[path, self._checksum(path)] for path in outputs]
+        self.save()
+
+    def save(self) -> None:
+        tmp = "{}.tmp".format(self.path)
+        with open(tmp, "w") as fh:
+            json.dump(
+                {
+                    "version": MANIFEST_VERSION,
+                    "parameters": self.parameters,
+                    "chunks": self.chunks,
+                },
+                fh,
+                indent=1,
+                sort_keys=True,
+            )
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, self.path)
+
+
+# __END__
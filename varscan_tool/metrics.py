@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Per-chunk, per-stage resource metrics and the run metrics report.
+"""
+
+import json
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from varscan_tool import utils
+from varscan_tool.utils import ResourceUsage
+
+
+class StageMetrics(NamedTuple):
+    chunk: int
+    stage: str
+    wall: float
+    user: float
+    sys: float
+    max_rss: int
+    read_bytes: Optional[int]
+    write_bytes: Optional[int]
+    input_bytes: Optional[int]
+    heap: Optional[str]
+
+
+def measure(fn, *args) -> Tuple[object, ResourceUsage]:
+    """Run fn, returning its result and the resources it used
+
+    CPU time of the calling thread is counted as user time, for in-process
+    stages; commands it runs through call_subprocess add their own usage.
+    """
+    start, cpu = time.monotonic(), time.thread_time()
+    with utils.collect_usage() as usages:
+        result = fn(*args)
+    return result, _total(usages, time.monotonic() - start, time.thread_time() - cpu)
+
+
+async def measure_async(fn, *args) -> Tuple[object, ResourceUsage]:
+    """Await coroutine function fn, returning its result and the resources it used
+
+    The event loop's CPU time is shared by all tasks, so only the usage of
+    commands fn runs is counted.
+    """
+    start = time.monotonic()
+    with utils.collect_usage() as usages:
+        result = await fn(*args)
+    return result, _total(usages, time.monotonic() - start, 0.0)
+
+
+def _total(usages: List[ResourceUsage], wall: float, cpu: float) -> ResourceUsage:
+    read_bytes = [u.read_bytes for u in usages if u.read_bytes is not None]
+    write_bytes = [u.write_bytes for u in usages if u.write_bytes is not None]
+    return ResourceUsage(
+        wall=wall,
+        user=cpu + sum(u.user for u in usages),
+        sys=sum(u.sys for u in usages),
+        max_rss=max((u.max_rss for u in usages), default=0),
+        read_bytes=sum(read_bytes) if read_bytes else None,
+        write_bytes=sum(write_bytes) if write_bytes else None,
+    )
+
+
+def summarize(metrics: Iterable[StageMetrics]) -> Dict[str, Dict]:
+    """Totals per stage: chunks, wall and CPU seconds, and the peak RSS"""
+    stages: Dict[str, Dict] = {}
+    for m in metrics:
+        total = stages.setdefault(
+            m.stage, {"chunks": 0, "wall": 0.0, "cpu": 0.0, "max_rss": 0}
+        )
+        total["chunks"] += 1
+        total["wall"] += m.wall
+        total["cpu"] += m.user + m.sys
+        total["max_rss"] = max(total["max_rss"], m.max_rss)
+    return stages
+
+
+def write_report(path: str, results, run: Dict) -> None:
+    """Write run settings and metrics keyed by chunk and stage as JSON"""
+    chunks = {}
+    for result in sorted(results, key=lambda r: r.idx):
+        chunks[str(result.idx)] = {
+            "mpileup": result.mpileup,
+            "stages": {m.stage: m._asdict() for m in result.metrics},
+        }
+    all_metrics = [m for result in results for m in result.metrics]
+    with open(path, "w") as fh:
+        json.dump(
+            {"run": run, "stages": summarize(all_metrics), "chunks": chunks},
+            fh,
+            indent=1,
+        )
+
+
+# __END__
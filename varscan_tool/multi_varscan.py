@@ -7,25 +7,54 @@ Multithreading VarScan2.3.9
 
 import argparse
 import concurrent.futures
+import contextlib
 import logging
 import os
 import pathlib
+import shutil
 import sys
+import tempfile
 import time
-from collections import namedtuple
+from collections import Counter, namedtuple
 from logging.config import dictConfig
 from types import SimpleNamespace
-from typing import List, Optional
-
-from varscan_tool import __version__, utils
+from typing import List, Optional, Tuple
+
+from varscan_tool import (
+    __version__,
+    async_engine,
+    cost_model,
+    defaults,
+    distributed,
+    jvm,
+    metrics,
+    qc,
+    regions,
+    resources,
+    scheduler,
+    splitter,
+    utils,
+)
+from varscan_tool.cache import FULL, SAMPLED, ResultCache
+from varscan_tool.footprint import Footprint
+from varscan_tool.manifest import Manifest, run_parameters
+from varscan_tool.pipeline import SOMATIC, ChunkGraph
+from varscan_tool.retry import RetryPolicy
+from varscan_tool.tabix import TabixVcfWriter
 from varscan_tool.varscan import Varscan2, VarscanReturn
 from varscan_tool.varscan_somatic import VarscanSomatic
+from varscan_tool.varscan_somatic_process import MERGED, output_path
 
 logger = logging.getLogger(__name__)
 
 
 DI = SimpleNamespace(futures=concurrent.futures)
 
+THREADS = "threads"
+ASYNCIO = "asyncio"
+BEST_EFFORT = "best-effort"
+FAIL_FAST = "fail-fast"
+
 
 def setup_logger():
     """
@@ -50,22 +79,67 @@ def setup_logger():
 
 
 def tpe_submit_commands(
-    args, mpileups, thread_count: int, _varscan=Varscan2, _di=DI
+    args,
+    mpileups,
+    thread_count: int,
+    budget: Optional[resources.MemoryBudget] = None,
+    retry: Optional[RetryPolicy] = None,
+    manifest: Optional[Manifest] = None,
+    cache: Optional[ResultCache] = None,
+    model: Optional[cost_model.CostModel] = None,
+    footprint: Optional[Footprint] = None,
+    _varscan=None,
+    _scheduler=scheduler,
+    _di=DI,
 ) -> List[VarscanReturn]:
-    """run commands on number of threads"""
-    varscan_results = []
-    with _di.futures.ThreadPoolExecutor(max_workers=thread_count) as executor:
-        futures = [
-            executor.submit(_varscan.run_pipeline, mpileup, idx, args)
-            for idx, mpileup in enumerate(mpileups)
-        ]
-        for future in _di.futures.as_completed(futures):
-            try:
-                result = future.result()
-                logger.info(result)
-                varscan_results.append(result)
-            except Exception as e:
-                logger.exception(e)
+    """run pipeline stages on number of threads, longest estimated job first
+
+    The asyncio engine runs the stages on one event loop instead, with up to
+    `thread_count` in flight. With fail-fast, the first stage failing for
+    good stops the run; the asyncio engine also kills the running JVMs.
+
+    With a memory budget, stages only start while their JVM heaps fit.
+    Stages killed for memory or time are retried as allowed by `retry`.
+    Finished stages are checkpointed to, and resumed from, `manifest`, and
+    restored from `cache` when their inputs and parameters were seen before.
+    The model schedule cost orders chunks by the runtime `model` predicts,
+    and a fitted `model` sizes somatic heaps by the peak RSS it predicts.
+    Intermediates are counted, and removed once consumed, by `footprint`.
+    """
+    if args.schedule_cost != cost_model.MODEL:
+        cost_fn = _scheduler.COST_FUNCTIONS[args.schedule_cost]
+    elif model is not None and model.fitted:
+        cost_fn = model.chunk_seconds
+    else:
+        logger.warning("No fitted cost model, scheduling by input size")
+        cost_fn = _scheduler.file_size_cost
+    work = _scheduler.lpt_order(mpileups, cost_fn)
+    _scheduler.log_schedule(work, thread_count)
+
+    with contextlib.ExitStack() as stack:
+        if args.engine == ASYNCIO:
+            pool = async_engine.AsyncStagePool(thread_count, budget=budget)
+            _varscan = _varscan or async_engine.AsyncVarscan
+        else:
+            executor = stack.enter_context(
+                _di.futures.ThreadPoolExecutor(max_workers=thread_count)
+            )
+            pool = _scheduler.StagePool(executor, thread_count, budget=budget, _di=_di)
+            _varscan = _varscan or Varscan2
+        graph = ChunkGraph(
+            pool,
+            args,
+            retry,
+            manifest,
+            cache,
+            footprint,
+            fail_fast=args.on_failure == FAIL_FAST,
+            somatic_rss=model.stage_rss(SOMATIC) if model is not None else None,
+            _varscan=_varscan,
+        )
+        for item in work:
+            graph.add(item)
+        varscan_results = graph.run()
     return varscan_results
 
 
@@ -87,15 +161,82 @@ def setup_parser() -> argparse.ArgumentParser:
         action="append",
         dest="mpileup",
         required=True,
-        help="The mpileup files for tumor/normal pair.",
+        help="The mpileup files for tumor/normal pair; gzip/bgzip or - for stdin.",
     )
     parser.add_argument(
         "--ref-dict", required=True, help="reference sequence dictionary file."
     )
     parser.add_argument(
-        "--thread-count", type=int, default=2, help="Number of threads."
+        "--scatter-count",
+        type=int,
+        default=None,
+        help="Split the mpileups into N region-balanced chunks planned from --ref-dict.",
+    )
+    parser.add_argument(
+        "--split-count",
+        type=int,
+        default=None,
+        help="Cut each plain mpileup into N byte-balanced slices streamed to VarScan; "
+        "no chunk files are written.",
+    )
+    parser.add_argument(
+        "--split-contigs",
+        action="store_true",
+        help="Only cut --split-count slices where a contig starts.",
+    )
+    parser.add_argument(
+        "--exclude-regions",
+        default=None,
+        help="BED file of regions to leave out of the --scatter-count plan.",
+    )
+    parser.add_argument(
+        "--thread-count",
+        type=int,
+        default=None,
+        help="Number of threads (fit to available CPUs and --memory-limit).",
+    )
+    parser.add_argument(
+        "--memory-limit",
+        default=None,
+        help="Memory budget for concurrent JVMs, e.g. 16G (cgroup or system memory).",
+    )
+    parser.add_argument(
+        "--schedule-cost",
+        choices=sorted([*scheduler.COST_FUNCTIONS, cost_model.MODEL]),
+        default="size",
+        help="Cost estimate used to submit the longest chunks first (size).",
+    )
+    parser.add_argument(
+        "--java-opts",
+        default="3G",
+        help="JVM -Xmx for somatic (3G), and its ceiling when a fitted --cost-model "
+        "sizes the heap; raised only when retrying after an OOM.",
+    )
+    parser.add_argument(
+        "--somatic-heap-floor",
+        default="1G",
+        help="Smallest somatic JVM heap sized from a fitted --cost-model (1G).",
+    )
+    parser.add_argument(
+        "--somatic-jvm-flags",
+        default=jvm.DEFAULT_JVM_FLAGS,
+        help="GC and other JVM flags for somatic, e.g. --somatic-jvm-flags=-XX:+UseParallelGC",
+    )
+    parser.add_argument(
+        "--process-heap-floor",
+        default="256M",
+        help="Smallest processSomatic JVM heap (256M).",
+    )
+    parser.add_argument(
+        "--process-heap-ceiling",
+        default="3G",
+        help="Largest processSomatic JVM heap (3G).",
+    )
+    parser.add_argument(
+        "--process-jvm-flags",
+        default=jvm.DEFAULT_JVM_FLAGS,
+        help="GC and other JVM flags for processSomatic.",
     )
-    parser.add_argument("--java-opts", default="3G", help="JVM -Xmx argument.")
     parser.add_argument(
         "--min-coverage",
         type=int,
@@ -161,6 +302,12 @@ def setup_parser() -> argparse.ArgumentParser:
         action="store_true",
         help="If set, outputs all compared positions even if non-variant",
     )
+    parser.add_argument(
+        "--prefilter",
+        action="store_true",
+        help="Drop mpileup rows below the coverage thresholds or without alt "
+        "bases in either sample before VarScan reads them; not with --validation.",
+    )
     parser.add_argument(
         "--output-vcf",
         type=int,
@@ -170,26 +317,62 @@ def setup_parser() -> argparse.ArgumentParser:
     parser.add_argument(
         "--min-tumor-freq",
         type=float,
-        default=0.10,
-        help="Minimun variant allele frequency in tumor [0.10]",
+        default=defaults.MIN_TUMOR_FREQ,
+        help="Minimun variant allele frequency in tumor [{:.2f}]".format(
+            defaults.MIN_TUMOR_FREQ
+        ),
     )
     parser.add_argument(
         "--max-normal-freq",
         type=float,
-        default=0.05,
-        help="Maximum variant allele frequency in normal [0.05]",
+        default=defaults.MAX_NORMAL_FREQ,
+        help="Maximum variant allele frequency in normal [{:.2f}]".format(
+            defaults.MAX_NORMAL_FREQ
+        ),
     )
     parser.add_argument(
         "--vps-p-value",
         type=float,
-        default=0.07,
-        help="P-value for high-confidence calling [0.07]",
+        default=defaults.VPS_P_VALUE,
+        help="P-value for high-confidence calling [{:.2f}]".format(
+            defaults.VPS_P_VALUE
+        ),
+    )
+    parser.add_argument(
+        "--process-backend",
+        choices=defaults.PROCESS_BACKENDS,
+        default=defaults.PROCESS_BACKENDS[0],
+        help="processSomatic implementation: VarScan JVM or in-process (jvm).",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=(THREADS, ASYNCIO),
+        default=THREADS,
+        help="Run stages on a thread pool, or as asyncio subprocesses (threads).",
+    )
+    parser.add_argument(
+        "--on-failure",
+        choices=(BEST_EFFORT, FAIL_FAST),
+        default=BEST_EFFORT,
+        help="After a stage fails for good, finish other chunks or stop (best-effort).",
     )
     parser.add_argument(
         "--varscan-jar",
-        default="/usr/local/bin/varscan.jar",
+        default=defaults.VARSCAN_JAR,
         required=False,
     )
+    parser.add_argument(
+        "--output-format",
+        choices=("vcf", "vcf.gz"),
+        default="vcf",
+        help="Merged output format; vcf.gz is BGZF with a tabix index (vcf).",
+    )
+    parser.add_argument(
+        "--compress-threads",
+        type=int,
+        default=None,
+        help="Threads for BGZF block compression (thread count).",
+    )
     parser.add_argument(
         "--timeout",
         type=int,
@@ -197,42 +380,395 @@ def setup_parser() -> argparse.ArgumentParser:
         required=False,
         help="Max time for command to run, in seconds.",
     )
+    parser.add_argument(
+        "--max-attempts",
+        type=int,
+        default=3,
+        help="Attempts per stage when a JVM runs out of memory or time (3).",
+    )
+    parser.add_argument(
+        "--retry-backoff",
+        type=float,
+        default=5.0,
+        help="Seconds before the first retry, doubled for each later one (5).",
+    )
+    parser.add_argument(
+        "--retry-heap-factor",
+        type=float,
+        default=2.0,
+        help="Heap multiplier after an out-of-memory failure (2.0).",
+    )
+    parser.add_argument(
+        "--retry-timeout-factor",
+        type=float,
+        default=2.0,
+        help="--timeout multiplier after a timed out attempt (2.0).",
+    )
+    parser.add_argument(
+        "--manifest",
+        default="multi_varscan2.manifest.json",
+        help="Checkpoint manifest of finished chunk stages.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip chunk stages whose outputs in --manifest are intact; inputs are "
+        "fingerprinted by size and sampled blocks, so do not edit them in place.",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        help="Directory of cached chunk results, shared across runs (no cache).",
+    )
+    parser.add_argument(
+        "--cache-size",
+        default=None,
+        help="Size cap of --cache-dir, e.g. 100G; least recently used first out.",
+    )
+    parser.add_argument(
+        "--cache-digest",
+        choices=(FULL, SAMPLED),
+        default=FULL,
+        help="Hash whole inputs, or a sample plus the mtime, for cache keys (full).",
+    )
+    parser.add_argument(
+        "--metrics",
+        default="multi_varscan2.metrics.json",
+        help="JSON report of wall, CPU, peak RSS and I/O per chunk and stage.",
+    )
+    parser.add_argument(
+        "--cost-model",
+        default=None,
+        help="Cost model file, refitted with each run's --metrics (no model).",
+    )
+    parser.add_argument(
+        "--fit-metrics",
+        action="append",
+        default=[],
+        help="Metrics report of an earlier run to add to --cost-model.",
+    )
+    workdir = parser.add_mutually_exclusive_group()
+    workdir.add_argument(
+        "--workdir",
+        default=None,
+        help="Directory for chunks and intermediate VCFs, kept for --resume (cwd).",
+    )
+    workdir.add_argument(
+        "--scratch-dir",
+        default=None,
+        help="Make a per-run work directory here, e.g. /dev/shm; removed after the run.",
+    )
+    parser.add_argument(
+        "--low-footprint",
+        action="store_true",
+        help="Remove intermediates once consumed, keeping only Somatic.hc VCFs; "
+        "the native backend reads somatic output through named pipes.",
+    )
+    parser.add_argument(
+        "--output-dir",
+        default=".",
+        help="Destination of the merged VCFs (cwd).",
+    )
+    parser.add_argument(
+        "--queue-dir",
+        default=None,
+        help="Coordinate workers through this directory on a filesystem shared "
+        "with them instead of running chunks here; see varscan_tool.distributed.",
+    )
+    parser.add_argument(
+        "--local-workers",
+        type=int,
+        default=0,
+        help="Worker processes started on this host with --queue-dir (0).",
+    )
+    parser.add_argument(
+        "--lease-seconds",
+        type=float,
+        default=distributed.LEASE_SECONDS,
+        help="Re-lease a queued chunk whose worker stopped renewing it this long (60).",
+    )
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        help="Print predicted per-chunk runtime, memory and makespan; run nothing.",
+    )
     return parser
 
 
+def chunk_regions(args, _regions=regions) -> List[List[regions.Region]]:
+    """Region-balanced chunks planned from --ref-dict"""
+    contigs = _regions.read_ref_dict(args.ref_dict)
+    excluded = None
+    if args.exclude_regions:
+        excluded = _regions.read_bed(args.exclude_regions)
+    return _regions.plan_chunks(contigs, args.scatter_count, excluded)
+
+
+def plan_mpileup_chunks(args, _regions=regions) -> List[str]:
+    """Scatter the input mpileups into region-balanced chunk files"""
+    chunks = chunk_regions(args, _regions)
+    for idx, chunk in enumerate(chunks):
+        logger.info(
+            "Chunk %s: %s bp in %s region(s)",
+            idx,
+            sum(region.length for region in chunk),
+            len(chunk),
+        )
+    return _regions.scatter_mpileup(args.mpileup, chunks, args.workdir)
+
+
+def split_inputs(args, mpileups: List[str]) -> List[str]:
+    """Byte-balanced slices of each plain input mpileup"""
+    found = []
+    for mpileup in mpileups:
+        if utils.is_streamed_input(mpileup):
+            logger.warning("Cannot split streamed input %s, running it whole", mpileup)
+            found.append(mpileup)
+            continue
+        slices = splitter.split_mpileup(mpileup, args.split_count, args.split_contigs)
+        logger.info("Split %s into %s slices", mpileup, len(slices))
+        found.extend(slices)
+    return found
+
+
+def setup_workdir(args) -> Tuple[str, bool]:
+    """Work directory of this run, and whether it is removed afterwards"""
+    if args.workdir:
+        os.makedirs(args.workdir, exist_ok=True)
+        return args.workdir, False
+    if args.scratch_dir:
+        return tempfile.mkdtemp(prefix="multi_varscan2.", dir=args.scratch_dir), True
+    return ".", False
+
+
+def stage_inputs(mpileups: List[str], workdir: str) -> List[str]:
+    """Link inputs sharing a basename into the workdir under distinct names
+
+    Stage outputs are named after their input's basename, so such inputs
+    would otherwise overwrite each other's VCFs.
+    """
+    counts = Counter(os.path.basename(mpileup) for mpileup in mpileups)
+    staged = []
+    for idx, mpileup in enumerate(mpileups):
+        name = os.path.basename(mpileup)
+        if mpileup != utils.STDIN and counts[name] > 1:
+            link = os.path.join(workdir, "input_{:04d}.{}".format(idx, name))
+            if os.path.lexists(link):
+                os.remove(link)
+            os.symlink(os.path.abspath(mpileup), link)
+            mpileup = link
+        staged.append(mpileup)
+    return staged
+
+
+def chunk_outputs(
+    results: List[VarscanReturn], mpileups: List[str]
+) -> Tuple[List[pathlib.Path], List[pathlib.Path]]:
+    """High-confidence somatic snp and indel VCFs of every chunk, in chunk order"""
+    finished = {result.idx for result in results}
+    missing = [mpileup for idx, mpileup in enumerate(mpileups) if idx not in finished]
+    if missing:
+        raise ValueError("Missing output for {}".format(", ".join(missing)))
+    results = sorted(results, key=lambda result: result.idx)
+    snps = [pathlib.Path(output_path(r.snp_file, MERGED)) for r in results]
+    indels = [pathlib.Path(output_path(r.indel_file, MERGED)) for r in results]
+    return snps, indels
+
+
+def publish(path: str, destination: str) -> None:
+    """Move a finished output, and its index if any, to its destination"""
+    if os.path.abspath(path) == os.path.abspath(destination):
+        return
+    for suffix in ("", ".tbi"):
+        if os.path.exists(path + suffix):
+            shutil.move(path + suffix, destination + suffix)
+
+
+def open_merged_output(path: str, threads: int):
+    """Open a merged output, BGZF with a tabix index for .gz outputs"""
+    if path.endswith(".gz"):
+        return TabixVcfWriter(path, threads=threads)
+    return open(path, "w")
+
+
+def merge_chunks(files, path: str, contigs, threads: int, tally, _utils=utils) -> None:
+    """Merge chunk outputs into `path`, handing the written records to `tally`"""
+    with open_merged_output(path, threads) as fout:
+        _utils.merge_outputs(files, fout, contigs, tally)
+
+
+def setup_resources(args, _resources=resources):
+    """Memory budget and worker count for this run"""
+    if args.memory_limit:
+        limit = _resources.parse_size(args.memory_limit)
+    else:
+        limit = _resources.memory_limit()
+    budget = _resources.MemoryBudget(limit)
+    thread_count = args.thread_count
+    if not thread_count:
+        thread_count = _resources.default_thread_count(
+            jvm.somatic_policy(args).settings(None).memory,
+            limit,
+            _resources.cpu_limit(),
+        )
+    logger.info("Using %s threads with a %s byte memory budget", thread_count, limit)
+    return thread_count, budget
+
+
+def retry_policy(args, budget: resources.MemoryBudget) -> RetryPolicy:
+    """Retry policy whose escalated heaps still fit the memory budget"""
+    return RetryPolicy(
+        max_attempts=args.max_attempts,
+        heap_factor=args.retry_heap_factor,
+        timeout_factor=args.retry_timeout_factor,
+        backoff=args.retry_backoff,
+        heap_limit=budget.limit - resources.JVM_OVERHEAD,
+    )
+
+
+def load_cost_model(args) -> Optional[cost_model.CostModel]:
+    """--cost-model with the --fit-metrics reports added"""
+    if not args.cost_model:
+        if args.fit_metrics:
+            raise ValueError("--fit-metrics needs a --cost-model to add to")
+        return None
+    model = cost_model.CostModel.load(args.cost_model)
+    for report in args.fit_metrics:
+        model.add_report_file(report)
+    if args.fit_metrics:
+        model.save()
+    return model
+
+
+def plan_run(args, model: Optional[cost_model.CostModel], out=sys.stdout) -> None:
+    """Print the predicted cost of each chunk and the run, starting no JVMs"""
+    if args.scatter_count:
+        profiles = cost_model.profile_chunks(args.mpileup, chunk_regions(args))
+    elif args.split_count:
+        profiles = cost_model.profile_inputs(split_inputs(args, args.mpileup))
+    else:
+        profiles = cost_model.profile_inputs(args.mpileup)
+    thread_count, budget = setup_resources(args)
+    somatic_rss = model.stage_rss(SOMATIC) if model is not None else None
+    run_plan = cost_model.plan(
+        profiles,
+        model,
+        jvm.somatic_policy(args, somatic_rss),
+        thread_count,
+        budget.limit,
+    )
+    out.write(cost_model.format_plan(run_plan))
+
+
 def run(args, _somatic=VarscanSomatic, _utils=utils):
     """main"""
 
     # Set class attrs
     _somatic.set_attributes(args)
 
-    varscan_outputs = tpe_submit_commands(args, args.mpileup, args.thread_count)
+    if args.mpileup.count(utils.STDIN) > 1:
+        raise ValueError("stdin can only be given once as --mpileup")
+    if args.scatter_count and args.split_count:
+        raise ValueError("--scatter-count and --split-count are exclusive")
+    if args.prefilter and args.validation:
+        raise ValueError("--prefilter drops positions --validation must report")
+
+    model = load_cost_model(args)
+    if args.plan:
+        plan_run(args, model)
+        return
+
+    workdir, scratch = setup_workdir(args)
+    args = args._replace(workdir=workdir)
+    logger.info("Working in %s", workdir)
+    try:
+        _run_in_workdir(args, model, _utils)
+    finally:
+        if scratch:
+            shutil.rmtree(workdir, ignore_errors=True)
 
-    # Check outputs
-    p = pathlib.Path(".")
-    snps = set(p.glob("*snp.Somatic.hc.vcf"))
-    indels = set(p.glob("*indel.Somatic.hc.vcf"))
 
-    # Sanity check
-    assert len(snps) == len(indels) == len(args.mpileup), "Missing output!"
+def _run_in_workdir(args, model, _utils=utils):
+    mpileups = stage_inputs(args.mpileup, args.workdir)
+    if args.scatter_count:
+        mpileups = plan_mpileup_chunks(args)
+    elif args.split_count:
+        mpileups = split_inputs(args, mpileups)
+
+    if args.resume:
+        manifest = Manifest.load(args.manifest, run_parameters(args))
+    else:
+        manifest = Manifest(args.manifest, run_parameters(args))
+
+    cache = None
+    if args.cache_dir:
+        max_bytes = resources.parse_size(args.cache_size) if args.cache_size else None
+        cache = ResultCache(args.cache_dir, max_bytes, args.cache_digest)
+
+    footprint = Footprint(args.low_footprint, mpileups if args.scatter_count else ())
+    thread_count, budget = setup_resources(args)
+    start = time.monotonic()
+    if args.queue_dir:
+        varscan_outputs = distributed.coordinate(
+            args, mpileups, args.local_workers, args.lease_seconds
+        )
+    else:
+        varscan_outputs = tpe_submit_commands(
+            args,
+            mpileups,
+            thread_count,
+            budget,
+            retry_policy(args, budget),
+            manifest,
+            cache,
+            model,
+            footprint,
+        )
+    if cache is not None:
+        cache.log_stats()
+    footprint.log()
+    run_info = {
+        "chunks": len(mpileups),
+        "thread_count": thread_count,
+        "memory_limit": budget.limit,
+        "java_opts": args.java_opts,
+        "process_heap_ceiling": args.process_heap_ceiling,
+        "process_backend": args.process_backend,
+        "varscan_wall": time.monotonic() - start,
+        "low_footprint": args.low_footprint,
+        "peak_scratch_bytes": footprint.peak,
+        "queue_dir": args.queue_dir,
+    }
+
+    # Check outputs
+    snps, indels = chunk_outputs(varscan_outputs, mpileups)
     if any(get_file_size(x) == 0 for x in list(snps) + list(indels)):
         logger.error("Empty output detected!")
     # Merge
-    merged_snps = "multi_varscan2_snp_merged.vcf"
-    merged_indels = "multi_varscan2_indel_merged.vcf"
-    with open(merged_snps, "w") as fout:
-        _utils.merge_outputs(snps, fout)
-    with open(merged_indels, "w") as fout:
-        _utils.merge_outputs(indels, fout)
+    start = time.monotonic()
+    contigs = regions.read_ref_dict(args.ref_dict)
+    for name, files in (("snp", snps), ("indel", indels)):
+        base = "multi_varscan2_{}_merged".format(name)
+        merged = "{}.{}".format(base, args.output_format)
+        staged = os.path.join(args.workdir, merged)
+        threads = args.compress_threads or thread_count
+        stats = qc.VariantStats()
+        merge_chunks(files, staged, contigs, threads, stats.add_lines, _utils=_utils)
+        qc_files = qc.write_summary(stats, os.path.join(args.workdir, base))
+        publish(staged, os.path.join(args.output_dir, merged))
+        for path in qc_files:
+            publish(path, os.path.join(args.output_dir, os.path.basename(path)))
+    run_info["merge_wall"] = time.monotonic() - start
+    metrics.write_report(args.metrics, varscan_outputs, run_info)
+    if model is not None:
+        model.add_report_file(args.metrics)
+        model.save()
 
 
 def process_argv(argv: Optional[List] = None) -> namedtuple:
     parser = setup_parser()
 
-    if argv:
-        args, unknown_args = parser.parse_known_args(argv)
-    else:
-        args, unknown_args = parser.parse_known_args()
+    args, unknown_args = parser.parse_known_args(argv)
 
     args_dict = vars(args)
     args_dict["extras"] = unknown_args
@@ -246,7 +782,6 @@ def main(argv=None) -> int:
     exit_code = 0
     setup_logger()
 
-    argv = argv or sys.argv
     args = process_argv(argv)
     start = time.time()
     try:
@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+Stage-level task graph for the per-chunk VarScan pipeline.
+
+Each chunk runs somatic, then processSomatic on its snp and indel VCFs as two
+independent tasks. processSomatic tasks are dispatched ahead of queued
+somatic tasks so finished chunks drain while other chunks keep cores busy.
+A stage killed for memory or time is resubmitted with a larger heap or
+timeout, as allowed by the retry policy. With a manifest, finished stages
+are checkpointed, and stages already checkpointed intact are skipped. With a
+result cache, stages whose input and parameters were seen before restore
+their outputs instead of running. Each successful stage's resource usage is
+attached to its chunk's result. A discarding footprint removes intermediates
+once consumed; with the native backend, processSomatic then reads somatic's
+VCFs through named pipes within the somatic stage. Stage functions may be
+coroutine functions, for pools that await them. With `fail_fast`, the first
+stage failing for good cancels the rest of the run.
+"""
+
+import asyncio
+import functools
+import inspect
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from varscan_tool import jvm, metrics, utils
+from varscan_tool.cache import ResultCache
+from varscan_tool.footprint import Footprint
+from varscan_tool.manifest import (
+    Manifest,
+    process_parameters,
+    run_parameters,
+    somatic_parameters,
+)
+from varscan_tool.retry import OK, Attempt, RetryPolicy
+from varscan_tool.scheduler import StagePool, StageTask, WorkItem
+from varscan_tool.varscan import Varscan2, VarscanReturn
+from varscan_tool.varscan_somatic_process import MERGED, output_paths
+
+logger = logging.getLogger(__name__)
+
+SOMATIC = "somatic"
+PROCESS_SNP = "process_snp"
+PROCESS_INDEL = "process_indel"
+
+# Lower runs first; processSomatic frees a chunk, somatic starts a new one.
+STAGE_PRIORITY = {PROCESS_SNP: 0, PROCESS_INDEL: 0, SOMATIC: 1}
+
+# Outcomes of a finished stage attempt, besides OK.
+RETRY = "retry"
+FAILED = "failed"
+
+
+def stage_jvm(
+    stage: str, input_path: str, args, somatic_rss=None
+) -> Optional[jvm.JvmSettings]:
+    """JVM heap and flags for a stage input; None for in-process stages
+
+    `somatic_rss` predicts somatic's peak RSS by input bytes, to size its heap.
+    """
+    if stage == SOMATIC:
+        policy = jvm.somatic_policy(args, somatic_rss)
+    elif args.process_backend == "jvm":
+        policy = jvm.process_policy(args)
+    else:
+        return None
+    return policy.settings(jvm.input_size(input_path))
+
+
+class ChunkGraph:
+    def __init__(
+        self,
+        pool: StagePool,
+        args,
+        retry: Optional[RetryPolicy] = None,
+        manifest: Optional[Manifest] = None,
+        cache: Optional[ResultCache] = None,
+        footprint: Optional[Footprint] = None,
+        fail_fast: bool = False,
+        somatic_rss=None,
+        _varscan=Varscan2,
+    ):
+        self.pool = pool
+        self.args = args
+        self.retry = retry or RetryPolicy(max_attempts=1)
+        self.manifest = manifest
+        self.cache = cache
+        self.footprint = footprint or Footprint()
+        self.fail_fast = fail_fast
+        self.somatic_rss = somatic_rss
+        self.streamed = self.footprint.discard and args.process_backend == "native"
+        self._varscan = _varscan
+        self.results: List[VarscanReturn] = []
+        self._items: Dict[int, WorkItem] = {}
+        self._rank: Dict[int, int] = {}
+        self._vcfs: Dict[int, Dict[str, str]] = {}
+        self._pending: Dict[int, int] = {}
+        self._failed: set = set()
+        self._attempts: Dict[int, List[Attempt]] = {}
+        self._metrics: Dict[int, List[metrics.StageMetrics]] = {}
+
+    def add(self, item: WorkItem) -> None:
+        """Queue a chunk; chunks added earlier are started first"""
+        self._items[item.idx] = item
+        self._rank[item.idx] = len(self._rank)
+        if self.footprint.discard and self._processed(item.idx):
+            # Raw VCFs were removed once processed; only their names matter.
+            outputs = self._varscan.somatic_outputs(item.mpileup, self.args.workdir)
+            self.footprint.consumed([item.mpileup])
+        else:
+            outputs = self._checkpointed(item.idx, SOMATIC)
+        if outputs is None:
+            self._submit_stage(item.idx, SOMATIC, item.mpileup, self._on_somatic)
+        else:
+            self._start_process(item.idx, *outputs)
+
+    def run(self) -> List[VarscanReturn]:
+        self.pool.run()
+        return self.results
+
+    def _submit_stage(
+        self,
+        chunk: int,
+        stage: str,
+        path: str,
+        callback,
+        settings: Optional[jvm.JvmSettings] = None,
+        timeout: Optional[int] = None,
+        delay: float = 0.0,
+    ) -> None:
+        if settings is None:
+            settings = stage_jvm(stage, path, self.args, self.somatic_rss)
+        if timeout is None:
+            timeout = self.args.timeout
+        if stage != SOMATIC:
+            fn = self._varscan.run_process
+        elif self.streamed:
+            fn = self._varscan.run_somatic_streamed
+        else:
+            fn = self._varscan.run_somatic
+        measure = metrics.measure
+        if inspect.iscoroutinefunction(fn):
+            measure = metrics.measure_async
+            if self.cache is not None:
+                fn = functools.partial(self._run_cached_async, stage, fn)
+            if self.manifest is not None:
+                fn = functools.partial(self._run_checksummed_async, stage, fn)
+        else:
+            if self.cache is not None:
+                fn = functools.partial(self._run_cached, stage, fn)
+            if self.manifest is not None:
+                fn = functools.partial(self._run_checksummed, stage, fn)
+        task = StageTask(
+            chunk,
+            stage,
+            functools.partial(measure, fn),
+            (path, self.args, settings, timeout),
+            settings.memory if settings else 0,
+        )
+        priority = (STAGE_PRIORITY[stage], self._rank[chunk])
+        self.pool.submit(task, callback, priority=priority, delay=delay)
+
+    def _run_cached(self, stage: str, fn, path: str, *args):
+        """Run a stage in a worker, restoring its outputs from the cache on a hit"""
+        key, outputs = self._cache_key(stage, path)
+        if key is not None and self.cache.fetch(key, outputs):
+            return self._restored(stage, path)
+        result = fn(path, *args)
+        if key is not None:
+            self.cache.store(key, outputs)
+        return result
+
+    async def _run_cached_async(self, stage: str, fn, path: str, *args):
+        """_run_cached for a coroutine function stage"""
+        key, outputs = self._cache_key(stage, path)
+        if key is not None and self.cache.fetch(key, outputs):
+            return self._restored(stage, path)
+        result = await fn(path, *args)
+        if key is not None:
+            self.cache.store(key, outputs)
+        return result
+
+    def _run_checksummed(self, stage: str, fn, path: str, *args):
+        """Run a stage, then checksum its outputs for the manifest in the worker"""
+        result = fn(path, *args)
+        self.manifest.checksum_outputs(self._checkpointed_outputs(stage, path, result))
+        return result
+
+    async def _run_checksummed_async(self, stage: str, fn, path: str, *args):
+        """_run_checksummed for a coroutine function stage, hashing off the loop"""
+        result = await fn(path, *args)
+        outputs = self._checkpointed_outputs(stage, path, result)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.manifest.checksum_outputs, outputs)
+        return result
+
+    def _checkpointed_outputs(self, stage: str, path: str, result) -> List[str]:
+        """Outputs the manifest records for a finished stage"""
+        if stage != SOMATIC:
+            return self.footprint.kept(path)
+        if self.streamed:
+            return [kept for vcf in result for kept in self.footprint.kept(vcf)]
+        return list(result)
+
+    def _restored(self, stage: str, path: str):
+        """Result of a stage whose outputs were restored from the cache"""
+        if stage == SOMATIC:
+            return tuple(self._varscan.somatic_outputs(path, self.args.workdir))
+        return None
+
+    def _cache_key(self, stage: str, path: str) -> Tuple[Optional[str], List[str]]:
+        """Cache key of a stage input, and the outputs stored under it"""
+        if stage == SOMATIC and self.streamed:
+            raw_vcfs = self._varscan.somatic_outputs(path, self.args.workdir)
+            outputs = [kept for vcf in raw_vcfs for kept in self.footprint.kept(vcf)]
+            parameters = dict(run_parameters(self.args), categories=[MERGED])
+            key = self.cache.key("somatic+process", path, parameters)
+        elif stage == SOMATIC:
+            raw_vcfs = self._varscan.somatic_outputs(path, self.args.workdir)
+            outputs = list(raw_vcfs)
+            key = self.cache.key(SOMATIC, path, somatic_parameters(self.args))
+        else:
+            outputs = self.footprint.kept(path)
+            parameters = process_parameters(self.args)
+            if self.footprint.discard:
+                parameters = dict(parameters, categories=[MERGED])
+            key = self.cache.key("process", path, parameters)
+        return key, outputs
+
+    def _checkpointed(self, chunk: int, stage: str) -> Optional[List[str]]:
+        """Intact outputs of a stage finished by an earlier run"""
+        if self.manifest is None:
+            return None
+        outputs = self.manifest.stage_outputs(self._items[chunk].mpileup, stage)
+        if outputs is not None:
+            logger.info("Chunk %s %s already finished, skipping", chunk, stage)
+        return outputs
+
+    def _processed(self, chunk: int) -> bool:
+        if self.manifest is None:
+            return False
+        mpileup = self._items[chunk].mpileup
+        return all(
+            self.manifest.stage_outputs(mpileup, stage) is not None
+            for stage in (PROCESS_SNP, PROCESS_INDEL)
+        )
+
+    def _checkpoint(self, task: StageTask, outputs: List[str], invalidates=()):
+        if self.manifest is None:
+            return
+        mpileup = self._items[task.chunk].mpileup
+        self.manifest.record(mpileup, task.chunk, task.stage, outputs, invalidates)
+
+    def _record(self, task: StageTask, outcome: str) -> int:
+        """Log the outcome of a stage attempt, returning its attempt number"""
+        _, _, settings, timeout = task.args
+        attempts = self._attempts.setdefault(task.chunk, [])
+        number = 1 + sum(1 for attempt in attempts if attempt.stage == task.stage)
+        heap = settings.heap if settings else None
+        attempts.append(Attempt(task.stage, number, heap, timeout, outcome))
+        return number
+
+    def _result(self, task: StageTask, future, callback) -> Tuple[str, object]:
+        """Unwrap a stage result, resubmitting the stage if it may be retried"""
+        try:
+            value, usage = future.result()
+        except Exception as e:
+            kind = getattr(e, "kind", type(e).__name__)
+            number = self._record(task, kind)
+            path, _, settings, timeout = task.args
+            # A failed attempt has consumed stdin; a retry would read what is left.
+            retry = path != utils.STDIN
+            if not (retry and self.retry.should_retry(e, number, settings, timeout)):
+                logger.exception(e)
+                if self.fail_fast:
+                    logger.error(
+                        "Chunk %s %s failed, cancelling remaining stages",
+                        task.chunk,
+                        task.stage,
+                    )
+                    self.pool.cancel()
+                return FAILED, None
+            settings, timeout = self.retry.escalate(kind, settings, timeout)
+            delay = self.retry.delay(number)
+            logger.warning(
+                "Chunk %s %s failed (%s); retrying in %ss with heap %s, timeout %s",
+                task.chunk,
+                task.stage,
+                kind,
+                delay,
+                settings.heap if settings else None,
+                timeout,
+            )
+            self._submit_stage(
+                task.chunk, task.stage, path, callback, settings, timeout, delay
+            )
+            return RETRY, None
+        self._record(task, OK)
+        self._measured(task, usage)
+        return OK, value
+
+    def _measured(self, task: StageTask, usage) -> None:
+        path, _, settings, _ = task.args
+        stage_metrics = metrics.StageMetrics(
+            chunk=task.chunk,
+            stage=task.stage,
+            input_bytes=jvm.input_size(path),
+            heap=settings.heap if settings else None,
+            **usage._asdict(),
+        )
+        logger.info(
+            "Chunk %s %s: %.1fs wall, %.1fs cpu, %s MiB peak RSS",
+            task.chunk,
+            task.stage,
+            stage_metrics.wall,
+            stage_metrics.user + stage_metrics.sys,
+            stage_metrics.max_rss >> 20,
+        )
+        self._metrics.setdefault(task.chunk, []).append(stage_metrics)
+
+    def _on_somatic(self, task: StageTask, future) -> None:
+        status, value = self._result(task, future, self._on_somatic)
+        if status != OK:
+            return
+        if self.streamed:
+            self._streamed_done(task, *value)
+        else:
+            self.footprint.track(value)
+            invalidates = (PROCESS_SNP, PROCESS_INDEL)
+            self._checkpoint(task, list(value), invalidates)
+            self._start_process(task.chunk, *value)
+        self.footprint.consumed([self._items[task.chunk].mpileup])
+
+    def _streamed_done(self, task: StageTask, snp_file: str, indel_file: str):
+        """Finish a chunk whose somatic stage also ran processSomatic"""
+        self._vcfs[task.chunk] = {PROCESS_SNP: snp_file, PROCESS_INDEL: indel_file}
+        self._pending[task.chunk] = 2
+        for stage, vcf in self._vcfs[task.chunk].items():
+            outputs = self.footprint.kept(vcf)
+            self.footprint.track(outputs)
+            self._checkpoint(task._replace(stage=stage), outputs)
+            self._process_done(task.chunk)
+
+    def _start_process(self, chunk: int, snp_file: str, indel_file: str) -> None:
+        self._vcfs[chunk] = {PROCESS_SNP: snp_file, PROCESS_INDEL: indel_file}
+        self._pending[chunk] = 2
+        for stage, vcf in self._vcfs[chunk].items():
+            if self._checkpointed(chunk, stage) is None:
+                self._submit_stage(chunk, stage, vcf, self._on_process)
+            else:
+                self._process_done(chunk)
+
+    def _on_process(self, task: StageTask, future) -> None:
+        status, _ = self._result(task, future, self._on_process)
+        if status == RETRY:
+            return
+        if status == FAILED:
+            self._failed.add(task.chunk)
+        else:
+            input_vcf = task.args[0]
+            self._checkpoint(task, self.footprint.kept(input_vcf))
+            self.footprint.track(output_paths(input_vcf))
+            self.footprint.process_consumed(input_vcf)
+        self._process_done(task.chunk)
+
+    def _process_done(self, chunk: int) -> None:
+        self._pending[chunk] -= 1
+        if self._pending[chunk] or chunk in self._failed:
+            return
+        vcfs = self._vcfs[chunk]
+        result = VarscanReturn(
+            snp_file=vcfs[PROCESS_SNP],
+            indel_file=vcfs[PROCESS_INDEL],
+            mpileup=self._items[chunk].mpileup,
+            idx=chunk,
+            attempts=tuple(self._attempts.get(chunk, ())),
+            metrics=tuple(self._metrics.get(chunk, ())),
+        )
+        logger.info(result)
+        self.results.append(result)
+
+
+# __END__
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Streaming prefilter dropping mpileup rows VarScan somatic can never call.
+
+VarScan only compares a pair mpileup row when the normal and tumor depths
+reach --min-coverage-normal and --min-coverage-tumor, and only calls it
+when either sample has a non-reference base: somatic and germline calls
+need one in the tumor, LOH calls one in the normal. The raw depth columns
+bound the quality-filtered depths VarScan counts from above, so rows
+failing the depth test, and rows where both samples only match the
+reference, are dropped before the JVM parses them. Not for --validation
+runs, which report every compared position.
+"""
+
+import io
+import logging
+import re
+from typing import IO, List, NamedTuple, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Bytes read from the source mpileup per batch of rows.
+BATCH_BYTES = 1 << 20
+# Read starts: "^" and the mapping quality character after it.
+_READ_START = re.compile(rb"\^.", re.DOTALL)
+# Reference matches, read ends and reference skips.
+_REFERENCE = b".,$<>"
+
+
+class Thresholds(NamedTuple):
+    min_coverage_normal: int
+    min_coverage_tumor: int
+
+
+def _has_variant(bases: bytes) -> bool:
+    if b"^" in bases:
+        bases = _READ_START.sub(b"", bases)
+    return bool(bases.translate(None, _REFERENCE))
+
+
+def keep_row(line: bytes, thresholds: Thresholds) -> bool:
+    """False for a pair mpileup row that cannot give a somatic call
+
+    Rows that do not parse as a tumor/normal pair are kept.
+    """
+    fields = line.split(b"\t", 8)
+    if len(fields) < 9:
+        return True
+    try:
+        if int(fields[3]) < thresholds.min_coverage_normal:
+            return False
+        if int(fields[6]) < thresholds.min_coverage_tumor:
+            return False
+    except ValueError:
+        return True
+    return _has_variant(fields[7]) or _has_variant(fields[4])
+
+
+def filter_rows(data: bytes, thresholds: Thresholds) -> Tuple[bytes, int, int]:
+    """Kept rows of a batch of whole lines, with the counts of rows in and kept"""
+    rows: List[bytes] = [line for line in data.split(b"\n") if line]
+    kept = [line for line in rows if keep_row(line, thresholds)]
+    if not kept:
+        return b"", len(rows), 0
+    kept.append(b"")
+    return b"\n".join(kept), len(rows), len(kept) - 1
+
+
+class PrefilteredReader(io.RawIOBase):
+    """Reads the rows of an mpileup stream that keep_row keeps
+
+    The source is read in batches of BATCH_BYTES and is left open on close.
+    Rows and bytes read and kept are counted for the report.
+    """
+
+    def __init__(self, source: IO[bytes], thresholds: Thresholds):
+        super().__init__()
+        self.source = source
+        self.thresholds = thresholds
+        self.rows_in = self.rows_kept = 0
+        self.bytes_in = self.bytes_kept = 0
+        self._pending = memoryview(b"")
+        self._partial = b""
+        self._eof = False
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._pending and not self._eof:
+            self._fill()
+        count = min(len(buffer), len(self._pending))
+        buffer[:count] = self._pending[:count]
+        self._pending = self._pending[count:]
+        return count
+
+    def _fill(self) -> None:
+        data = self.source.read(BATCH_BYTES)
+        if data:
+            self.bytes_in += len(data)
+            data = self._partial + data
+            end = data.rfind(b"\n") + 1
+            data, self._partial = data[:end], data[end:]
+        else:
+            self._eof = True
+            data, self._partial = self._partial, b""
+        kept, rows_in, rows_kept = filter_rows(data, self.thresholds)
+        self.rows_in += rows_in
+        self.rows_kept += rows_kept
+        self.bytes_kept += len(kept)
+        self._pending = memoryview(kept)
+
+    @property
+    def fraction_removed(self) -> float:
+        """Fraction of the input bytes dropped so far"""
+        if not self.bytes_in:
+            return 0.0
+        return 1 - self.bytes_kept / self.bytes_in
+
+    def log(self, name: str) -> None:
+        logger.info(
+            "Prefilter kept %s of %s rows of %s, removing %.1f%% of its bytes",
+            self.rows_kept,
+            self.rows_in,
+            name,
+            100 * self.fraction_removed,
+        )
+
+
+# __END__
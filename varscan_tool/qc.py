@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+QC statistics of a merged VarScan VCF, gathered while the merge streams it.
+
+The merge hands over the record lines it writes a batch at a time. When
+every line of a batch has the 11 columns of a VarScan somatic VCF and one
+FORMAT layout, the columns are sliced out of a single split of the batch
+and counted without a Python step per record; other batches are read
+record by record. Tumor columns repeat far more often than records, so
+each distinct one is split for its depths only once. Counts are only
+decoded into the summary at the end.
+"""
+
+import json
+import re
+from collections import Counter
+from operator import itemgetter
+from typing import Dict, List, Optional
+
+from varscan_tool import vcf
+
+# SS= values of INFO columns. No other VarScan INFO key ends in SS, so the
+# match needs no leading separator and starts at a fast literal search.
+_STATUS = re.compile(r"SS=([^;\t\n]*)")
+# Columns of a VarScan somatic VCF record.
+COLUMNS = 11
+# Width and number of the tumor VAF histogram bins.
+VAF_BIN = 0.05
+VAF_BINS = 20
+# Names of VCF SS= codes in the summary.
+STATUS_NAMES = {
+    "0": "Reference",
+    "1": "Germline",
+    "2": "Somatic",
+    "3": "LOH",
+    "5": "Unknown",
+}
+TRANSITIONS = ({"A", "G"}, {"C", "T"})
+# Summary counts in the "total" rows of the TSV.
+TOTALS = (
+    "records",
+    "snvs",
+    "transitions",
+    "transversions",
+    "ti_tv",
+    "insertions",
+    "deletions",
+    "other",
+)
+
+
+class Tally:
+    """Counts of the fields the statistics are computed from"""
+
+    def __init__(self):
+        self.contigs: Counter = Counter()
+        self.changes: Counter = Counter()
+        self.statuses: Counter = Counter()
+        # (RD, AD) strings of the tumor, or its VAF when they are missing.
+        self.depths: Counter = Counter()
+        self.freqs: Counter = Counter()
+
+    def add_text(self, text: str) -> None:
+        """Tally a batch of complete record lines"""
+        parts = text.replace("\n", "\t").split("\t")
+        # Each line ends in a tab after the replace, so the last part is empty.
+        end = len(parts) - 1
+        formats = set(parts[8:end:COLUMNS])
+        index = vcf.format_index(formats.pop()) if len(formats) == 1 else {}
+        rows = text.count("\n")
+        if end != COLUMNS * rows or "RD" not in index or "AD" not in index:
+            self._add_lines(text)
+            return
+        depths: Counter = Counter()
+        rd_ad = itemgetter(index["RD"], index["AD"])
+        try:
+            for tumor, count in Counter(parts[vcf.TUMOR : end : COLUMNS]).items():
+                depths[rd_ad(tumor.split(":"))] += count
+        except IndexError:
+            self._add_lines(text)
+            return
+        self.depths.update(depths)
+        self.contigs.update(parts[0:end:COLUMNS])
+        self.changes.update(zip(parts[3:end:COLUMNS], parts[4:end:COLUMNS]))
+        statuses = Counter(_STATUS.findall(text))
+        missing = rows - sum(statuses.values())
+        if missing:
+            statuses[""] += missing
+        self.statuses.update(statuses)
+
+    def _add_lines(self, text: str) -> None:
+        for line in text.splitlines(True):
+            self.add(vcf.VcfRecord(line))
+
+    def add(self, record: vcf.VcfRecord) -> None:
+        """Tally a single record"""
+        self.contigs[record.chrom] += 1
+        self.changes[record.ref, record.alt] += 1
+        self.statuses[record.ss] += 1
+        depths = record.depths(vcf.TUMOR)
+        if depths is None:
+            self.freqs[record.freq(vcf.TUMOR)] += 1
+        else:
+            self.depths[str(depths[0]), str(depths[1])] += 1
+
+
+class VariantStats:
+    """Per-contig counts, Ti/Tv, somatic statuses and tumor VAFs of records"""
+
+    def __init__(self):
+        self.tally = Tally()
+
+    def add_lines(self, lines: List[str]) -> None:
+        """Tally a batch of record lines, e.g. those the merge just wrote"""
+        if lines:
+            self.tally.add_text("".join(lines))
+
+    def add(self, record: vcf.VcfRecord) -> None:
+        """Tally a single record"""
+        self.tally.add(record)
+
+    def vaf_histogram(self) -> List[int]:
+        """Records per VAF_BIN wide bin of tumor variant allele frequency"""
+        counts = [0] * VAF_BINS
+        found: Counter = Counter(self.tally.freqs)
+        for (ref_reads, alt_reads), count in self.tally.depths.items():
+            depth = int(ref_reads) + int(alt_reads)
+            found[int(alt_reads) / depth if depth else 0.0] += count
+        for freq, count in found.items():
+            counts[min(int(freq / VAF_BIN), VAF_BINS - 1)] += count
+        return counts
+
+    def summary(self) -> Dict:
+        """The statistics as a JSON-ready dict"""
+        kinds: Counter = Counter()
+        for (ref, alt), count in self.tally.changes.items():
+            ref, alt = ref.upper(), alt.upper()
+            if len(ref) == len(alt) == 1:
+                transition = {ref, alt} in TRANSITIONS
+                kinds["transition" if transition else "transversion"] += count
+            elif len(ref) < len(alt):
+                kinds["insertion"] += count
+            elif len(ref) > len(alt):
+                kinds["deletion"] += count
+            else:
+                kinds["other"] += count
+        statuses: Counter = Counter()
+        for code, count in self.tally.statuses.items():
+            statuses[STATUS_NAMES.get(code, code or "missing")] += count
+        ti_tv: Optional[float] = None
+        if kinds["transversion"]:
+            ti_tv = kinds["transition"] / kinds["transversion"]
+        return {
+            "records": sum(self.tally.contigs.values()),
+            "contigs": dict(self.tally.contigs),
+            "somatic_status": dict(statuses),
+            "snvs": kinds["transition"] + kinds["transversion"],
+            "transitions": kinds["transition"],
+            "transversions": kinds["transversion"],
+            "ti_tv": ti_tv,
+            "insertions": kinds["insertion"],
+            "deletions": kinds["deletion"],
+            "other": kinds["other"],
+            "vaf_bin": VAF_BIN,
+            "vaf_histogram": self.vaf_histogram(),
+        }
+
+
+def format_tsv(summary: Dict) -> str:
+    """The summary as section, key and value rows"""
+    rows = [("section", "key", "value")]
+    rows.extend(("total", key, summary[key]) for key in TOTALS)
+    rows.extend(("contig", name, count) for name, count in summary["contigs"].items())
+    rows.extend(
+        ("somatic_status", name, count)
+        for name, count in summary["somatic_status"].items()
+    )
+    width = summary["vaf_bin"]
+    rows.extend(
+        ("vaf", "{:.2f}-{:.2f}".format(idx * width, (idx + 1) * width), count)
+        for idx, count in enumerate(summary["vaf_histogram"])
+    )
+    return "".join(
+        "\t".join("" if value is None else str(value) for value in row) + "\n"
+        for row in rows
+    )
+
+
+def write_summary(stats: VariantStats, prefix: str) -> List[str]:
+    """Write `prefix`.qc.json and `prefix`.qc.tsv, returning their paths"""
+    summary = stats.summary()
+    json_path, tsv_path = prefix + ".qc.json", prefix + ".qc.tsv"
+    with open(json_path, "w") as fh:
+        json.dump(summary, fh, indent=1)
+    with open(tsv_path, "w") as fh:
+        fh.write(format_tsv(summary))
+    return [json_path, tsv_path]
+
+
+# __END__
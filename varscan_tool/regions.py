@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Region-balanced chunk planning from a reference sequence dictionary.
+"""
+
+import bisect
+import contextlib
+import heapq
+import logging
+import os
+from operator import itemgetter
+from typing import IO, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from varscan_tool import utils
+
+logger = logging.getLogger(__name__)
+
+
+# Merge key of a _planned_lines item: contig rank and position.
+_position = itemgetter(0, 1)
+
+
+class Contig(NamedTuple):
+    name: str
+    length: int
+
+
+class Region(NamedTuple):
+    """1-based, inclusive genomic interval."""
+
+    contig: str
+    start: int
+    end: int
+
+    @property
+    def length(self) -> int:
+        return self.end - self.start + 1
+
+    def __str__(self) -> str:
+        return "{}:{}-{}".format(self.contig, self.start, self.end)
+
+
+def parse_ref_dict(fh: IO) -> List[Contig]:
+    """Parse @SQ records of a SAM-style sequence dictionary."""
+    contigs = []
+    for line in fh:
+        if not line.startswith("@SQ"):
+            continue
+        fields = dict(
+            field.split(":", 1) for field in line.rstrip("\n").split("\t")[1:]
+        )
+        try:
+            contigs.append(Contig(name=fields["SN"], length=int(fields["LN"])))
+        except KeyError:
+            raise ValueError("Malformed @SQ record: {}".format(line.strip()))
+    return contigs
+
+
+def read_ref_dict(path: str) -> List[Contig]:
+    """Read contigs, in reference order, from a sequence dictionary file."""
+    with open(path) as fh:
+        contigs = parse_ref_dict(fh)
+    if not contigs:
+        raise ValueError("No @SQ records found in {}".format(path))
+    return contigs
+
+
+def read_bed(path: str) -> Dict[str, List[Tuple[int, int]]]:
+    """Read a BED file into merged, 1-based inclusive intervals per contig."""
+    intervals: Dict[str, List[Tuple[int, int]]] = {}
+    with open(path) as fh:
+        for line in fh:
+            if not line.strip() or line.startswith(("#", "track", "browser")):
+                continue
+            contig, start, end = line.split("\t")[:3]
+            intervals.setdefault(contig, []).append((int(start) + 1, int(end)))
+    return {contig: _merge_intervals(ivs) for contig, ivs in intervals.items()}
+
+
+def _merge_intervals(intervals: Iterable[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def included_regions(
+    contigs: List[Contig], excluded: Optional[Dict[str, List[Tuple[int, int]]]] = None
+) -> List[Region]:
+    """Return the reference regions not covered by excluded intervals."""
+    excluded = excluded or {}
+    regions = []
+    for contig in contigs:
+        pos = 1
+        for start, end in excluded.get(contig.name, ()):
+            if start > pos:
+                regions.append(Region(contig.name, pos, min(start - 1, contig.length)))
+            pos = max(pos, end + 1)
+            if pos > contig.length:
+                break
+        if pos <= contig.length:
+            regions.append(Region(contig.name, pos, contig.length))
+    return regions
+
+
+def plan_chunks(
+    contigs: List[Contig],
+    count: int,
+    excluded: Optional[Dict[str, List[Tuple[int, int]]]] = None,
+) -> List[List[Region]]:
+    """Split the reference into `count` chunks of near-equal callable length.
+
+    Chunks are contiguous in reference order; contigs are split across chunk
+    boundaries where needed. Fewer chunks are returned when rounding leaves
+    some empty, e.g. with more chunks than callable bases.
+    """
+    if count < 1:
+        raise ValueError("Chunk count must be positive")
+    regions = included_regions(contigs, excluded)
+    total = sum(region.length for region in regions)
+    if not total:
+        raise ValueError("No callable regions left after exclusions")
+
+    chunks: List[List[Region]] = [[]]
+    filled = 0
+    for region in regions:
+        start = region.start
+        while start <= region.end:
+            boundary = round(total * len(chunks) / count)
+            if filled >= boundary and len(chunks) < count:
+                chunks.append([])
+                continue
+            take = region.end - start + 1
+            if len(chunks) < count:
+                take = min(take, boundary - filled)
+            chunks[-1].append(Region(region.contig, start, start + take - 1))
+            filled += take
+            start += take
+    planned = [chunk for chunk in chunks if chunk]
+    if len(planned) < count:
+        logger.info("Planned %s non-empty chunks of %s", len(planned), count)
+    return planned
+
+
+class RegionLookup:
+    """Maps mpileup positions to the chunk whose regions contain them."""
+
+    def __init__(self, chunks: List[List[Region]]):
+        self._starts: Dict[str, List[int]] = {}
+        self._entries: Dict[str, List[Tuple[int, int]]] = {}
+        for idx, chunk in enumerate(chunks):
+            for region in chunk:
+                self._entries.setdefault(region.contig, []).append((region.end, idx))
+                self._starts.setdefault(region.contig, []).append(region.start)
+        for contig, starts in self._starts.items():
+            order = sorted(range(len(starts)), key=starts.__getitem__)
+            self._starts[contig] = [starts[i] for i in order]
+            self._entries[contig] = [self._entries[contig][i] for i in order]
+
+    def find(self, contig: str, pos: int) -> Optional[int]:
+        starts = self._starts.get(contig)
+        if not starts:
+            return None
+        i = bisect.bisect_right(starts, pos) - 1
+        if i < 0:
+            return None
+        end, idx = self._entries[contig][i]
+        return idx if pos <= end else None
+
+
+def _planned_lines(
+    fh: IO[bytes], lookup: RegionLookup, rank: Dict[str, int], dropped: List[int]
+) -> Iterator[Tuple[int, int, int, bytes]]:
+    """(contig rank, position, chunk, line) of the lines in planned regions"""
+    for line in fh:
+        contig, pos = line.split(b"\t", 2)[:2]
+        name, position = contig.decode(), int(pos)
+        idx = lookup.find(name, position)
+        if idx is None:
+            dropped[0] += 1
+            continue
+        yield rank[name], position, idx, line
+
+
+def scatter_mpileup(
+    mpileups: List[str], chunks: List[List[Region]], output_dir: str = "."
+) -> List[str]:
+    """Route mpileup lines into one file per planned chunk in a single pass.
+
+    Inputs may be gzip/bgzip compressed or '-' for stdin. Lines outside the
+    planned regions (excluded or unknown contigs) are dropped. Several
+    inputs, each sorted in reference order, are merged by position, so
+    chunks stay sorted even where the inputs overlap.
+    """
+    lookup = RegionLookup(chunks)
+    rank: Dict[str, int] = {}
+    for chunk in chunks:
+        for region in chunk:
+            rank.setdefault(region.contig, len(rank))
+    paths = [
+        os.path.join(output_dir, "chunk_{:04d}.mpileup".format(idx))
+        for idx in range(len(chunks))
+    ]
+    dropped = [0]
+    with contextlib.ExitStack() as stack:
+        handles = [stack.enter_context(open(path, "wb")) for path in paths]
+        inputs = [
+            _planned_lines(
+                stack.enter_context(utils.open_mpileup(mpileup)), lookup, rank, dropped
+            )
+            for mpileup in mpileups
+        ]
+        # Ties are broken by input order.
+        merged = inputs[0] if len(inputs) == 1 else heapq.merge(*inputs, key=_position)
+        for _, _, idx, line in merged:
+            handles[idx].write(line)
+    if dropped[0]:
+        logger.info("Dropped %s mpileup lines outside planned regions", dropped[0])
+    return paths
+
+
+# __END__
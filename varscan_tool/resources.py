@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Container CPU and memory limits, and memory admission for concurrent JVMs.
+"""
+
+import logging
+import math
+import os
+import re
+from types import SimpleNamespace
+from typing import Optional
+
+DI = SimpleNamespace(os=os)
+logger = logging.getLogger(__name__)
+
+CGROUP_V2_MEMORY = "/sys/fs/cgroup/memory.max"
+CGROUP_V1_MEMORY = "/sys/fs/cgroup/memory/memory.limit_in_bytes"
+CGROUP_V2_MEMORY_EVENTS = "/sys/fs/cgroup/memory.events"
+CGROUP_V1_OOM_CONTROL = "/sys/fs/cgroup/memory/memory.oom_control"
+CGROUP_V2_CPU = "/sys/fs/cgroup/cpu.max"
+CGROUP_V1_CPU_QUOTA = "/sys/fs/cgroup/cpu/cpu.cfs_quota_us"
+CGROUP_V1_CPU_PERIOD = "/sys/fs/cgroup/cpu/cpu.cfs_period_us"
+MEMINFO = "/proc/meminfo"
+
+# cgroup v1 reports "unlimited" as a huge page-aligned number.
+UNLIMITED = 1 << 60
+# Non-heap JVM footprint: metaspace, thread stacks, code cache, GC structures.
+JVM_OVERHEAD = 256 << 20
+
+_UNITS = {"": 1, "k": 1 << 10, "m": 1 << 20, "g": 1 << 30, "t": 1 << 40}
+_SIZE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([kmgt]?)b?\s*$", re.IGNORECASE)
+
+
+def parse_size(value: str) -> int:
+    """Parse a JVM-style size such as 3G, 512m or 1048576 into bytes"""
+    match = _SIZE.match(str(value))
+    if not match:
+        raise ValueError("Invalid size: {}".format(value))
+    number, unit = match.groups()
+    return int(float(number) * _UNITS[unit.lower()])
+
+
+def format_size(value: int) -> str:
+    """Format bytes as a JVM -Xmx size, rounded up to whole megabytes"""
+    megabytes = max(1, math.ceil(value / (1 << 20)))
+    if megabytes % 1024 == 0:
+        return "{}G".format(megabytes // 1024)
+    return "{}M".format(megabytes)
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as fh:
+            return fh.read().strip()
+    except OSError:
+        return None
+
+
+def memory_limit(_read=_read) -> int:
+    """Memory available to this process: cgroup v2/v1 limit or MemTotal"""
+    limits = []
+    for path in (CGROUP_V2_MEMORY, CGROUP_V1_MEMORY):
+        value = _read(path)
+        if value and value != "max" and int(value) < UNLIMITED:
+            limits.append(int(value))
+            break
+    meminfo = _read(MEMINFO) or ""
+    for line in meminfo.splitlines():
+        if line.startswith("MemTotal:"):
+            limits.append(int(line.split()[1]) * 1024)
+    if not limits:
+        raise ValueError("Unable to determine the memory limit")
+    return min(limits)
+
+
+def oom_kills(_read=_read) -> Optional[int]:
+    """Processes the OOM killer has killed in this cgroup, None if not reported"""
+    for path in (CGROUP_V2_MEMORY_EVENTS, CGROUP_V1_OOM_CONTROL):
+        for line in (_read(path) or "").splitlines():
+            key, _, value = line.partition(" ")
+            if key == "oom_kill":
+                return int(value)
+    return None
+
+
+def cpu_limit(_read=_read, _di=DI) -> int:
+    """CPUs available to this process: affinity, capped by a cgroup quota"""
+    try:
+        cpus = len(_di.os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = _di.os.cpu_count() or 1
+    quota, period = None, None
+    v2 = _read(CGROUP_V2_CPU)
+    if v2:
+        quota, period = v2.split()
+    else:
+        quota, period = _read(CGROUP_V1_CPU_QUOTA), _read(CGROUP_V1_CPU_PERIOD)
+    if quota and period and quota not in ("max", "-1"):
+        cpus = min(cpus, max(1, math.ceil(int(quota) / int(period))))
+    return cpus
+
+
+def default_thread_count(task_memory: int, budget: int, cpus: int) -> int:
+    """Workers that fit both the CPU count and the memory budget"""
+    return max(1, min(cpus, budget // max(task_memory, 1)))
+
+
+class MemoryBudget:
+    """Tracks memory reserved by running subprocesses against a limit.
+
+    A task that alone exceeds the limit is still admitted when nothing else
+    is running, so oversized tasks run serially instead of never.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.reserved = 0
+
+    def can_admit(self, amount: int) -> bool:
+        return self.reserved == 0 or self.reserved + amount <= self.limit
+
+    def reserve(self, amount: int) -> None:
+        self.reserved += amount
+
+    def release(self, amount: int) -> None:
+        self.reserved -= amount
+
+
+# __END__
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Bounded retry of failed JVM stages with escalated resources.
+"""
+
+from typing import NamedTuple, Optional, Tuple
+
+from varscan_tool import resources
+from varscan_tool.jvm import JvmSettings
+from varscan_tool.utils import OOM, TIMEOUT, CommandFailed
+
+OK = "ok"
+
+
+class Attempt(NamedTuple):
+    stage: str
+    number: int
+    heap: Optional[str]
+    timeout: Optional[int]
+    outcome: str
+
+
+class RetryPolicy(NamedTuple):
+    """Retry OOM with a larger heap and timeouts with a longer timeout.
+
+    Attempts are spaced by an exponential backoff; other failures, and
+    failures whose resource cannot grow any further, are not retried.
+    """
+
+    max_attempts: int = 3
+    heap_factor: float = 2.0
+    timeout_factor: float = 2.0
+    backoff: float = 5.0
+    heap_limit: Optional[int] = None
+
+    def _escalated_heap(self, jvm: Optional[JvmSettings]) -> Optional[int]:
+        if jvm is None:
+            return None
+        current = resources.parse_size(jvm.heap)
+        heap = int(current * self.heap_factor)
+        if self.heap_limit is not None:
+            heap = min(heap, self.heap_limit)
+        return heap if heap > current else None
+
+    def should_retry(
+        self,
+        error: Exception,
+        number: int,
+        jvm: Optional[JvmSettings],
+        timeout: Optional[int],
+    ) -> bool:
+        if number >= self.max_attempts or not isinstance(error, CommandFailed):
+            return False
+        if error.kind == OOM:
+            return self._escalated_heap(jvm) is not None
+        return error.kind == TIMEOUT and timeout is not None
+
+    def escalate(
+        self, kind: str, jvm: Optional[JvmSettings], timeout: Optional[int]
+    ) -> Tuple[Optional[JvmSettings], Optional[int]]:
+        """Resources for the next attempt after a failure of `kind`"""
+        if kind == OOM and jvm is not None:
+            heap = self._escalated_heap(jvm)
+            if heap is not None:
+                jvm = jvm._replace(heap=resources.format_size(heap))
+        elif kind == TIMEOUT and timeout is not None:
+            timeout = int(timeout * self.timeout_factor)
+        return jvm, timeout
+
+    def delay(self, number: int) -> float:
+        """Seconds to wait before the attempt after attempt `number`"""
+        return self.backoff * 2 ** (number - 1)
+
+
+# __END__
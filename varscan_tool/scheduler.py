@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Cost-aware ordering and stage-level scheduling of mpileup work units.
+"""
+
+import concurrent.futures
+import heapq
+import itertools
+import logging
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from varscan_tool import splitter
+
+DI = SimpleNamespace(futures=concurrent.futures)
+logger = logging.getLogger(__name__)
+# Times a task may be passed over for lack of memory before smaller tasks
+# stop starting ahead of it.
+MAX_DEFERRALS = 3
+
+
+class WorkItem(NamedTuple):
+    idx: int
+    mpileup: str
+    cost: float
+
+
+def file_size_cost(mpileup: str) -> float:
+    """Estimate work by input size in bytes"""
+    try:
+        return float(splitter.byte_size(mpileup))
+    except OSError:
+        return 0.0
+
+
+def line_count_cost(mpileup: str) -> float:
+    """Estimate work by number of mpileup lines"""
+    lines = 0
+    try:
+        with splitter.open_range(mpileup) as fh:
+            for block in iter(lambda: fh.read(1 << 20), b""):
+                lines += block.count(b"\n")
+    except OSError:
+        return 0.0
+    return float(lines)
+
+
+COST_FUNCTIONS: Dict[str, Callable[[str], float]] = {
+    "size": file_size_cost,
+    "lines": line_count_cost,
+}
+
+
+def lpt_order(
+    mpileups: List[str], cost_fn: Callable[[str], float] = file_size_cost
+) -> List[WorkItem]:
+    """Order work longest-processing-time-first.
+
+    Ties keep the original input order; idx is the position in `mpileups`.
+    """
+    items = [
+        WorkItem(idx=idx, mpileup=mpileup, cost=cost_fn(mpileup))
+        for idx, mpileup in enumerate(mpileups)
+    ]
+    return sorted(items, key=lambda item: (-item.cost, item.idx))
+
+
+def predict_makespan(costs: List[float], workers: int) -> float:
+    """Simulate greedy list scheduling of `costs`, in order, on `workers`"""
+    loads = [0.0] * max(1, min(workers, len(costs)))
+    for cost in costs:
+        heapq.heapreplace(loads, loads[0] + cost)
+    return max(loads)
+
+
+def log_schedule(items: List[WorkItem], workers: int) -> None:
+    """Log the submission order and predicted makespan"""
+    costs = [item.cost for item in items]
+    total = sum(costs)
+    makespan = predict_makespan(costs, workers)
+    for rank, item in enumerate(items):
+        logger.info("Schedule %s: %s (cost %s)", rank, item.mpileup, item.cost)
+    logger.info(
+        "Predicted makespan %s of total cost %s on %s workers (lower bound %s)",
+        makespan,
+        total,
+        workers,
+        max([total / max(workers, 1)] + costs) if costs else 0.0,
+    )
+
+
+class StageTask(NamedTuple):
+    chunk: int
+    stage: str
+    fn: Callable
+    args: Tuple
+    memory: int = 0
+
+
+class StageQueue:
+    """Stage tasks waiting for a pool to start them, most urgent first.
+
+    Delayed tasks become ready once their delay has passed. With a memory
+    budget, a task is only admitted while its memory fits; smaller queued
+    tasks may be admitted ahead of one that does not, until it has been
+    deferred MAX_DEFERRALS times. Then nothing else is admitted until memory
+    released by finished tasks lets it in.
+    """
+
+    def __init__(self, budget=None):
+        self.budget = budget
+        self._ready: List[Any] = []
+        self._delayed: List[Any] = []
+        # Deferrals of queued tasks, by sequence number.
+        self._deferrals: Dict[int, int] = {}
+        self._seq = itertools.count()
+
+    def push(
+        self, task: StageTask, callback: Callable, priority=0, delay: float = 0.0
+    ) -> None:
+        entry = (priority, next(self._seq), task, callback)
+        if delay > 0:
+            heapq.heappush(self._delayed, (time.monotonic() + delay, entry))
+        else:
+            heapq.heappush(self._ready, entry)
+
+    def clear(self) -> None:
+        self._ready.clear()
+        self._delayed.clear()
+        self._deferrals.clear()
+
+    def next_delay(self) -> Optional[float]:
+        """Seconds until the next delayed task is due, None without one"""
+        if not self._delayed:
+            return None
+        return max(0.0, self._delayed[0][0] - time.monotonic())
+
+    def admit(self, slots: int) -> List[Tuple[StageTask, Callable]]:
+        """Up to `slots` ready tasks to start now, their memory reserved"""
+        now = time.monotonic()
+        while self._delayed and self._delayed[0][0] <= now:
+            heapq.heappush(self._ready, heapq.heappop(self._delayed)[1])
+        admitted = []
+        deferred = []
+        while self._ready and len(admitted) < slots:
+            entry = heapq.heappop(self._ready)
+            task, callback = entry[2], entry[3]
+            if self.budget is not None:
+                seq = entry[1]
+                if not self.budget.can_admit(task.memory):
+                    deferred.append(entry)
+                    self._deferrals[seq] = self._deferrals.get(seq, 0) + 1
+                    if self._deferrals[seq] > MAX_DEFERRALS:
+                        break
+                    continue
+                self._deferrals.pop(seq, None)
+                self.budget.reserve(task.memory)
+            admitted.append((task, callback))
+        for entry in deferred:
+            heapq.heappush(self._ready, entry)
+        if deferred:
+            logger.debug(
+                "Deferred %s task(s); %s of %s bytes reserved",
+                len(deferred),
+                self.budget.reserved,
+                self.budget.limit,
+            )
+        return admitted
+
+    def release(self, task: StageTask) -> None:
+        """Return the memory of a finished task to the budget"""
+        if self.budget is not None:
+            self.budget.release(task.memory)
+
+
+class StagePool:
+    """Runs stage tasks on an executor, most urgent first.
+
+    At most `max_workers` tasks are handed to the executor at a time, so
+    follow-up stages submitted from callbacks are not queued behind every
+    pending chunk. Tasks wait in a StageQueue, which holds back delayed ones
+    and those whose memory does not fit the budget. Callbacks run on the
+    thread calling `run`. Once cancelled, queued tasks are dropped and new
+    ones ignored; running tasks finish and their callbacks still run.
+    """
+
+    def __init__(self, executor, max_workers: int, budget=None, _di=DI):
+        self.executor = executor
+        self.max_workers = max_workers
+        self.queue = StageQueue(budget)
+        self._di = _di
+        self._running: Dict[Any, Tuple[StageTask, Callable]] = {}
+        self.cancelled = False
+
+    def submit(
+        self, task: StageTask, callback: Callable, priority=0, delay: float = 0.0
+    ) -> None:
+        """Queue a task; callback(task, future) runs once it completes"""
+        if not self.cancelled:
+            self.queue.push(task, callback, priority, delay)
+
+    def cancel(self) -> None:
+        """Stop starting tasks, e.g. after an unrecoverable failure"""
+        self.cancelled = True
+        self.queue.clear()
+
+    def _dispatch(self) -> None:
+        for task, callback in self.queue.admit(self.max_workers - len(self._running)):
+            future = self.executor.submit(task.fn, *task.args)
+            self._running[future] = (task, callback)
+
+    def run(self) -> None:
+        """Run until no task is queued, delayed or in flight"""
+        self._dispatch()
+        while self._running or self.queue.next_delay() is not None:
+            timeout = self.queue.next_delay()
+            if not self._running:
+                time.sleep(timeout)
+            else:
+                done, _ = self._di.futures.wait(
+                    list(self._running),
+                    timeout=timeout,
+                    return_when=self._di.futures.FIRST_COMPLETED,
+                )
+                for future in done:
+                    task, callback = self._running.pop(future)
+                    self.queue.release(task)
+                    callback(task, future)
+            self._dispatch()
+
+
+# __END__
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Byte-balanced slices of a plain mpileup, without writing chunk files.
+
+The mpileup is memory-mapped to place N cut points at line starts, or at
+contig starts, nearest to even byte offsets. Only the few pages around each
+candidate cut are read. Each slice is named by a spec, "path@start-end",
+used as the chunk's mpileup: opening it reads just those bytes, which are
+streamed to VarScan through a pipe like compressed inputs.
+"""
+
+import bisect
+import io
+import mmap
+import os
+import re
+from typing import IO, List, NamedTuple, Optional
+
+_SPEC = re.compile(r"^(?P<path>.+)@(?P<start>\d+)-(?P<end>\d+)$")
+
+
+class Slice(NamedTuple):
+    path: str
+    start: int
+    end: int
+
+    @property
+    def length(self) -> int:
+        return self.end - self.start
+
+    @property
+    def spec(self) -> str:
+        return "{}@{}-{}".format(self.path, self.start, self.end)
+
+
+def parse_slice(spec: str) -> Optional[Slice]:
+    """The slice named by a spec; None for other paths"""
+    match = _SPEC.match(spec)
+    if match is None:
+        return None
+    return Slice(match["path"], int(match["start"]), int(match["end"]))
+
+
+class SliceReader(io.RawIOBase):
+    """Reads the bytes of a slice of a file, seekable within the slice"""
+
+    def __init__(self, part: Slice):
+        super().__init__()
+        self.part = part
+        self._fh = open(part.path, "rb")
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        wanted = min(len(buffer), self.part.length - self._pos)
+        if wanted <= 0:
+            return 0
+        self._fh.seek(self.part.start + self._pos)
+        count = self._fh.readinto(memoryview(buffer)[:wanted])
+        self._pos += count
+        return count
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: self.part.length}
+        self._pos = max(0, base[whence] + offset)
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+    def close(self) -> None:
+        self._fh.close()
+        super().close()
+
+
+def open_range(path: str) -> IO[bytes]:
+    """Open a file for binary reads, or only the bytes of a slice spec"""
+    part = parse_slice(path)
+    if part is None:
+        return open(path, "rb")
+    return io.BufferedReader(SliceReader(part), 1 << 20)
+
+
+def byte_size(path: str) -> int:
+    """Bytes of a file or a slice spec; raises OSError for missing files"""
+    part = parse_slice(path)
+    if part is None:
+        return os.stat(path).st_size
+    return part.length
+
+
+def source_path(path: str) -> str:
+    """The file a slice spec reads, or the path itself"""
+    part = parse_slice(path)
+    return path if part is None else part.path
+
+
+def line_start(mm, pos: int) -> int:
+    """Offset of the first line starting at or after `pos`"""
+    if pos <= 0:
+        return 0
+    newline = mm.find(b"\n", pos - 1)
+    return len(mm) if newline < 0 else newline + 1
+
+
+def _contig(mm, start: int) -> bytes:
+    end = mm.find(b"\t", start)
+    return mm[start:end]
+
+
+def contig_starts(mm) -> List[int]:
+    """Offsets where each contig's lines start, for mpileups grouped by contig
+
+    The end of each contig is found by binary search over byte offsets, so
+    the cost grows with the number of contigs, not the size of the file.
+    """
+    starts = []
+    start, size = 0, len(mm)
+    while start < size:
+        starts.append(start)
+        contig = _contig(mm, start)
+        lo, hi = start, size
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            found = line_start(mm, mid)
+            if found < size and _contig(mm, found) == contig:
+                lo = mid
+            else:
+                hi = mid
+        start = line_start(mm, hi)
+    return starts
+
+
+def cut_points(mm, count: int, contigs: bool = False) -> List[int]:
+    """Offsets splitting a mapped mpileup into up to `count` balanced slices
+
+    Cuts are at the line start, or with `contigs` the contig start, nearest
+    each multiple of size / count; the first is 0 and the last the size.
+    """
+    size = len(mm)
+    boundaries = contig_starts(mm) if contigs else []
+    cuts = [0]
+    for idx in range(1, count):
+        target = size * idx // count
+        if contigs:
+            at = bisect.bisect_left(boundaries, target)
+            near = boundaries[max(0, at - 1) : at + 1]
+            cut = min(near, key=lambda offset: abs(offset - target))
+        else:
+            cut = line_start(mm, target)
+        if cuts[-1] < cut < size:
+            cuts.append(cut)
+    cuts.append(size)
+    return cuts
+
+
+def split_mpileup(path: str, count: int, contigs: bool = False) -> List[str]:
+    """Slice specs covering a plain mpileup in up to `count` balanced slices"""
+    if os.stat(path).st_size == 0:
+        return [path]
+    with open(path, "rb") as fh:
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            cuts = cut_points(mm, count, contigs)
+    return [Slice(path, start, end).spec for start, end in zip(cuts, cuts[1:])]
+
+
+# __END__
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Tabix (.tbi) indexing of BGZF-compressed VCFs, built while writing.
+"""
+
+import struct
+from typing import Callable, Dict, List, Optional
+
+from varscan_tool.bgzf import BgzfWriter
+
+TBI_VCF = 2
+MIN_SHIFT = 14
+# Largest position the tabix binning scheme can address.
+MAX_POSITION = 1 << 29
+# Pseudo-bin holding per-reference offsets and record counts, as htslib.
+META_BIN = 37450
+
+
+def reg2bin(beg: int, end: int) -> int:
+    """UCSC bin of the 0-based, half-open interval [beg, end)"""
+    end -= 1
+    for shift, offset in ((14, 4681), (17, 585), (20, 73), (23, 9), (26, 1)):
+        if beg >> shift == end >> shift:
+            return offset + (beg >> shift)
+    return 0
+
+
+class _Reference:
+    def __init__(self, name: str):
+        self.name = name
+        self.bins: Dict[int, List[List[int]]] = {}
+        self.linear: List[Optional[int]] = []
+        self.first = 0
+        self.last = 0
+        self.records = 0
+        self.max_beg = 0
+
+
+class TabixIndexer:
+    """Accumulates tabix bins and the linear index from sorted records.
+
+    Offsets are uncompressed stream offsets; they are converted to virtual
+    offsets when the index is written.
+    """
+
+    def __init__(self):
+        self.references: List[_Reference] = []
+        self._seen: set = set()
+
+    def add(self, contig: str, beg: int, end: int, start: int, stop: int) -> None:
+        """Index a record spanning [beg, end) stored at stream [start, stop)"""
+        if end > MAX_POSITION:
+            raise ValueError(
+                "{}:{} is beyond the tabix index range".format(contig, end)
+            )
+        if not self.references or self.references[-1].name != contig:
+            if contig in self._seen:
+                raise ValueError("Records for {} are not contiguous".format(contig))
+            self._seen.add(contig)
+            self.references.append(_Reference(contig))
+            self.references[-1].first = start
+        ref = self.references[-1]
+        if beg < ref.max_beg:
+            raise ValueError("Records are not sorted at {}:{}".format(contig, beg + 1))
+        ref.max_beg = beg
+        ref.last = stop
+        ref.records += 1
+
+        chunks = ref.bins.setdefault(reg2bin(beg, end), [])
+        if chunks and chunks[-1][1] == start:
+            chunks[-1][1] = stop
+        else:
+            chunks.append([start, stop])
+
+        last_window = (max(end, beg + 1) - 1) >> MIN_SHIFT
+        if len(ref.linear) <= last_window:
+            ref.linear.extend([None] * (last_window + 1 - len(ref.linear)))
+        for window in range(beg >> MIN_SHIFT, last_window + 1):
+            if ref.linear[window] is None:
+                ref.linear[window] = start
+
+    def serialize(self, virtual_offset: Callable[[int], int]) -> bytes:
+        names = b"".join(ref.name.encode() + b"\0" for ref in self.references)
+        parts = [
+            b"TBI\1",
+            struct.pack(
+                "<8i", len(self.references), TBI_VCF, 1, 2, 0, ord("#"), 0, len(names)
+            ),
+            names,
+        ]
+        for ref in self.references:
+            parts.append(struct.pack("<i", len(ref.bins) + 1))
+            for bin_id in sorted(ref.bins):
+                chunks = ref.bins[bin_id]
+                parts.append(struct.pack("<Ii", bin_id, len(chunks)))
+                for start, stop in chunks:
+                    parts.append(
+                        struct.pack("<2Q", virtual_offset(start), virtual_offset(stop))
+                    )
+            parts.append(
+                struct.pack(
+                    "<Ii4Q",
+                    META_BIN,
+                    2,
+                    virtual_offset(ref.first),
+                    virtual_offset(ref.last),
+                    ref.records,
+                    0,
+                )
+            )
+            linear = []
+            previous = 0
+            for offset in ref.linear:
+                previous = virtual_offset(offset) if offset is not None else previous
+                linear.append(previous)
+            parts.append(struct.pack("<i{}Q".format(len(linear)), len(linear), *linear))
+        parts.append(struct.pack("<Q", 0))
+        return b"".join(parts)
+
+    def write(self, path: str, virtual_offset: Callable[[int], int]) -> None:
+        with BgzfWriter(path) as writer:
+            writer.write(self.serialize(virtual_offset))
+
+
+class TabixVcfWriter:
+    """BGZF VCF writer that builds the .tbi index in the same pass.
+
+    Each `write` must be a single, complete VCF line, as produced by
+    `utils.merge_outputs`; records must be coordinate sorted.
+    """
+
+    def __init__(self, path: str, threads: int = 1):
+        self.path = path
+        self.index_path = path + ".tbi"
+        self._writer = BgzfWriter(path, threads=threads)
+        self._indexer = TabixIndexer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._writer.close()
+        if exc_type is None:
+            self._indexer.write(self.index_path, self._writer.virtual_offset)
+
+    def write(self, line: str) -> None:
+        start = self._writer.tell()
+        self._writer.write(line)
+        if line.startswith("#"):
+            return
+        chrom, pos, _, ref = line.split("\t", 4)[:4]
+        beg = int(pos) - 1
+        self._indexer.add(chrom, beg, beg + len(ref), start, self._writer.tell())
+
+    def writelines(self, lines) -> None:
+        for line in lines:
+            self.write(line)
+
+
+# __END__
@@ -1,65 +1,472 @@
 #!/usr/bin/env python3
+import collections
+import contextlib
+import contextvars
+import gzip
+import heapq
+import logging
+import os
 import pathlib
 import shlex
+import shutil
+import signal
 import subprocess
+import sys
+import threading
+import time
 from types import SimpleNamespace
-from typing import IO, List, NamedTuple, Optional
+from typing import (
+    IO,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+from varscan_tool import resources, splitter, vcf
 
 DI = SimpleNamespace(subprocess=subprocess)
+logger = logging.getLogger(__name__)
+# Usage collected for the current thread or asyncio task, see collect_usage.
+_usage: contextvars.ContextVar = contextvars.ContextVar("usage", default=None)
+
+STDIN = "-"
+COMPRESSED_SUFFIXES = (".gz", ".bgz")
+
+
+OOM = "oom"
+TIMEOUT = "timeout"
+ERROR = "error"
+# Lines of each captured stream kept in memory for error reports.
+TAIL_LINES = 200
+# Record lines merge_outputs writes and hands to its tally at a time.
+MERGE_BATCH_LINES = 1 << 14
+# Output of a JVM that ran out of heap, looked for in every line written.
+OOM_MARKER = "java.lang.OutOfMemoryError"
+
+
+class ResourceUsage(NamedTuple):
+    """Wall and CPU seconds, peak RSS and storage I/O bytes of a command"""
+
+    wall: float
+    user: float
+    sys: float
+    max_rss: int
+    read_bytes: Optional[int] = None
+    write_bytes: Optional[int] = None
 
 
 class PopenReturn(NamedTuple):
     retcode: int
     stdout: Optional[str]
     stderr: Optional[str]
+    timed_out: bool = False
+    usage: Optional[ResourceUsage] = None
+    oom_killed: bool = False
+    # OOM_MARKER was written, possibly before the tails.
+    out_of_memory: bool = False
+
+
+class CommandFailed(ValueError):
+    """A command exited unsuccessfully; kind is one of OOM, TIMEOUT, ERROR"""
+
+    def __init__(self, msg: str, kind: str = ERROR, retcode: Optional[int] = None):
+        super().__init__(msg)
+        self.kind = kind
+        self.retcode = retcode
+
+
+def classify_failure(cmd_return: PopenReturn) -> Optional[str]:
+    """Classify a command result as OOM, TIMEOUT or ERROR; None on success
+
+    Commands run without a shell, so the kernel OOM killer shows as a -9
+    return code, which only counts as OOM with `oom_killed` set: timeouts
+    and operators kill with SIGKILL too.
+    """
+    if cmd_return.timed_out:
+        return TIMEOUT
+    if cmd_return.retcode == 0:
+        return None
+    output = "{}{}".format(cmd_return.stdout or "", cmd_return.stderr or "")
+    if cmd_return.oom_killed or cmd_return.out_of_memory or OOM_MARKER in output:
+        return OOM
+    return ERROR
+
+
+def oom_killed_since(oom_kills: Optional[int], retcode: Optional[int]) -> bool:
+    """True for a SIGKILLed command while the cgroup's OOM kill count rose
+    above `oom_kills`, read before the command started"""
+    if retcode != -signal.SIGKILL or oom_kills is None:
+        return False
+    after = resources.oom_kills()
+    return after is not None and after > oom_kills
+
+
+def is_streamed_input(path: str) -> bool:
+    """True for inputs that must be piped to a command: stdin, compressed, slices"""
+    return (
+        path == STDIN
+        or path.endswith(COMPRESSED_SUFFIXES)
+        or splitter.parse_slice(path) is not None
+    )
+
+
+def open_mpileup(path: str) -> IO[bytes]:
+    """Open an mpileup for binary streaming reads, decompressing gzip/bgzip"""
+    if path == STDIN:
+        return sys.stdin.buffer
+    if path.endswith(COMPRESSED_SUFFIXES):
+        return gzip.open(path, "rb")  # type: ignore
+    return splitter.open_range(path)
+
+
+def _feed_stdin(source: IO[bytes], sink: IO[bytes], errors: List[str]) -> None:
+    try:
+        shutil.copyfileobj(source, sink, 1 << 20)
+    except BrokenPipeError:
+        # The command stopped reading; its return code reports why.
+        pass
+    except Exception as e:
+        errors.append("stdin feed failed: {!r}".format(e))
+    finally:
+        try:
+            sink.close()
+        except BrokenPipeError:
+            pass
+
+
+@contextlib.contextmanager
+def collect_usage():
+    """Collect the ResourceUsage of commands run on this thread, or asyncio task"""
+    collected: List[ResourceUsage] = []
+    token = _usage.set(collected)
+    try:
+        yield collected
+    finally:
+        _usage.reset(token)
+
+
+def record_usage(usage: Optional[ResourceUsage]) -> None:
+    """Add a command's usage to the enclosing collect_usage block, if any"""
+    collected = _usage.get()
+    if usage is not None and collected is not None:
+        collected.append(usage)
+
+
+@contextlib.contextmanager
+def fifo_readers(paths: Sequence[str], reader: Callable[[str, IO], None]):
+    """Create a named pipe at each path, read by reader(path, fh) in a thread
+
+    Commands run in the block may write the pipes like regular files. Each
+    pipe is held open for writing until the block exits, so opening it never
+    blocks and its reader only sees EOF once the block's writers are done.
+    A failed reader keeps draining its pipe so writers are not left blocked;
+    its error is raised on exit.
+    """
+    errors: List[Exception] = []
+
+    def consume(path: str, fh: IO) -> None:
+        try:
+            reader(path, fh)
+        except Exception as e:
+            errors.append(e)
+            while fh.read(1 << 16):
+                pass
+        finally:
+            fh.close()
+
+    with contextlib.ExitStack() as stack:
+        for path in paths:
+            if os.path.lexists(path):
+                os.remove(path)
+            os.mkfifo(path)
+            stack.callback(os.remove, path)
+            fd = os.open(path, os.O_RDWR)
+            fh = open(path)
+            thread = threading.Thread(target=consume, args=(path, fh), daemon=True)
+            thread.start()
+            stack.callback(thread.join)
+            stack.callback(os.close, fd)
+        yield
+    if errors:
+        raise errors[0]
+
+
+def _proc_io(pid: int) -> Dict[str, int]:
+    try:
+        with open("/proc/{}/io".format(pid)) as fh:
+            return {
+                key: int(value)
+                for key, value in (line.split(": ") for line in fh if ": " in line)
+            }
+    except (OSError, ValueError):
+        return {}
+
+
+def _wait(p, timeout: Optional[int]) -> Tuple[bool, Optional[ResourceUsage]]:
+    """Wait for a command, killing it after `timeout`; returns (timed_out, usage)
+
+    Where os.waitid is available, the exited command is read from /proc
+    before it is reaped with os.wait4, which reports its rusage.
+    """
+    if not hasattr(os, "waitid"):
+        try:
+            p.wait(timeout=timeout)
+            return False, None
+        except subprocess.TimeoutExpired:
+            p.kill()
+            p.wait()
+            return True, None
+
+    start = time.monotonic()
+    lock = threading.Lock()
+    found: Dict[str, ResourceUsage] = {}
+
+    def reap():
+        os.waitid(os.P_PID, p.pid, os.WEXITED | os.WNOWAIT)
+        with lock:
+            io = _proc_io(p.pid)
+            _, status, rusage = os.wait4(p.pid, 0)
+            p.returncode = os.waitstatus_to_exitcode(status)
+        found["usage"] = ResourceUsage(
+            wall=time.monotonic() - start,
+            user=rusage.ru_utime,
+            sys=rusage.ru_stime,
+            max_rss=rusage.ru_maxrss * 1024,
+            read_bytes=io.get("read_bytes"),
+            write_bytes=io.get("write_bytes"),
+        )
+
+    reaper = threading.Thread(target=reap, daemon=True)
+    reaper.start()
+    reaper.join(timeout)
+    timed_out = reaper.is_alive()
+    if timed_out:
+        with lock:
+            if p.returncode is None:
+                os.kill(p.pid, signal.SIGKILL)
+        reaper.join()
+    return timed_out, found.get("usage")
+
+
+def open_log(log_path: str, cmd: str) -> IO[str]:
+    """Open a command log for appending, headed by the attempt's start and command
+
+    Retried commands share a log, so earlier attempts' output is kept.
+    """
+    log_fh = open(log_path, "a")
+    log_fh.write(
+        "==> {} attempt: {} <==\n".format(time.strftime("%Y-%m-%dT%H:%M:%S"), cmd)
+    )
+    log_fh.flush()
+    return log_fh
+
+
+def _drain(
+    pipe: IO[bytes],
+    name: str,
+    tail: Deque[str],
+    log_fh: Optional[IO[str]],
+    lock: threading.Lock,
+    markers: Set[str],
+) -> None:
+    """Log a command's output line by line as it is written"""
+    with pipe:
+        for raw in iter(pipe.readline, b""):
+            line = raw.decode(errors="replace")
+            tail.append(line)
+            if OOM_MARKER in line:
+                markers.add(OOM_MARKER)
+            logger.debug("%s: %s", name, line.rstrip("\n"))
+            if log_fh is not None:
+                with lock:
+                    log_fh.write("[{}] {}".format(name, line))
+                    log_fh.flush()
 
 
 def call_subprocess(
-    cmd, timeout: Optional[int] = None, _di=DI, **kwargs
+    cmd,
+    timeout: Optional[int] = None,
+    stdin_source: Optional[IO[bytes]] = None,
+    log_path: Optional[str] = None,
+    tail_lines: int = TAIL_LINES,
+    _di=DI,
+    **kwargs,
 ) -> PopenReturn:
     """Run subprocess command.
     Accepts:
         cmd (str): Command to run
         timeout (Optional[int]): Max time to wait, seconds
+        stdin_source (Optional[IO[bytes]]): Stream copied to the command's stdin
+            from a background thread; a failure reading it fails the command
+        log_path (Optional[str]): File receiving piped stdout/stderr lines as
+            they are written
+        tail_lines (int): Lines of each piped stream kept for the return value
         kwargs: Extra args for Popen
     Raises:
         ValueError: Invalid kwargs
     Returns:
-        PopenReturn: Stdout, stderr, and retcode of run command
+        PopenReturn: Retcode, the last tail_lines of piped stdout and stderr,
+            and the command's resource usage where the platform reports it
     """
 
+    if stdin_source is not None:
+        kwargs["stdin"] = subprocess.PIPE
+    oom_kills = resources.oom_kills()
     if kwargs.get("shell", False):
         p = _di.subprocess.Popen(cmd, **kwargs)
     else:
         p = _di.subprocess.Popen(shlex.split(cmd), **kwargs)
-    try:
-        stdout, stderr = p.communicate(timeout=timeout)
-    except subprocess.TimeoutExpired:
-        p.kill()
-        stdout, stderr = p.communicate()
 
-    try:
-        stdout = stdout.decode()
-    except AttributeError:
-        pass
+    threads = []
+    feed_errors: List[str] = []
+    if stdin_source is not None:
+        # The feeder thread owns and closes the command's stdin.
+        sink, p.stdin = p.stdin, None
+        threads.append(
+            threading.Thread(
+                target=_feed_stdin, args=(stdin_source, sink, feed_errors), daemon=True
+            )
+        )
+    tails: Dict[str, Deque[str]] = {}
+    markers: Set[str] = set()
+    with contextlib.ExitStack() as stack:
+        log_fh = None
+        if log_path is not None:
+            log_fh = stack.enter_context(open_log(log_path, cmd))
+        lock = threading.Lock()
+        for name in ("stdout", "stderr"):
+            pipe = getattr(p, name)
+            if pipe is None:
+                continue
+            tails[name] = collections.deque(maxlen=tail_lines)
+            threads.append(
+                threading.Thread(
+                    target=_drain,
+                    args=(pipe, name, tails[name], log_fh, lock, markers),
+                    daemon=True,
+                )
+            )
+        for thread in threads:
+            thread.start()
+        timed_out, usage = _wait(p, timeout)
+        for thread in threads:
+            thread.join()
 
-    try:
-        stderr = stderr.decode()
-    except AttributeError:
-        pass
+    stdout = "".join(tails["stdout"]) if "stdout" in tails else None
+    stderr = "".join(tails["stderr"]) if "stderr" in tails else None
+
+    retcode = p.returncode
+    oom_killed = oom_killed_since(oom_kills, retcode)
+    if feed_errors:
+        retcode = retcode or 1
+        stderr = "\n".join(filter(None, [stderr] + feed_errors))
+
+    record_usage(usage)
+    return PopenReturn(
+        retcode=retcode,
+        stdout=stdout,
+        stderr=stderr,
+        timed_out=timed_out,
+        usage=usage,
+        oom_killed=oom_killed,
+        out_of_memory=OOM_MARKER in markers,
+    )
+
+
+def _header_key(line: str) -> str:
+    """Identify a meta line by its key and ID, e.g. '##INFO=<ID=DP'"""
+    if line.startswith("##") and "=<ID=" in line:
+        return line.split(",", 1)[0].split(">", 1)[0]
+    return line
+
+
+def merge_headers(headers: Iterable[List[str]], contigs: Sequence = ()) -> List[str]:
+    """Reconcile VCF headers from several inputs.
+
+    Meta lines are de-duplicated by key and ID in first-seen order. When
+    reference contigs are given, ##contig lines are emitted for all of them in
+    reference order, followed by any other contigs found in the inputs.
+    """
+    meta: Dict[str, str] = {}
+    contig_lines: Dict[str, str] = {}
+    column_line = None
+    for header in headers:
+        for line in header:
+            if line.startswith("#CHROM"):
+                if column_line is None:
+                    column_line = line
+                elif line.split() != column_line.split():
+                    raise ValueError("Inconsistent VCF columns: {}".format(line))
+            elif line.startswith("##contig="):
+                contig_lines.setdefault(_header_key(line), line)
+            else:
+                meta.setdefault(_header_key(line), line)
+
+    merged = sorted(meta.values(), key=lambda line: not line.startswith("##fileformat"))
+    for contig in contigs:
+        key = "##contig=<ID={}".format(contig.name)
+        contig_lines.pop(key, None)
+        merged.append("{},length={}>\n".format(key, contig.length))
+    merged.extend(contig_lines.values())
+    if column_line is not None:
+        merged.append(column_line)
+    return merged
+
+
+def merge_outputs(
+    files: List[pathlib.PosixPath],
+    output_file: IO,
+    contigs: Sequence = (),
+    tally: Optional[Callable[[List[str]], object]] = None,
+):
+    """Merge coordinate-sorted scattered outputs into one sorted stream.
+
+    Records are ordered by the position of their contig in `contigs` (unknown
+    contigs last, by name), then by position. Only one pending record per
+    input is held in memory. With `tally`, records are written a batch of
+    MERGE_BATCH_LINES at a time, and each batch is also passed to it.
+    """
+    rank = {contig.name: i for i, contig in enumerate(contigs)}
+
+    def sort_key(record: vcf.VcfRecord) -> Tuple[int, str, int]:
+        return rank.get(record.chrom, len(rank)), record.chrom, record.pos
 
-    return PopenReturn(retcode=p.returncode, stdout=stdout, stderr=stderr)
+    with contextlib.ExitStack() as stack:
+        readers = [vcf.VcfReader(stack.enter_context(f.open())) for f in files]
+        records = [iter(reader) for reader in readers]
+        pending = []
+        for i, it in enumerate(records):
+            record = next(it, None)
+            if record is not None:
+                pending.append((sort_key(record), i, record))
 
+        output_file.writelines(merge_headers([r.header for r in readers], contigs))
 
-def merge_outputs(files: List[pathlib.PosixPath], output_file: IO):
-    """Merge scattered outputs"""
-    first = True
-    for f in files:
-        with f.open() as fh:
-            for line in fh:
-                if first or not line.startswith("#"):
-                    output_file.write(line)
-        first = False
+        batch: List[str] = []
+        write = output_file.write if tally is None else batch.append
+        heapq.heapify(pending)
+        while pending:
+            _, i, record = pending[0]
+            write(record.line)
+            record = next(records[i], None)
+            if record is None:
+                heapq.heappop(pending)
+            else:
+                heapq.heapreplace(pending, (sort_key(record), i, record))
+            if len(batch) == MERGE_BATCH_LINES:
+                output_file.writelines(batch)
+                tally(batch)
+                batch.clear()
+        if batch:
+            output_file.writelines(batch)
+            tally(batch)
     return
 
 
@@ -1,12 +1,20 @@
 #!/usr/bin/env python3
+import contextlib
 import logging
 import os
 from types import SimpleNamespace
-from typing import NamedTuple
+from typing import Iterator, NamedTuple, Optional, Sequence, Tuple
 
 from varscan_tool import utils
+from varscan_tool.jvm import JvmSettings
+from varscan_tool.metrics import StageMetrics
+from varscan_tool.retry import Attempt
 from varscan_tool.varscan_somatic import VarscanSomatic
-from varscan_tool.varscan_somatic_process import SomaticProcess
+from varscan_tool.varscan_somatic_process import (
+    MERGED,
+    PROCESS_BACKENDS,
+    NativeSomaticProcess,
+)
 
 DI = SimpleNamespace(os=os)
 logger = logging.getLogger(__name__)
@@ -17,33 +25,144 @@ class VarscanReturn(NamedTuple):
     indel_file: str
     mpileup: str
     idx: int
+    attempts: Tuple[Attempt, ...] = ()
+    metrics: Tuple[StageMetrics, ...] = ()
 
 
 class Varscan2:
     @staticmethod
-    def run_pipeline(
+    def somatic_base(mpileup: str, workdir: str = ".", _di=DI) -> str:
+        """Output base VarScan somatic is given for an mpileup"""
+        if mpileup == utils.STDIN:
+            output_base = "stdin"
+        else:
+            output_base = _di.os.path.basename(mpileup)
+        return _di.os.path.join(workdir, output_base)
+
+    @staticmethod
+    def somatic_outputs(mpileup: str, workdir: str = ".", _di=DI) -> Tuple[str, str]:
+        """Raw snp and indel VCFs written by VarScan somatic for an mpileup"""
+        output_base = Varscan2.somatic_base(mpileup, workdir, _di=_di)
+        return "{}.snp.vcf".format(output_base), "{}.indel.vcf".format(output_base)
+
+    @staticmethod
+    def run_somatic(
         mpileup: str,
-        idx: int,
         args,
+        jvm: Optional[JvmSettings] = None,
+        timeout: Optional[int] = None,
         _somatic=VarscanSomatic,
-        _process=SomaticProcess,
         _di=DI,
-    ) -> VarscanReturn:
-        output_base = _di.os.path.basename(mpileup)
+    ) -> Tuple[str, str]:
+        """Run VarScan somatic in args.workdir, returning the raw snp and indel VCFs"""
+        output_base = Varscan2.somatic_base(mpileup, args.workdir, _di=_di)
 
+        kwargs = {}
+        if jvm is not None:
+            kwargs["jvm"] = jvm
+        if timeout is not None:
+            kwargs["timeout"] = timeout
         varscan_somatic = _somatic()
-        varscan_somatic.run(mpileup, output_base)
+        varscan_somatic.run(mpileup, output_base, **kwargs)
+        return Varscan2.somatic_outputs(mpileup, args.workdir, _di=_di)
 
-        snp_file = "{}.snp.vcf".format(output_base)
-        indel_file = "{}.indel.vcf".format(output_base)
+    @staticmethod
+    @contextlib.contextmanager
+    def streamed_outputs(
+        mpileup: str,
+        args,
+        timeout: Optional[int] = None,
+        categories: Sequence[str] = (MERGED,),
+        _di=DI,
+    ) -> Iterator[Tuple[str, str]]:
+        """Named pipes at an mpileup's raw VCF paths, split by native processSomatic
 
-        with _process(
-            args.timeout,
+        Yields the raw VCF names; the pipes are read until the context exits.
+        """
+        raw_vcfs = Varscan2.somatic_outputs(mpileup, args.workdir, _di=_di)
+        process = NativeSomaticProcess(
+            timeout or args.timeout,
             args.varscan_jar,
             args.min_tumor_freq,
             args.max_normal_freq,
             args.vps_p_value,
-        ) as process:
+        )
+
+        def split(path, fh):
+            process.split(fh, path, categories)
+
+        with utils.fifo_readers(raw_vcfs, split):
+            yield raw_vcfs
+
+    @staticmethod
+    def run_somatic_streamed(
+        mpileup: str,
+        args,
+        jvm: Optional[JvmSettings] = None,
+        timeout: Optional[int] = None,
+        categories: Sequence[str] = (MERGED,),
+        _somatic=VarscanSomatic,
+        _di=DI,
+    ) -> Tuple[str, str]:
+        """Run VarScan somatic into named pipes read by native processSomatic
+
+        The raw snp and indel VCFs never reach disk; only the given
+        processSomatic categories are written. Returns the raw VCF names the
+        outputs are named after.
+        """
+        with Varscan2.streamed_outputs(
+            mpileup, args, timeout, categories, _di
+        ) as raw_vcfs:
+            Varscan2.run_somatic(mpileup, args, jvm, timeout, _somatic, _di)
+        return raw_vcfs
+
+    @staticmethod
+    def somatic_process(
+        args,
+        jvm: Optional[JvmSettings] = None,
+        timeout: Optional[int] = None,
+        _process=None,
+    ):
+        """The args.process_backend processSomatic, with a stage's JVM settings"""
+        _process = _process or PROCESS_BACKENDS[args.process_backend]
+        kwargs = {}
+        if jvm is not None:
+            kwargs = {"heap": jvm.heap, "jvm_flags": jvm.flags}
+        return _process(
+            timeout or args.timeout,
+            args.varscan_jar,
+            args.min_tumor_freq,
+            args.max_normal_freq,
+            args.vps_p_value,
+            **kwargs,
+        )
+
+    @staticmethod
+    def run_process(
+        input_vcf: str,
+        args,
+        jvm: Optional[JvmSettings] = None,
+        timeout: Optional[int] = None,
+        _process=None,
+    ) -> None:
+        """Run VarScan processSomatic on a single raw VCF"""
+        with Varscan2.somatic_process(args, jvm, timeout, _process) as process:
+            process.run(input_vcf)
+
+    @staticmethod
+    def run_pipeline(
+        mpileup: str,
+        idx: int,
+        args,
+        _somatic=VarscanSomatic,
+        _process=None,
+        _di=DI,
+    ) -> VarscanReturn:
+        snp_file, indel_file = Varscan2.run_somatic(
+            mpileup, args, _somatic=_somatic, _di=_di
+        )
+
+        with Varscan2.somatic_process(args, _process=_process) as process:
             process.run(snp_file)
             process.run(indel_file)
 
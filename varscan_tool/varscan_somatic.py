@@ -1,20 +1,27 @@
 #!/usr/bin/env python3
+import contextlib
 import logging
 import os
 from subprocess import PIPE
 from textwrap import dedent
 from types import SimpleNamespace
+from typing import IO, Optional
 
-from varscan_tool import utils
+from varscan_tool import prefilter, utils
+from varscan_tool.jvm import DEFAULT_JVM_FLAGS, JvmSettings
+from varscan_tool.utils import CommandFailed, classify_failure
 
 DI = SimpleNamespace(os=os)
 logger = logging.getLogger(__name__)
 
+# Compressed, stdin, sliced and prefiltered mpileups are fed to the JVM's stdin.
+STREAM_PATH = "/dev/stdin"
+
 
 class VarscanSomatic:
     COMMAND = dedent(
         """
-        java -d64 -XX:+UseSerialGC
+        java -d64 {jvm_flags}
         -Xmx{java_opts}
         -jar {varscan_jar}
         somatic {mpileup} {output_base}
@@ -49,6 +56,7 @@ class VarscanSomatic:
         "strand_filter",
         "validation",
         "output_vcf",
+        "prefilter",
         "timeout",
     )
 
@@ -60,16 +68,43 @@ class VarscanSomatic:
         for attr in cls.ATTRS:
             setattr(cls, attr, getattr(args, attr, None))
 
-    def run(
-        self,
-        mpileup: str,
-        output_base: str,
-    ):
-        """run varscan2 workflow"""
-        command = self.COMMAND.format(
-            java_opts=self.java_opts,
+    @property
+    def prefiltering(self) -> bool:
+        """Whether inputs go through the prefilter, never in validation mode"""
+        return bool(self.prefilter) and not self.validation
+
+    def streams(self, mpileup: str) -> bool:
+        """Whether the mpileup is fed to VarScan's stdin"""
+        return self.prefiltering or self._utils.is_streamed_input(mpileup)
+
+    def open_input(
+        self, mpileup: str, stack: contextlib.ExitStack
+    ) -> Optional[IO[bytes]]:
+        """Stream for VarScan's stdin, closed with `stack`; None to read the file"""
+        if not self.streams(mpileup):
+            return None
+        source = self._utils.open_mpileup(mpileup)
+        if mpileup != self._utils.STDIN:
+            stack.callback(source.close)
+        if not self.prefiltering:
+            return source
+        thresholds = prefilter.Thresholds(
+            int(self.min_coverage_normal), int(self.min_coverage_tumor)
+        )
+        reader = prefilter.PrefilteredReader(source, thresholds)
+        stack.callback(reader.log, mpileup)
+        return reader
+
+    def command(
+        self, mpileup: str, output_base: str, jvm: Optional[JvmSettings] = None
+    ) -> str:
+        """VarScan somatic command line, with --java-opts unless JVM settings are given"""
+        jvm = jvm or JvmSettings(self.java_opts, DEFAULT_JVM_FLAGS)
+        return self.COMMAND.format(
+            jvm_flags=jvm.flags,
+            java_opts=jvm.heap,
             varscan_jar=self.varscan_jar,
-            mpileup=mpileup,
+            mpileup=STREAM_PATH if self.streams(mpileup) else mpileup,
             output_base=output_base,
             min_coverage=self.min_coverage,
             min_coverage_normal=self.min_coverage_normal,
@@ -84,17 +119,40 @@ class VarscanSomatic:
             output_vcf=self.output_vcf,
             validation="--validation" if self.validation else "",
         )
-        cmd_return = self._utils.call_subprocess(
-            command, self.timeout, stdout=PIPE, stderr=PIPE
-        )
-        logger.info(command)
-        logger.debug(cmd_return.stdout)
-        logger.debug(cmd_return.stderr)
-        if not cmd_return.retcode == 0:
-            msg = "Varscan somatic command failed"
-            logger.debug(cmd_return.stdout)
-            logger.debug(cmd_return.stderr)
-            raise ValueError(msg)
+
+    @staticmethod
+    def check(cmd_return) -> None:
+        """Raise CommandFailed for an unsuccessful VarScan somatic command"""
+        failure = classify_failure(cmd_return)
+        if failure:
+            msg = "Varscan somatic command failed ({})".format(failure)
+            logger.error("%s, stderr ends:\n%s", msg, cmd_return.stderr)
+            raise CommandFailed(msg, failure, cmd_return.retcode)
+
+    def run(
+        self,
+        mpileup: str,
+        output_base: str,
+        jvm: Optional[JvmSettings] = None,
+        timeout: Optional[int] = None,
+    ):
+        """run varscan2 workflow, with --java-opts unless JVM settings are given"""
+        command = self.command(mpileup, output_base, jvm)
+        with contextlib.ExitStack() as stack:
+            kwargs = {}
+            stdin_source = self.open_input(mpileup, stack)
+            if stdin_source is not None:
+                kwargs["stdin_source"] = stdin_source
+            logger.info(command)
+            cmd_return = self._utils.call_subprocess(
+                command,
+                timeout or self.timeout,
+                log_path="{}.somatic.log".format(output_base),
+                stdout=PIPE,
+                stderr=PIPE,
+                **kwargs,
+            )
+        self.check(cmd_return)
         return
 
 
@@ -1,24 +1,69 @@
 #!/usr/bin/env python3
+import contextlib
 import logging
 from subprocess import PIPE
 from textwrap import dedent
+from typing import IO, Dict, List, Optional, Sequence, Tuple
 
 from varscan_tool import utils
+from varscan_tool.jvm import DEFAULT_JVM_FLAGS
+from varscan_tool.utils import CommandFailed, classify_failure
+from varscan_tool.vcf import NORMAL, TUMOR, VcfRecord
 
 logger = logging.getLogger(__name__)
 
+STATUSES = ("Somatic", "Germline", "LOH")
+CATEGORIES = tuple(status + suffix for status in STATUSES for suffix in ("", ".hc"))
+# The category merged into the run's final output.
+MERGED = "Somatic.hc"
+# VCF SS= codes, as written by VarScan somatic
+SOMATIC_STATUS = {"1": "Germline", "2": "Somatic", "3": "LOH"}
+
+
+def _root(input_vcf: str) -> str:
+    return input_vcf[: -len(".vcf")] if input_vcf.endswith(".vcf") else input_vcf
+
+
+def reported_freq(record: VcfRecord, column: int) -> float:
+    """A sample's VAF as VarScan wrote it in FREQ, rounded to 0.01%
+
+    processSomatic applies its thresholds to this rounded value, not to the
+    RD/AD read counts; those are only used when FREQ is missing.
+    """
+    freq = record.sample(column).get("FREQ", "").rstrip("%")
+    try:
+        return float(freq) / 100
+    except ValueError:
+        return record.freq(column)
+
+
+def output_path(input_vcf: str, category: str) -> str:
+    """Name of a processSomatic output, e.g. base.snp.Somatic.hc.vcf"""
+    return "{}.{}.vcf".format(_root(input_vcf), category)
+
+
+def log_path(input_vcf: str) -> str:
+    """Output log of a processSomatic run, e.g. base.snp.process.log"""
+    return "{}.process.log".format(_root(input_vcf))
+
+
+def output_paths(input_vcf: str, categories: Sequence[str] = CATEGORIES) -> List[str]:
+    """processSomatic outputs for a raw VCF, all categories by default"""
+    return [output_path(input_vcf, category) for category in categories]
+
 
 class SomaticProcess:
     COMMAND = dedent(
         """
-        java -d64 -XX:+UseSerialGC -Xmx3G
+        java -d64 {jvm_flags} -Xmx{heap}
         -jar {varscan_jar}
         processSomatic {input_vcf}
         --min-tumor-freq {min_tumor_freq}
-        --maf-normal-freq {max_normal_freq}
+        --max-normal-freq {max_normal_freq}
         --p-value {vps_p_value}
         """
     ).strip()
+    HEAP = "3G"
 
     def __init__(
         self,
@@ -27,9 +72,13 @@ class SomaticProcess:
         min_tumor_freq: float,
         max_normal_freq: float,
         vps_p_value: float,
+        heap: str = HEAP,
+        jvm_flags: str = DEFAULT_JVM_FLAGS,
         _utils=utils,
     ):
         self.timeout = timeout
+        self.heap = heap
+        self.jvm_flags = jvm_flags
         self.varscan_jar = varscan_jar
         self.min_tumor_freq = min_tumor_freq
         self.max_normal_freq = max_normal_freq
@@ -42,27 +91,140 @@ class SomaticProcess:
     def __exit__(self, exc_type, exc_value, traceback):
         pass
 
-    def run(self, input_vcf: str) -> None:
-        """run varscan2 workflow"""
-        command = self.COMMAND.format(
+    def command(self, input_vcf: str) -> str:
+        """VarScan processSomatic command line for a raw VCF"""
+        return self.COMMAND.format(
+            jvm_flags=self.jvm_flags,
+            heap=self.heap,
             varscan_jar=self.varscan_jar,
             input_vcf=input_vcf,
             min_tumor_freq=self.min_tumor_freq,
             max_normal_freq=self.max_normal_freq,
             vps_p_value=self.vps_p_value,
         )
+
+    @staticmethod
+    def check(cmd_return) -> None:
+        """Raise CommandFailed for an unsuccessful processSomatic command"""
+        failure = classify_failure(cmd_return)
+        if failure:
+            msg = "varscan processSomatic command failed ({})".format(failure)
+            logger.error("%s, stderr ends:\n%s", msg, cmd_return.stderr)
+            raise CommandFailed(msg, failure, cmd_return.retcode)
+
+    def run(self, input_vcf: str) -> None:
+        """run varscan2 workflow"""
+        command = self.command(input_vcf)
+        logger.info(command)
         cmd_return = self._utils.call_subprocess(
-            command, self.timeout, stdout=PIPE, stderr=PIPE
+            command,
+            self.timeout,
+            log_path=log_path(input_vcf),
+            stdout=PIPE,
+            stderr=PIPE,
         )
-        logger.info(command)
-        logger.debug(cmd_return.stdout)
-        logger.debug(cmd_return.stderr)
-        if not cmd_return.retcode == 0:
-            logger.debug(cmd_return.stdout)
-            logger.debug(cmd_return.stderr)
-            msg = "varscan processSomatic command failed"
-            raise ValueError(msg)
+        self.check(cmd_return)
         return
 
 
+class NativeSomaticProcess:
+    """In-process processSomatic for VarScan somatic VCFs.
+
+    Records are split by somatic status (SS) into Somatic, Germline and LOH
+    outputs, each with a high-confidence (.hc) subset:
+
+    * Somatic: tumor freq >= min_tumor_freq, normal freq <= max_normal_freq
+      and SPV <= vps_p_value
+    * Germline: tumor and normal freq >= min_tumor_freq and GPV <= vps_p_value
+    * LOH: normal freq >= min_tumor_freq, tumor freq further from 0.5 than
+      normal freq and SPV <= vps_p_value
+
+    Allele frequencies are the rounded FREQ values, as VarScan compares them.
+    """
+
+    def __init__(
+        self,
+        timeout: int,
+        varscan_jar: str,
+        min_tumor_freq: float,
+        max_normal_freq: float,
+        vps_p_value: float,
+        _utils=utils,
+    ):
+        self.timeout = timeout
+        self.varscan_jar = varscan_jar
+        self.min_tumor_freq = min_tumor_freq
+        self.max_normal_freq = max_normal_freq
+        self.vps_p_value = vps_p_value
+        self._utils = _utils
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def classify(self, line: str) -> Optional[Tuple[str, bool]]:
+        """Return (status, is_high_confidence) for a record, None if unused"""
+        record = VcfRecord(line)
+        status = SOMATIC_STATUS.get(record.ss)
+        if status is None:
+            return None
+        normal_freq = reported_freq(record, NORMAL)
+        tumor_freq = reported_freq(record, TUMOR)
+        if status == "Somatic":
+            hc = (
+                tumor_freq >= self.min_tumor_freq
+                and normal_freq <= self.max_normal_freq
+                and record.spv <= self.vps_p_value
+            )
+        elif status == "Germline":
+            hc = (
+                tumor_freq >= self.min_tumor_freq
+                and normal_freq >= self.min_tumor_freq
+                and record.gpv <= self.vps_p_value
+            )
+        else:
+            hc = (
+                normal_freq >= self.min_tumor_freq
+                and abs(tumor_freq - 0.5) > abs(normal_freq - 0.5)
+                and record.spv <= self.vps_p_value
+            )
+        return status, hc
+
+    def run(self, input_vcf: str, categories: Sequence[str] = CATEGORIES) -> None:
+        """run processSomatic in-process"""
+        with open(input_vcf) as fh:
+            self.split(fh, input_vcf, categories)
+
+    def split(self, fh: IO, input_vcf: str, categories: Sequence[str] = CATEGORIES):
+        """Split the records read from fh, writing only the given categories"""
+        counts = {category: 0 for category in categories}
+        with contextlib.ExitStack() as stack:
+            outputs: Dict[str, IO] = {
+                category: stack.enter_context(
+                    open(output_path(input_vcf, category), "w")
+                )
+                for category in counts
+            }
+            for line in fh:
+                if line.startswith("#"):
+                    for out in outputs.values():
+                        out.write(line)
+                    continue
+                classified = self.classify(line)
+                if classified is None:
+                    continue
+                status, hc = classified
+                for category in (status, status + ".hc") if hc else (status,):
+                    if category in outputs:
+                        outputs[category].write(line)
+                        counts[category] += 1
+        logger.info("processSomatic %s: %s", input_vcf, counts)
+        return
+
+
+PROCESS_BACKENDS = {"jvm": SomaticProcess, "native": NativeSomaticProcess}
+
+
 # __END__
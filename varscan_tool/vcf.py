@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Compact, lazily parsed records of the VCFs VarScan somatic writes.
+
+A record keeps its line and parses only CHROM and POS up front, which is
+all merging and sorting need. The other columns are split on first use,
+INFO and the FORMAT sample values only when asked for. `Columns` packs the
+numeric fields of a batch of records into typed arrays for statistics.
+"""
+
+import array
+import functools
+import itertools
+import sys
+from typing import IO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Columns of the normal and tumor samples in a VarScan somatic VCF.
+NORMAL = 9
+TUMOR = 10
+# SS values in Columns for records without a somatic status.
+NO_STATUS = -1
+# Records per Columns batch.
+BATCH_RECORDS = 1 << 16
+
+
+class VcfRecord:
+    """A VCF record; columns are split on first use, INFO and FORMAT on demand"""
+
+    __slots__ = ("line", "chrom", "pos", "_fields", "_info")
+
+    def __init__(self, line: str):
+        self.line = line
+        chrom, pos = line.split("\t", 2)[:2]
+        self.chrom = sys.intern(chrom)
+        self.pos = int(pos)
+        self._fields: Optional[List[str]] = None
+        self._info: Optional[Dict[str, str]] = None
+
+    @property
+    def fields(self) -> List[str]:
+        if self._fields is None:
+            self._fields = self.line.rstrip("\n").split("\t")
+        return self._fields
+
+    @property
+    def ref(self) -> str:
+        return self.fields[3]
+
+    @property
+    def alt(self) -> str:
+        return self.fields[4]
+
+    @property
+    def is_indel(self) -> bool:
+        return len(self.ref) != len(self.alt)
+
+    @property
+    def info(self) -> Dict[str, str]:
+        """INFO keys and values; flags have an empty value"""
+        if self._info is None:
+            self._info = dict(
+                item.partition("=")[::2] for item in self.fields[7].split(";")
+            )
+        return self._info
+
+    @property
+    def ss(self) -> str:
+        """Somatic status: 0 reference, 1 germline, 2 somatic, 3 LOH, 5 unknown"""
+        return self.info.get("SS", "")
+
+    @property
+    def gpv(self) -> float:
+        """Germline p-value, 1 when missing"""
+        return float(self.info.get("GPV", 1))
+
+    @property
+    def spv(self) -> float:
+        """Somatic p-value, 1 when missing"""
+        return float(self.info.get("SPV", 1))
+
+    def sample(self, column: int) -> Dict[str, str]:
+        """FORMAT keys and values of the sample in `column`, NORMAL or TUMOR"""
+        fields = self.fields
+        return dict(zip(fields[8].split(":"), fields[column].split(":")))
+
+    def depths(self, column: int) -> Optional[Tuple[int, int]]:
+        """Reference and variant read counts (RD, AD) of a sample, if given"""
+        fields = self.fields
+        index = format_index(fields[8])
+        values = fields[column].split(":")
+        try:
+            return int(values[index["RD"]]), int(values[index["AD"]])
+        except (KeyError, IndexError, ValueError):
+            return None
+
+    def freq(self, column: int) -> float:
+        """Variant allele frequency of a sample from RD/AD, falling back to FREQ"""
+        depths = self.depths(column)
+        if depths is None:
+            freq = self.sample(column).get("FREQ", "").rstrip("%")
+            return float(freq) / 100 if freq else 0.0
+        depth = depths[0] + depths[1]
+        return depths[1] / depth if depth else 0.0
+
+
+@functools.lru_cache(maxsize=64)
+def format_index(format_field: str) -> Dict[str, int]:
+    """Position of each key in a FORMAT column; VarScan writes only a few"""
+    return {key: idx for idx, key in enumerate(format_field.split(":"))}
+
+
+class VcfReader:
+    """Header lines and VcfRecords of a VCF stream, read a record at a time"""
+
+    def __init__(self, fh: IO[str]):
+        self._fh = fh
+        self._first: Optional[str] = None
+        self.header: List[str] = []
+        for line in fh:
+            if not line.startswith("#"):
+                self._first = line
+                break
+            self.header.append(line)
+
+    def __iter__(self) -> Iterator[VcfRecord]:
+        first, self._first = self._first, None
+        lines = self._fh if first is None else itertools.chain((first,), self._fh)
+        return map(VcfRecord, lines)
+
+
+class Columns:
+    """Numeric fields of a batch of records in typed arrays, an item per record
+
+    `chrom` holds indexes into `chroms`; depths missing from a record are -1.
+    """
+
+    __slots__ = (
+        "chroms",
+        "chrom",
+        "pos",
+        "ss",
+        "gpv",
+        "spv",
+        "normal_rd",
+        "normal_ad",
+        "tumor_rd",
+        "tumor_ad",
+        "_index",
+    )
+
+    def __init__(self):
+        self.chroms: List[str] = []
+        self.chrom = array.array("I")
+        self.pos = array.array("q")
+        self.ss = array.array("b")
+        self.gpv = array.array("d")
+        self.spv = array.array("d")
+        self.normal_rd = array.array("l")
+        self.normal_ad = array.array("l")
+        self.tumor_rd = array.array("l")
+        self.tumor_ad = array.array("l")
+        self._index: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.pos)
+
+    def append(self, record: VcfRecord) -> None:
+        idx = self._index.get(record.chrom)
+        if idx is None:
+            idx = self._index[record.chrom] = len(self.chroms)
+            self.chroms.append(record.chrom)
+        self.chrom.append(idx)
+        self.pos.append(record.pos)
+        ss = record.ss
+        self.ss.append(int(ss) if ss.isdigit() else NO_STATUS)
+        self.gpv.append(record.gpv)
+        self.spv.append(record.spv)
+        for column, rd, ad in (
+            (NORMAL, self.normal_rd, self.normal_ad),
+            (TUMOR, self.tumor_rd, self.tumor_ad),
+        ):
+            depths = record.depths(column)
+            rd.append(depths[0] if depths else -1)
+            ad.append(depths[1] if depths else -1)
+
+
+def read_columns(
+    records: Iterable[VcfRecord], batch_records: int = BATCH_RECORDS
+) -> Iterator[Columns]:
+    """Columns of consecutive batches of up to `batch_records` records"""
+    batch = Columns()
+    for record in records:
+        batch.append(record)
+        if len(batch) == batch_records:
+            yield batch
+            batch = Columns()
+    if len(batch):
+        yield batch
+
+
+# __END__